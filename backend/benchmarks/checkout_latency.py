@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Checkout Latency Benchmark
+Drives POST /api/subscription/create-checkout-session against an in-process
+stripe_stub that adds latency to every Stripe call, once for users without a
+stored Stripe customer (customer list/create inline, the old path) and once
+after the background provisioner has created their customers at sync time.
+
+Usage:
+    python3 benchmarks/checkout_latency.py [--users 100] [--latency-ms 150] [--jitter-ms 50]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ['WAITLIST_DB_PATH'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ.setdefault('SLOW_QUERY_MS', '-1')
+
+from stripe_stub import StubState, FaultConfig, make_server  # noqa: E402
+
+faults = FaultConfig()
+server = make_server(port=0, state=StubState(), faults=faults)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+os.environ['STRIPE_SECRET_KEY'] = 'sk_test_stub'
+os.environ['STRIPE_API_BASE'] = f'http://127.0.0.1:{server.server_address[1]}'
+
+import waitlist_api  # noqa: E402
+from waitlist_api import LatencyStats  # noqa: E402
+
+
+def checkout_run(client, emails):
+    latency = LatencyStats()
+    failed = 0
+    for email in emails:
+        started = time.perf_counter()
+        response = client.post('/api/subscription/create-checkout-session', json={'email': email, 'plan': 'pro'})
+        latency.record('checkout', (time.perf_counter() - started) * 1000)
+        failed += response.status_code != 200
+    return latency.summary()['checkout'], failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Checkout latency with and without pre-provisioned Stripe customers')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--latency-ms', type=float, default=150)
+    parser.add_argument('--jitter-ms', type=float, default=50)
+    args = parser.parse_args()
+
+    waitlist_api.ensure_db()
+    client = waitlist_api.app.test_client()
+    faults.latency_ms, faults.jitter_ms = args.latency_ms, args.jitter_ms
+    print(f"Stripe stub latency {args.latency_ms:g}ms +/- {args.jitter_ms:g}ms, {args.users} checkouts per run")
+
+    # Before: users synced with provisioning off, so checkout lists/creates the customer inline
+    cold = [f'cold{i}@example.com' for i in range(args.users)]
+    for i, email in enumerate(cold):
+        waitlist_api.sync_cognito_user(f'cognito-cold-{i}', email)
+    before, failed_before = checkout_run(client, cold)
+
+    # After: the provisioner creates customers in the background as users sync
+    waitlist_api.start_customer_provisioner(backfill=0)
+    warm = [f'warm{i}@example.com' for i in range(args.users)]
+    started = time.perf_counter()
+    for i, email in enumerate(warm):
+        waitlist_api.sync_cognito_user(f'cognito-warm-{i}', email)
+    synced = time.perf_counter() - started
+    while not all(waitlist_api.lookup_stripe_customer_id(email) for email in warm):
+        time.sleep(0.05)
+    provisioned = time.perf_counter() - started
+    after, failed_after = checkout_run(client, warm)
+
+    print(f"  sync: {synced * 1000 / args.users:.2f}ms/user (customers provisioned in background, all done after {provisioned:.1f}s)")
+    for label, summary, failed in (('inline customer (before)', before, failed_before),
+                                   ('pre-provisioned (after)', after, failed_after)):
+        print(f"  {label:<26} p50={summary['p50_ms']:7.1f}ms  p95={summary['p95_ms']:7.1f}ms  "
+              f"max={summary['max_ms']:7.1f}ms  failed={failed}")
+    print(f"  p95 speedup {before['p95_ms'] / after['p95_ms']:.2f}x")
+    print(f"  gateway calls: {waitlist_api.stripe_gateway.stats()['operations']}")
+    print(f"  provisioning: {waitlist_api.provision_stats}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
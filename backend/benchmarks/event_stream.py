@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Event Stream Benchmark
+Connects N idle SSE clients to the event stream server, then publishes events
+(an event_log insert plus a dispatcher wake-up; fan-out happens after commit on
+the dispatcher thread) and measures how long until every client has received
+each one, plus the thread count and a Last-Event-ID resume.
+
+Usage:
+    python3 benchmarks/event_stream.py [--clients 500] [--events 50]
+"""
+
+import argparse
+import os
+import selectors
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ['WAITLIST_DB_PATH'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ.setdefault('SLOW_QUERY_MS', '-1')
+os.environ['ADMIN_API_TOKEN'] = 'bench'
+
+import waitlist_api  # noqa: E402
+
+
+def connect(port, last_event_id=None):
+    sock = socket.create_connection(('127.0.0.1', port))
+    resume = f'Last-Event-ID: {last_event_id}\r\n' if last_event_id is not None else ''
+    sock.sendall(f'GET /api/admin/events HTTP/1.1\r\nHost: bench\r\nX-Admin-Token: bench\r\n{resume}\r\n'.encode())
+    sock.setblocking(False)
+    return sock
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SSE fan-out latency for idle admin event subscribers')
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--events', type=int, default=50)
+    args = parser.parse_args()
+
+    waitlist_api.ensure_db()
+    waitlist_api.start_event_stream(port=int(os.environ.get('EVENT_STREAM_PORT', '5099')))
+    port = waitlist_api.event_stream_server.port
+    threads_before = threading.active_count()
+
+    reader = selectors.DefaultSelector()
+    for _ in range(args.clients):
+        reader.register(connect(port), selectors.EVENT_READ, bytearray())
+    deadline = time.perf_counter() + 5
+    while waitlist_api.event_bus.stats()['subscribers'] < args.clients and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    print(f"{waitlist_api.event_bus.stats()['subscribers']} idle subscribers, "
+          f"{threading.active_count()} threads (was {threads_before})")
+
+    publish_ms, delivered_ms = [], []
+    for n in range(args.events):
+        started = time.perf_counter()
+        event_id = waitlist_api.event_bus.publish('bench.tick', {'n': n})
+        publish_ms.append((time.perf_counter() - started) * 1000)
+        marker = f'id: {event_id}\n'.encode()
+        pending = len(reader.get_map())
+        while pending:
+            for key, _ in reader.select(timeout=5):
+                key.data.extend(key.fileobj.recv(65536))
+                if marker in key.data:
+                    key.data.clear()
+                    pending -= 1
+        delivered_ms.append((time.perf_counter() - started) * 1000)
+
+    print(f"  publish (event_log insert + wake)     p50={percentile(publish_ms, 0.5):6.2f}ms "
+          f"p95={percentile(publish_ms, 0.95):6.2f}ms")
+    print(f"  delivered to all {args.clients} clients     p50={percentile(delivered_ms, 0.5):6.2f}ms "
+          f"p95={percentile(delivered_ms, 0.95):6.2f}ms")
+
+    # A client reconnecting halfway through gets the rest replayed from event_log
+    resumed = connect(port, last_event_id=args.events // 2)
+    resumed.setblocking(True)
+    resumed.settimeout(2)
+    time.sleep(0.2)
+    body = resumed.recv(1 << 20).decode()
+    print(f"  resume from Last-Event-ID {args.events // 2}: {body.count('event: bench.tick')} events replayed")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+JSON Serialization Benchmark
+Times the GET /api/waitlist response path (query + encode) for the old
+dict-per-row + stdlib jsonify approach against FastJSONProvider, with and
+without orjson, and with rows encoded by SQLite (query_json_rows).
+
+Usage:
+    python3 benchmarks/json_serialization.py [--rows 50000] [--repeat 5]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import Flask  # noqa: E402
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+import json_provider  # noqa: E402
+from json_provider import FastJSONProvider, query_json_rows  # noqa: E402
+
+SELECT = 'SELECT id, name, email, product, created_at FROM waitlist ORDER BY created_at DESC'
+COLUMNS = ('id', 'name', 'email', 'product', 'created_at')
+
+
+def seed(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE waitlist (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, name TEXT NOT NULL,
+            email TEXT NOT NULL, product TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.executemany('INSERT INTO waitlist (name, email, product) VALUES (?, ?, ?)',
+                     ((f'Person {i}', f'person{i}@example.com', 'all') for i in range(rows)))
+    conn.commit()
+    conn.close()
+
+
+def dict_rows(conn):
+    """The original route body: one dict per sqlite3.Row"""
+    entries = []
+    for row in conn.execute(SELECT).fetchall():
+        entries.append({
+            'id': row['id'],
+            'name': row['name'],
+            'email': row['email'],
+            'product': row['product'],
+            'created_at': row['created_at']
+        })
+    return {'success': True, 'count': len(entries), 'entries': entries}
+
+
+def sqlite_rows(conn):
+    count, entries = query_json_rows(conn.cursor(), SELECT, (), COLUMNS)
+    return {'success': True, 'count': count, 'entries': entries}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare JSON response encoding strategies')
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    seed(path, args.rows)
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+
+    has_orjson = json_provider.orjson is not None
+    scenarios = [
+        ('before: dicts + stdlib jsonify', DefaultJSONProvider, dict_rows, False),
+        ('dicts + FastJSONProvider (stdlib)', FastJSONProvider, dict_rows, False),
+        ('SQLite rows + FastJSONProvider (stdlib)', FastJSONProvider, sqlite_rows, False),
+    ]
+    if has_orjson:
+        scenarios += [
+            ('dicts + FastJSONProvider (orjson)', FastJSONProvider, dict_rows, True),
+            ('SQLite rows + FastJSONProvider (orjson)', FastJSONProvider, sqlite_rows, True),
+        ]
+
+    real_orjson = json_provider.orjson
+    baseline = None
+    print(f"{args.rows} rows, best of {args.repeat}")
+    for label, provider, build, use_orjson in scenarios:
+        json_provider.orjson = real_orjson if use_orjson else None
+        app = Flask(__name__)
+        app.json = provider(app)
+        with app.app_context():
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                response = app.json.response(build(conn))
+                size = len(response.get_data())
+                timings.append(time.perf_counter() - started)
+        best = min(timings) * 1000
+        baseline = baseline or best
+        print(f"  {label:<42} {best:8.1f}ms  {baseline / best:5.2f}x  {size / 1024:,.0f} KiB")
+    json_provider.orjson = real_orjson
+    if not has_orjson:
+        print("  (orjson not installed: orjson scenarios skipped)")
+
+
+if __name__ == '__main__':
+    main()
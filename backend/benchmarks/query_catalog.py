@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Query Catalog Benchmark
+Replays a mix of lookup and profile requests on one long-lived (pooled) connection:
+the old inline SQL - profile batches built as IN (?, ?, ...) lists of varying length
+and the same lookups written several ways - against the canonical statements in
+queries.py with STATEMENT_CACHE_SIZE. The no-cache run shows what preparing every
+statement costs.
+
+Usage:
+    python3 benchmarks/query_catalog.py [--users 5000] [--requests 5000]
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ['WAITLIST_DB_PATH'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ.setdefault('SLOW_QUERY_MS', '-1')
+
+import queries  # noqa: E402
+import waitlist_api  # noqa: E402
+
+# The statements as they were written inline before the catalog
+LEGACY_PROFILES = '''
+    SELECT u.id, u.cognito_user_id, u.email, u.name, u.role, u.is_dev_account,
+           u.subscription_tier, u.subscription_override, u.created_at, u.last_login,
+           (SELECT json_group_array(json_object('permission', p.permission, 'resource', p.resource))
+            FROM user_permissions p WHERE p.user_id = u.id) AS permissions,
+           s.plan_name, s.status, s.current_period_start, s.current_period_end
+    FROM users u
+    LEFT JOIN subscriptions s ON s.id = u.current_subscription_id
+    WHERE u.email IN ({placeholders})
+    ORDER BY u.id
+'''
+
+# Single-parameter lookups from the catalog stand in for the rest of the routes. Before
+# the catalog each was written out in several places with different whitespace.
+LOOKUPS = [
+    sql for name, sql in vars(queries).items()
+    if name.isupper() and not name.startswith('_') and isinstance(sql, str)
+    and sql.lstrip().startswith('SELECT') and sql.count('?') == 1 and 'archive.' not in sql
+]
+LOOKUPS += list(queries.CURRENT_SUBSCRIPTION_BY.values())
+LEGACY_LOOKUPS = [[sql, sql.strip(), '\n        ' + sql.replace('\n', '\n    ')] for sql in LOOKUPS]
+
+
+def seed(users):
+    waitlist_api.ensure_db()
+    conn = sqlite3.connect(waitlist_api.DB_PATH)
+    conn.executemany(
+        'INSERT INTO users (cognito_user_id, email, name) VALUES (?, ?, ?)',
+        ((f'cognito-{i}', f'user{i}@example.com', f'User {i}') for i in range(users))
+    )
+    conn.executemany(
+        "INSERT INTO subscriptions (user_id, user_email, plan_name, status) VALUES (?, ?, 'pro', 'active')",
+        ((i + 1, f'user{i}@example.com') for i in range(0, users, 2))
+    )
+    conn.executemany(
+        "INSERT INTO user_permissions (user_id, permission, resource) VALUES (?, 'read', 'all')",
+        ((i + 1,) for i in range(0, users, 3))
+    )
+    conn.commit()
+    conn.close()
+
+
+def legacy_request(conn, rng, emails, profiles):
+    if profiles:
+        batch = rng.sample(emails, rng.randint(1, 100))
+        conn.execute(LEGACY_PROFILES.format(placeholders=', '.join('?' * len(batch))), batch).fetchall()
+    for variants in rng.sample(LEGACY_LOOKUPS, 8):
+        conn.execute(rng.choice(variants), (rng.choice(emails),)).fetchall()
+
+
+def catalog_request(conn, rng, emails, profiles):
+    if profiles:
+        batch = rng.sample(emails, rng.randint(1, 100))
+        conn.execute(queries.USER_PROFILES_BY['email'], (json.dumps(batch),)).fetchall()
+    for variants in rng.sample(LEGACY_LOOKUPS, 8):
+        conn.execute(variants[0], (rng.choice(emails),)).fetchall()
+
+
+def run(build, cached_statements, requests, emails, profiles):
+    conn = sqlite3.connect(waitlist_api.DB_PATH, cached_statements=cached_statements)
+    rng = random.Random(0)
+    for _ in range(200):
+        build(conn, rng, emails, profiles)  # warm the page cache and statement cache
+    rng = random.Random(1)
+    started = time.perf_counter()
+    for _ in range(requests):
+        build(conn, rng, emails, profiles)
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return elapsed / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure statement preparation overhead per request')
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+
+    seed(args.users)
+    emails = [f'user{i}@example.com' for i in range(args.users)]
+
+    scenarios = [
+        ('before: inline SQL, no statement cache', legacy_request, 0),
+        ('before: inline SQL, cache 128 (default)', legacy_request, 128),
+        ('catalog, no statement cache', catalog_request, 0),
+        (f'catalog, cache {queries.STATEMENT_CACHE_SIZE}', catalog_request, queries.STATEMENT_CACHE_SIZE),
+    ]
+    for profiles in (False, True):
+        mix = '8 lookups + a 1-100 user profile batch' if profiles else '8 lookups'
+        print(f"{args.requests} requests of {mix}, one pooled connection ({len(LOOKUPS)} catalog lookups)")
+        baseline = None
+        for label, build, cached_statements in scenarios:
+            micros = run(build, cached_statements, args.requests, emails, profiles)
+            baseline = baseline or micros
+            print(f"  {label:<42} {micros:8.1f}us/request  {baseline / micros:5.2f}x")
+
+
+if __name__ == '__main__':
+    main()
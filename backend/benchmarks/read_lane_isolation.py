@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Read Lane Isolation Benchmark
+Measures POST /api/waitlist latency with and without large concurrent admin reads
+(GET /api/waitlist), once with the read lane enabled and once with it disabled.
+
+Usage:
+    python3 benchmarks/read_lane_isolation.py [--rows 100000] [--writes 300]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('WAITLIST_DB_PATH', os.path.join(tempfile.mkdtemp(), 'bench.db'))
+
+import waitlist_api  # noqa: E402
+
+
+def seed(rows):
+    conn = waitlist_api.get_db_connection(readonly=False)
+    conn.executemany(
+        'INSERT INTO waitlist (name, email, product) VALUES (?, ?, ?)',
+        ((f'Seed {i}', f'seed{i}@example.com', 'all') for i in range(rows))
+    )
+    conn.commit()
+    conn.close()
+
+
+def run(label, lane_enabled, writes, with_reads):
+    waitlist_api.READ_LANE_ENABLED = lane_enabled
+    waitlist_api.writer_latency = waitlist_api.LatencyStats()
+    client = waitlist_api.app.test_client()
+    stop = threading.Event()
+
+    def reader():
+        reader_client = waitlist_api.app.test_client()
+        while not stop.is_set():
+            reader_client.get('/api/waitlist')
+
+    readers = [threading.Thread(target=reader) for _ in range(2 if with_reads else 0)]
+    for thread in readers:
+        thread.start()
+    for i in range(writes):
+        client.post('/api/waitlist', json={'name': 'Bench', 'email': f'{label}{i}@bench.test'})
+    stop.set()
+    for thread in readers:
+        thread.join()
+
+    for key, stats in waitlist_api.writer_latency.summary().items():
+        print(f"  {label:<28} {key:<36} p50={stats['p50_ms']:>8.2f}ms "
+              f"p95={stats['p95_ms']:>8.2f}ms p99={stats['p99_ms']:>8.2f}ms n={stats['count']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Writer latency under concurrent admin reads')
+    parser.add_argument('--rows', type=int, default=100000, help='waitlist rows to seed')
+    parser.add_argument('--writes', type=int, default=300, help='waitlist submissions per scenario')
+    args = parser.parse_args()
+
+    waitlist_api.init_db()
+    seed(args.rows)
+    print(f"Database: {waitlist_api.DB_PATH} ({args.rows} rows)")
+
+    run('lane on, idle', True, args.writes, with_reads=False)
+    run('lane on, large reads', True, args.writes, with_reads=True)
+    run('lane off, large reads', False, args.writes, with_reads=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Stripe Gateway Fault Drill
+Runs the gateway against an in-process stripe_stub while injecting latency,
+errors and hangs, and prints per-scenario outcomes, breaker state and latency.
+
+Usage:
+    python3 benchmarks/stripe_gateway_faults.py [--calls 60]
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import stripe  # noqa: E402
+from stripe_gateway import StripeGateway, CircuitBreaker, StripeUnavailableError  # noqa: E402
+from stripe_stub import StubState, FaultConfig, make_server  # noqa: E402
+from waitlist_api import LatencyStats  # noqa: E402
+
+SCENARIOS = [
+    ('healthy', {}),
+    ('slow region (latency > timeout)', {'latency_ms': 1500}),
+    ('error spike (60% 5xx)', {'error_rate': 0.6}),
+    ('recovered', {})
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Exercise the Stripe gateway against injected faults')
+    parser.add_argument('--calls', type=int, default=60, help='calls per scenario')
+    parser.add_argument('--cooldown', type=float, default=1.0, help='breaker cooldown in seconds')
+    args = parser.parse_args()
+
+    faults = FaultConfig()
+    server = make_server(port=0, state=StubState(subscriptions=10), faults=faults)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    stripe.api_key = 'sk_test_stub'
+    stripe.api_base = f'http://127.0.0.1:{server.server_address[1]}'
+    stripe.default_http_client = stripe.http_client.RequestsClient(timeout=5)
+
+    for name, config in SCENARIOS:
+        for key in ('latency_ms', 'jitter_ms', 'error_rate', 'hang_rate'):
+            setattr(faults, key, config.get(key, 0))
+        gateway = StripeGateway(
+            lambda: stripe,
+            timeouts={'customer.retrieve': 0.5},
+            max_retries=2,
+            backoff_base=0.02,
+            hedge_after=0.2,
+            breaker=CircuitBreaker(error_rate=0.5, window=20, min_calls=10, cooldown=args.cooldown),
+            latency=LatencyStats()
+        )
+
+        started = time.perf_counter()
+        ok = failed = 0
+        for _ in range(args.calls):
+            try:
+                gateway.customer_retrieve('cus_stub_00000001')
+                ok += 1
+            except StripeUnavailableError:
+                failed += 1
+        elapsed = time.perf_counter() - started
+
+        stats = gateway.stats()
+        latency = stats['latency'].get('customer.retrieve', {})
+        print(f"{name}")
+        print(f"  {ok} ok / {failed} failed in {elapsed:.2f}s; breaker={stats['breaker']['state']}")
+        print(f"  outcomes: {stats['operations'].get('customer.retrieve', {})}")
+        if latency:
+            print(f"  latency: p50={latency['p50_ms']}ms p95={latency['p95_ms']}ms max={latency['max_ms']}ms")
+        gateway.executor.shutdown(wait=False)
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Waitlist Position Benchmark
+Seeds a large waitlist and times GET /api/waitlist/position (running hour counters plus
+an index range count inside one hour) against a plain index COUNT(*) of
+everything ahead, for entries near the front, middle and back of the line.
+
+Usage:
+    python3 benchmarks/waitlist_position.py [--entries 1000000] [--lookups 300]
+"""
+
+import argparse
+from datetime import datetime, timedelta
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ['WAITLIST_DB_PATH'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ.setdefault('SLOW_QUERY_MS', '-1')
+
+import waitlist_api  # noqa: E402
+
+PRODUCTS = ['all', 'all', 'n8tive-ai', 'n8tive-cloud']
+
+# Position by counting every entry ahead through the (product, created_at, id) index
+NAIVE_POSITION = '''
+    SELECT COUNT(*) FROM waitlist
+    WHERE product = ? AND (created_at, id) < (?, ?)
+'''
+
+
+def seed(entries):
+    waitlist_api.ensure_db()
+    rng = random.Random(0)
+    started = time.perf_counter()
+    conn = sqlite3.connect(waitlist_api.DB_PATH)
+    when = datetime(2024, 1, 1)
+
+    def rows():
+        nonlocal when
+        for i in range(entries):
+            # ~1 signup every 30s on average, with launch-day style bursts
+            when += timedelta(seconds=rng.choice((0, 0, 1, 5, 30, 120)))
+            yield (f'User {i}', f'user{i}@example.com', rng.choice(PRODUCTS), when.strftime('%Y-%m-%d %H:%M:%S'))
+
+    conn.executemany('INSERT INTO waitlist (name, email, product, created_at) VALUES (?, ?, ?, ?)', rows())
+    conn.commit()
+    conn.close()
+    print(f"Seeded {entries} entries in {time.perf_counter() - started:.1f}s (counters maintained by triggers)")
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Waitlist position lookup latency')
+    parser.add_argument('--entries', type=int, default=1000000)
+    parser.add_argument('--lookups', type=int, default=300)
+    args = parser.parse_args()
+
+    seed(args.entries)
+    client = waitlist_api.app.test_client()
+    conn = sqlite3.connect(waitlist_api.DB_PATH)
+    rng = random.Random(1)
+
+    for label, low, high in (('front 1%', 0, 0.01), ('middle', 0.45, 0.55), ('back 1%', 0.99, 1.0)):
+        picks = [rng.randrange(int(low * args.entries), max(int(high * args.entries), 1)) for _ in range(args.lookups)]
+        endpoint, naive = [], []
+        for i in picks:
+            email = f'user{i}@example.com'
+            started = time.perf_counter()
+            body = client.get(f'/api/waitlist/position?email={email}&product=all').get_json()
+            endpoint.append((time.perf_counter() - started) * 1000)
+
+            started = time.perf_counter()
+            row = conn.execute('SELECT id, product, created_at FROM waitlist WHERE email = ?', (email,)).fetchone()
+            if row[1] != 'all':
+                continue
+            ahead = conn.execute(NAIVE_POSITION, (row[1], row[2], row[0])).fetchone()[0]
+            naive.append((time.perf_counter() - started) * 1000)
+            assert ahead + 1 == body['position'], (email, ahead + 1, body)
+        print(f"  {label:<9} endpoint p50={percentile(endpoint, 0.5):6.2f}ms p95={percentile(endpoint, 0.95):6.2f}ms   "
+              f"index COUNT(*) p50={percentile(naive, 0.5):7.2f}ms p95={percentile(naive, 0.95):7.2f}ms")
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Write Contention Benchmark
+Forks N worker processes that hammer the write endpoints (waitlist signup, user
+sync, dev tier toggle and signed subscription webhooks) against one SQLite file,
+once per write policy, and reports throughput, tail latency and failures:
+
+    legacy     deferred BEGIN, 5s busy timeout, no retry (the old behaviour)
+    immediate  BEGIN IMMEDIATE, 5s busy timeout, no retry
+    retry      BEGIN IMMEDIATE, short busy timeout + jittered exponential retry (default)
+
+Usage:
+    python3 benchmarks/write_contention.py [--processes 8] [--seconds 5]
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ['WAITLIST_DB_PATH'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ.setdefault('SLOW_QUERY_MS', '-1')
+os.environ['STRIPE_WEBHOOK_SECRET'] = 'whsec_bench'
+os.environ['STRIPE_PREPROVISION_CUSTOMERS'] = '0'
+
+from db_writes import RetryPolicy  # noqa: E402
+import waitlist_api  # noqa: E402
+
+POLICIES = {
+    'legacy': RetryPolicy(busy_timeout_ms=5000, max_attempts=1, immediate=False),
+    'immediate': RetryPolicy(busy_timeout_ms=5000, max_attempts=1, immediate=True),
+    'retry': RetryPolicy(
+        busy_timeout_ms=waitlist_api.WRITE_BUSY_TIMEOUT_MS,
+        deadline_ms=waitlist_api.WRITE_DEADLINE_MS,
+        backoff_cap_ms=waitlist_api.WRITE_BACKOFF_CAP_MS
+    )
+}
+
+USERS = 200
+DEV_USERS = 20
+SUBSCRIPTIONS = 200
+
+
+def seed():
+    waitlist_api.ensure_db()
+    for i in range(USERS):
+        waitlist_api.sync_cognito_user(f'cognito-{i}', f'user{i}@example.com', f'User {i}')
+    for i in range(DEV_USERS):
+        waitlist_api.create_dev_account(f'dev{i}@example.com', f'Dev {i}', f'cognito-dev-{i}')
+    # Load Stripe and serve a first request before forking so workers don't time startup costs
+    waitlist_api.get_stripe()
+    waitlist_api.app.test_client().get('/api/health')
+
+
+def webhook_request(rng):
+    """A signed customer.subscription.updated event with the customer expanded (no Stripe calls)"""
+    i = rng.randrange(SUBSCRIPTIONS)
+    now = int(time.time())
+    payload = json.dumps({
+        'id': f'evt_{rng.getrandbits(48)}',
+        'object': 'event',
+        'type': 'customer.subscription.updated',
+        'data': {'object': {
+            'id': f'sub_bench_{i}',
+            'object': 'subscription',
+            'customer': {'id': f'cus_bench_{i}', 'object': 'customer', 'email': f'user{i % USERS}@example.com'},
+            'status': rng.choice(['active', 'past_due']),
+            'cancel_at_period_end': False,
+            'current_period_start': now,
+            'current_period_end': now + 30 * 86400,
+            'items': {'object': 'list', 'data': [{'id': 'si_bench', 'object': 'subscription_item',
+                                                  'price': {'id': waitlist_api.PLANS['pro']['stripe_price_id']}}]}
+        }}
+    })
+    signature = hmac.new(b'whsec_bench', f'{now}.{payload}'.encode(), hashlib.sha256).hexdigest()
+    return payload, {'Stripe-Signature': f't={now},v1={signature}', 'Content-Type': 'application/json'}
+
+
+def worker(policy_name, worker_id, seconds, start, results):
+    waitlist_api.write_transactions.policy = POLICIES[policy_name]
+    client = waitlist_api.app.test_client()
+    rng = random.Random(worker_id)
+    samples = []
+    statuses = {}
+    start.wait()
+    deadline = time.perf_counter() + seconds
+    n = 0
+    while time.perf_counter() < deadline:
+        n += 1
+        kind = rng.choice(('waitlist', 'sync', 'toggle', 'webhook'))
+        started = time.perf_counter()
+        if kind == 'waitlist':
+            response = client.post('/api/waitlist', json={
+                'name': 'Bench', 'email': f'{policy_name}-{worker_id}-{n}@example.com', 'product': 'all'
+            })
+            ok = response.status_code == 201
+        elif kind == 'sync':
+            i = rng.randrange(USERS)
+            response = client.post('/api/users/sync', json={
+                'cognito_user_id': f'cognito-{i}', 'email': f'user{i}@example.com', 'name': f'User {i}'
+            })
+            ok = response.status_code == 200
+        elif kind == 'toggle':
+            response = client.post('/api/admin/toggle-subscription', json={
+                'cognito_user_id': f'cognito-dev-{rng.randrange(DEV_USERS)}',
+                'tier': rng.choice(['pro', 'business', 'enterprise'])
+            })
+            ok = response.status_code == 200
+        else:
+            payload, headers = webhook_request(rng)
+            response = client.post('/api/subscription/webhook', data=payload, headers=headers)
+            ok = response.status_code == 200
+        samples.append((time.perf_counter() - started) * 1000)
+        key = f'{kind}:{response.status_code}' if not ok else 'ok'
+        statuses[key] = statuses.get(key, 0) + 1
+    results.put((samples, statuses, waitlist_api.write_transactions.stats()['routes']))
+
+
+def run_policy(policy_name, processes, seconds):
+    context = multiprocessing.get_context('fork')
+    start = context.Event()
+    results = context.Queue()
+    workers = [context.Process(target=worker, args=(policy_name, i, seconds, start, results))
+               for i in range(processes)]
+    for process in workers:
+        process.start()
+    time.sleep(0.5)
+    start.set()
+    samples, statuses, retries, lock_wait = [], {}, 0, 0.0
+    for _ in workers:
+        worker_samples, worker_statuses, routes = results.get()
+        samples.extend(worker_samples)
+        for key, count in worker_statuses.items():
+            statuses[key] = statuses.get(key, 0) + count
+        retries += sum(route['retries'] for route in routes.values())
+        lock_wait += sum(route['lock_wait_ms'] for route in routes.values())
+    for process in workers:
+        process.join()
+
+    samples.sort()
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    failed = sum(count for key, count in statuses.items() if key != 'ok')
+    print(f"  {policy_name:<10} {statuses.get('ok', 0) / seconds:7.0f} ok/s  "
+          f"p50={pick(0.5):7.1f}ms p95={pick(0.95):7.1f}ms p99={pick(0.99):7.1f}ms max={samples[-1]:7.1f}ms  "
+          f"failed={failed} ({failed * 100 / len(samples):.1f}%)  retries={retries}  "
+          f"avg lock wait={lock_wait / len(samples):.1f}ms")
+    errors = {key: count for key, count in statuses.items() if key != 'ok'}
+    if errors:
+        print(f"             failures: {errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Multi-process write contention under each write policy')
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--policies', default='legacy,immediate,retry')
+    args = parser.parse_args()
+
+    seed()
+    print(f"{args.processes} processes x {args.seconds:g}s of mixed writes (waitlist, sync, toggle, webhook)")
+    for policy_name in args.policies.split(','):
+        run_policy(policy_name, args.processes, args.seconds)
+
+
+if __name__ == '__main__':
+    main()
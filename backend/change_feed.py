@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Change Feed
+Keeps in-process caches coherent across workers that share one SQLite file, with
+no message broker. Writers append (table_name, row_key) rows to change_log in the
+same transaction as the change (waitlist_api installs triggers for this); every
+worker polls PRAGMA data_version - which only moves when another connection
+commits - and on a change reads the new change_log rows and drops just the
+affected cache entries.
+"""
+
+from collections import OrderedDict
+import sqlite3
+import threading
+import time
+
+
+class KeyedCache:
+    """
+    Small LRU cache whose entries carry tags (e.g. a user's email) so the change
+    feed can drop every entry derived from a changed row.
+    """
+
+    def __init__(self, name, maxsize=10000):
+        self.name = name
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.tags = {}
+        # Bumped on every invalidation; a load that raced one is not stored
+        self.epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.lock = threading.Lock()
+
+    def get_or_load(self, key, loader):
+        """
+        Return the cached value for key, or call loader() -> (value, tags) and cache it.
+        Return tags=None for values that can't be tied to a row; they are not cached.
+        """
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+            self.misses += 1
+            epoch = self.epoch
+
+        value, tags = loader()
+        if tags is None:
+            return value
+
+        with self.lock:
+            if epoch == self.epoch:
+                self._store(key, value, tuple(tags))
+        return value
+
+    def _store(self, key, value, tags):
+        if key in self.entries:
+            self._discard(key)
+        self.entries[key] = (value, tags)
+        for tag in tags:
+            self.tags.setdefault(tag, set()).add(key)
+        while len(self.entries) > self.maxsize:
+            self._discard(next(iter(self.entries)))
+
+    def _discard(self, key):
+        _, tags = self.entries.pop(key)
+        for tag in tags:
+            keys = self.tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tags[tag]
+
+    def invalidate(self, tags):
+        """Drop every entry carrying any of tags; returns the number dropped"""
+        dropped = 0
+        with self.lock:
+            self.epoch += 1
+            for tag in tags:
+                for key in list(self.tags.get(tag, ())):
+                    self._discard(key)
+                    dropped += 1
+            self.invalidations += dropped
+        return dropped
+
+    def clear(self):
+        with self.lock:
+            self.epoch += 1
+            self.invalidations += len(self.entries)
+            self.entries.clear()
+            self.tags.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'invalidations': self.invalidations
+            }
+
+
+class ChangeFeed:
+    """Polls one SQLite database for committed changes and invalidates registered caches"""
+
+    def __init__(self, db_path, poll_interval=0.005, retention=10000, prune_interval=60.0):
+        """
+        poll_interval: seconds between PRAGMA data_version checks
+        retention: change_log rows kept when pruning (a worker further behind clears its caches)
+        """
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.prune_interval = prune_interval
+        self.caches = {}
+        self.conn = None
+        self.data_version = None
+        self.last_version = 0
+        self.running = False
+        self.polls = 0
+        self.batches = 0
+        self.changes = 0
+        self.full_clears = 0
+        self.last_lag_ms = None
+        self.lock = threading.Lock()
+
+    def register(self, table_name, cache):
+        """Invalidate cache (by row_key tag) whenever table_name changes"""
+        self.caches.setdefault(table_name, []).append(cache)
+        return cache
+
+    def _all_caches(self):
+        return {id(cache): cache for caches in self.caches.values() for cache in caches}.values()
+
+    def _connect(self):
+        # Autocommit, so no read transaction pins an old data_version between polls
+        conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        self.data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+        row = conn.execute('SELECT MAX(version) FROM change_log').fetchone()
+        self.last_version = row[0] or 0
+        return conn
+
+    def poll(self):
+        """Apply any changes committed since the last poll; returns the number of change rows read"""
+        with self.lock:
+            if self.conn is None:
+                self.conn = self._connect()
+                return 0
+            self.polls += 1
+            data_version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+            if data_version == self.data_version:
+                return 0
+            self.data_version = data_version
+
+            rows = self.conn.execute('''
+                SELECT version, table_name, row_key, (julianday('now') - changed_at) * 86400000
+                FROM change_log
+                WHERE version > ?
+                ORDER BY version
+            ''', (self.last_version,)).fetchall()
+            if not rows:
+                return 0
+
+            if rows[0][0] > self.last_version + 1 and self.last_version:
+                # Fell behind the pruning horizon: we can't know what changed, so drop everything
+                oldest = self.conn.execute('SELECT MIN(version) FROM change_log').fetchone()[0]
+                if oldest > self.last_version + 1:
+                    for cache in self._all_caches():
+                        cache.clear()
+                    self.full_clears += 1
+
+            changed = {}
+            for version, table_name, row_key, _ in rows:
+                changed.setdefault(table_name, set()).add(row_key)
+            for table_name, keys in changed.items():
+                for cache in self.caches.get(table_name, ()):
+                    cache.invalidate(keys)
+
+            self.last_version = rows[-1][0]
+            self.last_lag_ms = round(rows[-1][3], 2)
+            self.batches += 1
+            self.changes += len(rows)
+            return len(rows)
+
+    def prune(self):
+        """Keep only the newest `retention` change_log rows"""
+        with self.lock:
+            if self.conn is None:
+                return 0
+            cursor = self.conn.execute('''
+                DELETE FROM change_log
+                WHERE version <= (SELECT MAX(version) FROM change_log) - ?
+            ''', (self.retention,))
+            return cursor.rowcount
+
+    def start(self):
+        """Poll on a daemon thread until the process exits"""
+        self.poll()
+        self.running = True
+
+        def run():
+            last_prune = time.monotonic()
+            while True:
+                try:
+                    self.poll()
+                    if time.monotonic() - last_prune >= self.prune_interval:
+                        last_prune = time.monotonic()
+                        self.prune()
+                except sqlite3.Error as e:
+                    # e.g. a writer holds the lock while we prune; try again next round
+                    print(f"Change feed poll failed: {str(e)}")
+                time.sleep(self.poll_interval)
+
+        thread = threading.Thread(target=run, name='change-feed', daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self):
+        with self.lock:
+            feed = {
+                'running': self.running,
+                'poll_interval_ms': self.poll_interval * 1000,
+                'last_version': self.last_version,
+                'polls': self.polls,
+                'change_batches': self.batches,
+                'changes': self.changes,
+                'full_clears': self.full_clears,
+                'last_lag_ms': self.last_lag_ms
+            }
+        feed['caches'] = {cache.name: cache.stats() for cache in self._all_caches()}
+        return feed
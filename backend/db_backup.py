@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Online Database Backups
+Copies waitlist.db with the SQLite backup API in small page steps (sleeping between
+steps so live writers are never stalled), verifies the copy with PRAGMA integrity_check,
+optionally gzips it and prunes old snapshots.
+
+Usage:
+    python3 db_backup.py [--dest backups/] [--keep 8] [--no-compress] [--pages 256] [--sleep-ms 5]
+"""
+
+from datetime import datetime
+from pathlib import Path
+import argparse
+import gzip
+import os
+import shutil
+import sqlite3
+import time
+
+SNAPSHOT_PREFIX = 'waitlist-'
+
+
+class BackupVerificationError(Exception):
+    """The copied database failed PRAGMA integrity_check"""
+
+
+def backup_database(db_path, dest_dir, pages=256, sleep_ms=5, compress=True, verify=True):
+    """
+    Take one consistent snapshot of db_path into dest_dir; returns a report dict.
+    The source holds a single read transaction for the whole copy: in WAL mode this
+    pins one snapshot (so concurrent commits don't restart the backup) without
+    blocking writers.
+    """
+    dest_dir = Path(dest_dir)
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    name = SNAPSHOT_PREFIX + datetime.now().strftime('%Y%m%d-%H%M%S-%f') + '.db'
+    tmp_path = dest_dir / (name + '.tmp')
+    steps = []
+
+    started = time.perf_counter()
+    final_path = None
+    try:
+        source = sqlite3.connect(db_path, isolation_level=None)
+        target = sqlite3.connect(tmp_path)
+        try:
+            source.execute('BEGIN')
+            source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+            source.backup(
+                target,
+                pages=pages,
+                progress=lambda status, remaining, total: steps.append(total),
+                sleep=sleep_ms / 1000.0
+            )
+            source.execute('COMMIT')
+            # Self-contained single file, no -wal/-shm companions
+            target.execute('PRAGMA journal_mode=DELETE')
+        finally:
+            target.close()
+            source.close()
+        copy_seconds = time.perf_counter() - started
+
+        verify_seconds = None
+        if verify:
+            verify_started = time.perf_counter()
+            check = sqlite3.connect(tmp_path)
+            try:
+                result = [row[0] for row in check.execute('PRAGMA integrity_check').fetchall()]
+            finally:
+                check.close()
+            verify_seconds = time.perf_counter() - verify_started
+            if result != ['ok']:
+                raise BackupVerificationError(f'{name}: ' + '; '.join(result[:5]))
+
+        raw_size = tmp_path.stat().st_size
+        if compress:
+            final_path = dest_dir / (name + '.gz')
+            with open(tmp_path, 'rb') as src, gzip.open(final_path, 'wb', compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            tmp_path.unlink()
+        else:
+            final_path = dest_dir / name
+            os.replace(tmp_path, final_path)
+    except BaseException:
+        # Pruning only sees finished snapshots, so a failed attempt must not leave files behind
+        tmp_path.unlink(missing_ok=True)
+        if final_path is not None and compress:
+            final_path.unlink(missing_ok=True)
+        raise
+
+    return {
+        'path': str(final_path),
+        'pages': steps[-1] if steps else 0,
+        'steps': len(steps),
+        'bytes': raw_size,
+        'stored_bytes': final_path.stat().st_size,
+        'copy_seconds': round(copy_seconds, 3),
+        'verify_seconds': round(verify_seconds, 3) if verify_seconds is not None else None,
+        'total_seconds': round(time.perf_counter() - started, 3),
+        'verified': verify
+    }
+
+
+def list_snapshots(dest_dir):
+    """Completed snapshots, newest first"""
+    dest_dir = Path(dest_dir)
+    if not dest_dir.exists():
+        return []
+    snapshots = [p for p in dest_dir.iterdir()
+                 if p.name.startswith(SNAPSHOT_PREFIX) and not p.name.endswith('.tmp')]
+    return sorted(snapshots, key=lambda p: p.name, reverse=True)
+
+
+def prune_snapshots(dest_dir, keep):
+    """Delete all but the newest `keep` snapshots; returns the removed paths"""
+    removed = []
+    for path in list_snapshots(dest_dir)[keep:]:
+        path.unlink()
+        removed.append(str(path))
+    return removed
+
+
+def main():
+    default_db = os.environ.get('WAITLIST_DB_PATH', os.path.join(os.path.dirname(__file__), 'waitlist.db'))
+    parser = argparse.ArgumentParser(description='Take an online, verified snapshot of waitlist.db')
+    parser.add_argument('--db', default=default_db)
+    parser.add_argument('--dest', default=os.path.join(os.path.dirname(__file__), 'backups'))
+    parser.add_argument('--keep', type=int, default=8, help='snapshots to retain')
+    parser.add_argument('--pages', type=int, default=256, help='pages copied per step')
+    parser.add_argument('--sleep-ms', type=float, default=5, help='pause between steps')
+    parser.add_argument('--no-compress', action='store_true')
+    parser.add_argument('--no-verify', action='store_true')
+    args = parser.parse_args()
+
+    report = backup_database(args.db, args.dest, pages=args.pages, sleep_ms=args.sleep_ms,
+                             compress=not args.no_compress, verify=not args.no_verify)
+    removed = prune_snapshots(args.dest, args.keep)
+    print(f"Snapshot {report['path']}: {report['pages']} pages in {report['steps']} steps, "
+          f"{report['bytes'] / 1024:,.0f} KiB -> {report['stored_bytes'] / 1024:,.0f} KiB, "
+          f"copy {report['copy_seconds']}s, verify {report['verify_seconds']}s, total {report['total_seconds']}s")
+    for path in removed:
+        print(f"Pruned {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Write Transactions
+Runs write transactions as BEGIN IMMEDIATE so the write lock is taken up front
+(a deferred transaction that reads first can't wait for the lock in WAL mode and
+fails with "database is locked" at its first write). SQLite's own busy handler
+only waits a short per-attempt timeout; after that the whole transaction is
+retried with jittered exponential backoff until an overall deadline, so
+contending writers spread out instead of polling in lockstep. Time spent waiting
+for the lock is recorded per route.
+"""
+
+import random
+import sqlite3
+import threading
+import time
+
+SQLITE_BUSY = 5
+SQLITE_LOCKED = 6
+
+
+class WriteBusyError(Exception):
+    """The write lock could not be acquired before the deadline"""
+
+
+def is_busy_error(error):
+    """True for SQLITE_BUSY/SQLITE_LOCKED (including extended codes such as BUSY_SNAPSHOT)"""
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    code = getattr(error, 'sqlite_errorcode', None)
+    if code is not None:
+        return code & 0xff in (SQLITE_BUSY, SQLITE_LOCKED)
+    message = str(error)
+    return 'database is locked' in message or 'database is busy' in message
+
+
+class RetryPolicy:
+    """
+    busy_timeout_ms: SQLite busy handler wait per attempt
+    deadline_ms: give up (WriteBusyError) once this much time has passed
+    backoff_base_ms/backoff_cap_ms: full-jitter sleep between attempts
+    immediate: BEGIN IMMEDIATE (False keeps the deferred BEGIN, for comparison)
+    """
+
+    def __init__(self, busy_timeout_ms=100, deadline_ms=5000, max_attempts=50,
+                 backoff_base_ms=2.0, backoff_cap_ms=100.0, immediate=True):
+        self.busy_timeout_ms = busy_timeout_ms
+        self.deadline_ms = deadline_ms
+        self.max_attempts = max_attempts
+        self.backoff_base_ms = backoff_base_ms
+        self.backoff_cap_ms = backoff_cap_ms
+        self.immediate = immediate
+
+    def backoff(self, attempt):
+        """Seconds to sleep before retry number `attempt` (1-based)"""
+        return random.uniform(0, min(self.backoff_cap_ms, self.backoff_base_ms * (2 ** attempt))) / 1000.0
+
+    def describe(self):
+        return {
+            'busy_timeout_ms': self.busy_timeout_ms,
+            'deadline_ms': self.deadline_ms,
+            'max_attempts': self.max_attempts,
+            'backoff_base_ms': self.backoff_base_ms,
+            'backoff_cap_ms': self.backoff_cap_ms,
+            'immediate': self.immediate
+        }
+
+
+class WriteTransactions:
+    """Runs callables inside retried write transactions and accounts lock waits per route"""
+
+    def __init__(self, connect, policy=None, lock_wait=None, context=None):
+        """
+        connect: returns a new writer connection (closed after each transaction)
+        lock_wait: optional LatencyStats-like recorder (record(key, millis))
+        context: callable naming the caller (route or thread) for the accounting
+        """
+        self.connect = connect
+        self.policy = policy or RetryPolicy()
+        self.lock_wait = lock_wait
+        self.context = context or (lambda: threading.current_thread().name)
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def run(self, fn, route=None):
+        """
+        Call fn(conn) inside a write transaction and commit; returns fn's result.
+        fn may run more than once (on lock contention), so it must only touch the
+        database. Other errors roll back and propagate unchanged.
+        """
+        policy = self.policy
+        route = route or self.context()
+        started = time.perf_counter()
+        deadline = started + policy.deadline_ms / 1000.0
+        attempt = 0
+        waited_ms = None
+        while True:
+            attempt += 1
+            conn = self.connect()
+            try:
+                conn.execute(f'PRAGMA busy_timeout = {int(policy.busy_timeout_ms)}')
+                conn.execute('BEGIN IMMEDIATE' if policy.immediate else 'BEGIN')
+                # Lock wait: earlier attempts and backoff plus this BEGIN
+                waited_ms = (time.perf_counter() - started) * 1000
+                result = fn(conn)
+                conn.commit()
+            except Exception as error:
+                if conn.in_transaction:
+                    conn.rollback()
+                conn.close()
+                if not is_busy_error(error):
+                    self._finish(route, attempt, started, waited_ms, failed=False)
+                    raise
+                now = time.perf_counter()
+                if attempt >= policy.max_attempts or now >= deadline:
+                    self._finish(route, attempt, started, None, failed=True)
+                    raise WriteBusyError(
+                        f'write lock not acquired after {attempt} attempts in {(now - started) * 1000:.0f}ms'
+                    ) from error
+                time.sleep(min(policy.backoff(attempt), max(deadline - now, 0)))
+                continue
+            conn.close()
+            self._finish(route, attempt, started, waited_ms, failed=False)
+            return result
+
+    def _finish(self, route, attempts, started, waited_ms, failed):
+        total_ms = (time.perf_counter() - started) * 1000
+        with self.lock:
+            counters = self.counters.setdefault(route, {
+                'transactions': 0, 'retries': 0, 'busy_failures': 0, 'lock_wait_ms': 0.0
+            })
+            counters['transactions'] += 1
+            counters['retries'] += attempts - 1
+            if failed:
+                counters['busy_failures'] += 1
+            counters['lock_wait_ms'] += total_ms if failed else (waited_ms or 0.0)
+        if self.lock_wait is not None:
+            self.lock_wait.record(route, total_ms if failed else (waited_ms or 0.0))
+
+    def stats(self):
+        with self.lock:
+            routes = {route: dict(values, lock_wait_ms=round(values['lock_wait_ms'], 3))
+                      for route, values in self.counters.items()}
+        return {
+            'policy': self.policy.describe(),
+            'routes': routes,
+            'lock_wait': self.lock_wait.summary() if self.lock_wait is not None else {}
+        }
@@ -0,0 +1,476 @@
+#!/usr/bin/env python3
+"""
+Event Stream
+In-process publish/subscribe bus for admin activity (signups, user syncs,
+subscription changes) plus a Server-Sent Events server for it. Writers insert
+each event into a compact event_log table inside the same transaction as the
+change it describes; after commit a dispatcher thread reads new rows in id order
+and fans them out, so a client reconnecting with Last-Event-ID is replayed
+exactly what it missed. Each subscriber has a bounded buffer; a client that
+falls that far behind is disconnected and catches up from the log when it
+reconnects.
+
+EventStreamServer serves any number of idle subscribers from one thread with
+non-blocking sockets (selectors), instead of holding a WSGI worker per client.
+"""
+
+from collections import deque
+from urllib.parse import urlparse, parse_qs
+import json
+import selectors
+import socket
+import threading
+import time
+
+# Initial reconnect delay suggested to EventSource clients
+RETRY_MS = 3000
+
+
+def format_event(event):
+    """SSE frame for (id, type, data_json)"""
+    event_id, event_type, data = event
+    return f'id: {event_id}\nevent: {event_type}\ndata: {data}\n\n'.encode('utf-8')
+
+
+def format_reset(last_id):
+    """Tells the client its missed events are gone (pruned) and it should reload the full lists"""
+    return f'id: {last_id}\nevent: reset\ndata: {{"last_event_id": {last_id}}}\n\n'.encode('utf-8')
+
+
+class Subscriber:
+    """One client's bounded queue of pending events"""
+
+    def __init__(self, max_buffer, notify):
+        """notify(subscriber) is called (under the bus lock) whenever events are queued"""
+        self.events = deque()
+        self.max_buffer = max_buffer
+        self.notify = notify
+        self.last_id = 0
+        self.overflowed = False
+        self.delivered = 0
+
+    def push(self, event):
+        if self.overflowed or event[0] <= self.last_id:
+            return
+        if len(self.events) >= self.max_buffer:
+            # Too far behind: stop buffering; the client resumes from event_log on reconnect
+            self.overflowed = True
+            self.events.clear()
+        else:
+            self.events.append(event)
+        self.notify(self)
+
+    def drain(self):
+        """Pending events as SSE bytes"""
+        frames = []
+        while self.events:
+            event = self.events.popleft()
+            self.last_id = event[0]
+            frames.append(format_event(event))
+        self.delivered += len(frames)
+        return b''.join(frames)
+
+
+class EventBus:
+    """Durable, ordered fan-out of (id, type, data) events to subscribers"""
+
+    def __init__(self, write, read, max_buffer=256, replay_limit=1000, retention=10000,
+                 prune_every=500, poll_interval=0.5):
+        """
+        write(fn): run fn(conn) in a write transaction and return its result (pruning only)
+        read(): a connection that sees every committed event (not a stale snapshot)
+        retention: event_log rows kept; replay_limit: most events replayed on reconnect
+        poll_interval: seconds between event_log polls when not woken (other processes' events)
+        """
+        self.write = write
+        self.read = read
+        self.max_buffer = max_buffer
+        self.replay_limit = replay_limit
+        self.retention = retention
+        self.prune_every = prune_every
+        self.poll_interval = poll_interval
+        self.subscribers = set()
+        self.ring = deque(maxlen=replay_limit)  # most recently dispatched events
+        self.cursor = 0
+        self.published = 0
+        self.overflows = 0
+        self.resets = 0
+        self.lock = threading.Lock()
+        self.wake_event = threading.Event()
+        self.start_lock = threading.Lock()
+        self.running = False
+
+    @staticmethod
+    def log(conn, event_type, data):
+        """Insert an event in the caller's write transaction, so it commits (or not) with the change"""
+        payload = json.dumps(data, separators=(',', ':'), default=str)
+        return conn.execute('INSERT INTO event_log (type, data) VALUES (?, ?)', (event_type, payload)).lastrowid
+
+    def wake(self):
+        """Dispatch newly committed events now instead of on the next poll"""
+        self.wake_event.set()
+
+    def publish(self, event_type, data):
+        """Log an event in a transaction of its own and dispatch it; returns its id"""
+        event_id = self.write(lambda conn: self.log(conn, event_type, data))
+        self.wake()
+        return event_id
+
+    def start(self):
+        """Start the dispatcher thread (once); subscribe() calls this"""
+        if self.running:
+            return
+        with self.start_lock:
+            if self.running:
+                return
+            conn = self.read()
+            try:
+                self.cursor = conn.execute('SELECT MAX(id) FROM event_log').fetchone()[0] or 0
+            finally:
+                conn.close()
+            threading.Thread(target=self._run, name='event-dispatcher', daemon=True).start()
+            self.running = True
+
+    def _run(self):
+        conn = self.read()
+        # ids are assigned in commit order (one writer at a time), so reading past the
+        # cursor yields events in order with nothing committed earlier left behind
+        while True:
+            self.wake_event.wait(self.poll_interval)
+            self.wake_event.clear()
+            try:
+                while self._dispatch(conn) == 1000:
+                    pass
+            except Exception as e:
+                print(f"Event dispatch error: {str(e)}")
+                time.sleep(self.poll_interval)
+
+    def _dispatch(self, conn):
+        rows = conn.execute(
+            'SELECT id, type, data FROM event_log WHERE id > ? ORDER BY id LIMIT 1000', (self.cursor,)
+        ).fetchall()
+        if not rows:
+            return 0
+        with self.lock:
+            for row in rows:
+                event = tuple(row)
+                self.ring.append(event)
+                for subscriber in self.subscribers:
+                    was_overflowed = subscriber.overflowed
+                    subscriber.push(event)
+                    if subscriber.overflowed and not was_overflowed:
+                        self.overflows += 1
+            prune = self.published // self.prune_every != (self.published + len(rows)) // self.prune_every
+            self.published += len(rows)
+            self.cursor = rows[-1][0]
+        if prune:
+            self.prune(self.cursor)
+        return len(rows)
+
+    def prune(self, last_id):
+        self.write(lambda conn: conn.execute('DELETE FROM event_log WHERE id <= ?', (last_id - self.retention,)))
+
+    def subscribe(self, notify, last_event_id=None):
+        """
+        Register a subscriber; returns (subscriber, initial SSE bytes). With last_event_id,
+        the initial bytes replay the logged events after it (or a reset event if they're gone).
+        """
+        self.start()
+        subscriber = Subscriber(self.max_buffer, notify)
+        initial = [f'retry: {RETRY_MS}\n\n'.encode('utf-8')]
+
+        with self.lock:
+            # Fresh client, or everything it missed is still in the in-memory ring
+            if last_event_id is None or (last_event_id <= self.cursor and (
+                    last_event_id == self.cursor or (self.ring and self.ring[0][0] <= last_event_id + 1))):
+                if last_event_id is not None:
+                    initial.extend(format_event(event) for event in self.ring if event[0] > last_event_id)
+                subscriber.last_id = self.cursor
+                self.subscribers.add(subscriber)
+                return subscriber, b''.join(initial)
+
+        # Older than the ring: read event_log without holding the lock
+        conn = self.read()
+        try:
+            oldest, newest = conn.execute('SELECT MIN(id), MAX(id) FROM event_log').fetchone()
+            missed = conn.execute(
+                'SELECT id, type, data FROM event_log WHERE id > ? ORDER BY id LIMIT ?',
+                (last_event_id, self.replay_limit + 1)
+            ).fetchall()
+        finally:
+            conn.close()
+        newest = newest or 0
+        read_through = missed[-1][0] if missed else last_event_id
+
+        with self.lock:
+            # Events dispatched while we were reading must come from the ring
+            caught_up = read_through >= self.cursor or (self.ring and self.ring[0][0] <= read_through + 1)
+            gone = oldest is not None and oldest > last_event_id + 1 and last_event_id < newest
+            if gone or not caught_up or len(missed) > self.replay_limit or last_event_id > newest:
+                self.resets += 1
+                initial.append(format_reset(max(newest, self.cursor)))
+                subscriber.last_id = max(newest, self.cursor)
+            else:
+                initial.extend(format_event(tuple(row)) for row in missed)
+                initial.extend(format_event(event) for event in self.ring if event[0] > read_through)
+                subscriber.last_id = max(read_through, self.cursor)
+            self.subscribers.add(subscriber)
+        return subscriber, b''.join(initial)
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'subscribers': len(self.subscribers),
+                'published': self.published,
+                'cursor': self.cursor,
+                'overflows': self.overflows,
+                'resets': self.resets,
+                'max_buffer': self.max_buffer
+            }
+
+
+class _Client:
+    def __init__(self, sock):
+        self.sock = sock
+        self.inbuf = b''
+        self.outbuf = bytearray()
+        self.subscriber = None
+        self.last_write = time.monotonic()
+
+
+class EventStreamServer:
+    """Single-threaded SSE server for an EventBus (one selector loop for every client)"""
+
+    def __init__(self, bus, host='127.0.0.1', port=5001, path='/api/admin/events', authorize=None,
+                 heartbeat=15.0, max_clients=1000, max_pending_bytes=1 << 20, allow_origin=None):
+        """
+        authorize(headers, query) -> bool; headers are lower-cased
+        allow_origin: the one cross-origin page allowed to read the stream (None = same-origin only)
+        """
+        self.bus = bus
+        self.host = host
+        self.allow_origin = allow_origin
+        self.port = port
+        self.path = path
+        self.authorize = authorize or (lambda headers, query: True)
+        self.heartbeat = heartbeat
+        self.max_clients = max_clients
+        self.max_pending_bytes = max_pending_bytes
+        self.selector = selectors.DefaultSelector()
+        self.clients = {}
+        self.ready = set()
+        self.ready_lock = threading.Lock()
+        self.listener = None
+        self.running = False
+        self.rejected = 0
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._wake_pending = False
+
+    # ----- bus side (any thread) -----
+
+    def _notify(self, subscriber):
+        with self.ready_lock:
+            self.ready.add(subscriber)
+            if self._wake_pending:
+                return
+            self._wake_pending = True
+        try:
+            self._wake_w.send(b'x')
+        except BlockingIOError:
+            pass
+
+    # ----- loop side -----
+
+    def start(self):
+        """Bind and serve on a daemon thread; returns the thread"""
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((self.host, self.port))
+        self.listener.listen(128)
+        self.listener.setblocking(False)
+        self.port = self.listener.getsockname()[1]
+        self.selector.register(self.listener, selectors.EVENT_READ, 'accept')
+        self.selector.register(self._wake_r, selectors.EVENT_READ, 'wake')
+        self.running = True
+        thread = threading.Thread(target=self._run, name='event-stream', daemon=True)
+        thread.start()
+        return thread
+
+    def _run(self):
+        by_subscriber = {}
+        while self.running:
+            for key, mask in self.selector.select(timeout=self.heartbeat / 3):
+                try:
+                    if key.data == 'accept':
+                        self._accept()
+                    elif key.data == 'wake':
+                        with self.ready_lock:
+                            self._wake_pending = False
+                        try:
+                            while self._wake_r.recv(4096):
+                                pass
+                        except BlockingIOError:
+                            pass
+                    else:
+                        client = key.data
+                        if mask & selectors.EVENT_READ:
+                            self._read(client, by_subscriber)
+                        if mask & selectors.EVENT_WRITE and client.sock.fileno() != -1:
+                            self._flush(client, by_subscriber)
+                except Exception as e:
+                    print(f"Event stream error: {str(e)}")
+                    if isinstance(key.data, _Client):
+                        self._close(key.data, by_subscriber)
+
+            with self.ready_lock:
+                ready, self.ready = self.ready, set()
+            for subscriber in ready:
+                client = by_subscriber.get(subscriber)
+                if client is None:
+                    continue
+                if subscriber.overflowed:
+                    self._close(client, by_subscriber)
+                    continue
+                client.outbuf += subscriber.drain()
+                self._flush(client, by_subscriber)
+
+            now = time.monotonic()
+            for client in list(self.clients.values()):
+                if client.subscriber is not None and now - client.last_write >= self.heartbeat:
+                    client.outbuf += b': ping\n\n'
+                    self._flush(client, by_subscriber)
+
+    def _accept(self):
+        while True:
+            try:
+                sock, _ = self.listener.accept()
+            except BlockingIOError:
+                return
+            if len(self.clients) >= self.max_clients:
+                self.rejected += 1
+                sock.close()
+                continue
+            sock.setblocking(False)
+            client = _Client(sock)
+            self.clients[sock.fileno()] = client
+            self.selector.register(sock, selectors.EVENT_READ, client)
+
+    def _read(self, client, by_subscriber):
+        try:
+            data = client.sock.recv(8192)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self._close(client, by_subscriber)
+            return
+        if client.subscriber is not None:
+            return  # streaming clients send nothing further
+        client.inbuf += data
+        if b'\r\n\r\n' not in client.inbuf:
+            if len(client.inbuf) > 16384:
+                self._respond(client, by_subscriber, 431, 'Request Header Fields Too Large')
+            return
+        self._handle_request(client, by_subscriber)
+
+    def _handle_request(self, client, by_subscriber):
+        head = client.inbuf.split(b'\r\n\r\n', 1)[0].decode('latin-1')
+        request_line, *header_lines = head.split('\r\n')
+        parts = request_line.split(' ')
+        if len(parts) != 3:
+            return self._respond(client, by_subscriber, 400, 'Bad Request')
+        method, target, _ = parts
+        headers = {}
+        for line in header_lines:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        url = urlparse(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+        if url.path.rstrip('/') != self.path:
+            return self._respond(client, by_subscriber, 404, 'Not Found')
+        if method != 'GET':
+            return self._respond(client, by_subscriber, 405, 'Method Not Allowed')
+        if not self.authorize(headers, query):
+            return self._respond(client, by_subscriber, 401, 'Unauthorized')
+
+        last_event_id = headers.get('last-event-id') or query.get('last_event_id')
+        try:
+            last_event_id = int(last_event_id) if last_event_id else None
+        except ValueError:
+            last_event_id = None
+
+        cors = ''
+        if self.allow_origin and headers.get('origin') == self.allow_origin:
+            cors = f'Access-Control-Allow-Origin: {self.allow_origin}\r\nVary: Origin\r\n'
+
+        subscriber, initial = self.bus.subscribe(self._notify, last_event_id)
+        client.subscriber = subscriber
+        by_subscriber[subscriber] = client
+        client.outbuf += (
+            'HTTP/1.1 200 OK\r\n'
+            'Content-Type: text/event-stream\r\n'
+            'Cache-Control: no-cache\r\n'
+            'Connection: keep-alive\r\n'
+            'X-Accel-Buffering: no\r\n'
+            f'{cors}'
+            '\r\n'
+        ).encode('latin-1') + initial + subscriber.drain()
+        self._flush(client, by_subscriber)
+
+    def _respond(self, client, by_subscriber, status, reason):
+        body = reason.encode('utf-8')
+        client.outbuf += (f'HTTP/1.1 {status} {reason}\r\nContent-Type: text/plain\r\n'
+                          f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n').encode('latin-1') + body
+        self._flush(client, by_subscriber)
+        self._close(client, by_subscriber)
+
+    def _flush(self, client, by_subscriber):
+        if client.sock.fileno() == -1:
+            return
+        while client.outbuf:
+            try:
+                sent = client.sock.send(client.outbuf)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                self._close(client, by_subscriber)
+                return
+            del client.outbuf[:sent]
+            client.last_write = time.monotonic()
+        if len(client.outbuf) > self.max_pending_bytes:
+            # The socket itself is backed up (client stopped reading)
+            self._close(client, by_subscriber)
+            return
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if client.outbuf else 0)
+        self.selector.modify(client.sock, events, client)
+
+    def _close(self, client, by_subscriber):
+        if client.subscriber is not None:
+            self.bus.unsubscribe(client.subscriber)
+            by_subscriber.pop(client.subscriber, None)
+            client.subscriber = None
+        fileno = client.sock.fileno()
+        if fileno == -1:
+            return
+        self.clients.pop(fileno, None)
+        try:
+            self.selector.unregister(client.sock)
+        except (KeyError, ValueError):
+            pass
+        client.sock.close()
+
+    def stats(self):
+        return {
+            'running': self.running,
+            'port': self.port,
+            'clients': len(self.clients),
+            'rejected': self.rejected
+        }
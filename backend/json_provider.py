@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+JSON Provider
+Flask JSON provider that encodes responses with orjson when it is installed and
+falls back to the stdlib encoder otherwise. List endpoints can skip per-row dicts
+entirely by letting SQLite build the JSON (query_json_rows) and embedding it raw.
+"""
+
+from flask.json.provider import DefaultJSONProvider
+import json
+import sqlite3
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # Falls back to the stdlib encoder
+
+
+class RawJSON:
+    """Already-encoded JSON text to embed verbatim in a response"""
+
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Compact, unsorted JSON (no pretty-print or key sorting work per response).
+    Understands sqlite3.Row and RawJSON in addition to Flask's default types.
+    """
+
+    sort_keys = False
+    compact = True
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, sqlite3.Row):
+            return dict(zip(o.keys(), o))
+        if isinstance(o, RawJSON):
+            if orjson is not None:
+                return orjson.Fragment(o.text)
+            raise TypeError('RawJSON is only encoded by FastJSONProvider.dumps')
+        return DefaultJSONProvider.default(o)
+
+    def _dumps_stdlib(self, obj):
+        # The stdlib encoder can't emit raw text, so RawJSON values are swapped for
+        # unique placeholders and spliced back in afterwards
+        fragments = []
+
+        def default(o):
+            if isinstance(o, RawJSON):
+                fragments.append(o.text)
+                return f'\x00raw{len(fragments) - 1}\x00'
+            return self.default(o)
+
+        text = json.dumps(obj, default=default, ensure_ascii=False, separators=(',', ':'))
+        for index, fragment in enumerate(fragments):
+            text = text.replace(json.dumps(f'\x00raw{index}\x00'), fragment, 1)
+        return text
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+        if kwargs:
+            kwargs.setdefault('default', self.default)
+            return json.dumps(obj, **kwargs)
+        return self._dumps_stdlib(obj)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if orjson is not None:
+            data = orjson.dumps(obj, default=self.default,
+                                option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+        else:
+            data = self._dumps_stdlib(obj) + '\n'
+        return self._app.response_class(data, mimetype=self.mimetype)
+
+
+def query_json_rows(cursor, select_sql, params, columns):
+    """
+    Run select_sql and return (row count, RawJSON array of {column: value} objects).
+    SQLite's JSON1 builds the array in C, so no Python object is created per row.
+    `columns` must be literal column names from code, never user input.
+    """
+    pairs = ', '.join(f"'{column}', {column}" for column in columns)
+    try:
+        # An ORDER BY subquery under an aggregate is never flattened, so rows keep their order
+        cursor.execute(f'''
+            SELECT COUNT(*), COALESCE(json_group_array(json_object({pairs})), '[]')
+            FROM ({select_sql})
+        ''', params)
+        count, text = cursor.fetchone()
+        return count, RawJSON(text)
+    except sqlite3.OperationalError as e:
+        if 'no such function' not in str(e):
+            raise
+    # SQLite built without JSON1: encode from plain tuples instead
+    cursor.execute(select_sql, params)
+    rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    return len(rows), RawJSON(json.dumps(rows, ensure_ascii=False, separators=(',', ':')))
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Sampling Profiler
+Statistical, per-route request profiler for production use. While a session runs,
+a fraction of the requests for one route register their worker thread; a sampler
+thread snapshots those threads' stacks every few milliseconds (sys._current_frames)
+and counts identical stacks. Results come out as collapsed stacks (the input
+format of flamegraph.pl / speedscope) or a self-contained SVG flamegraph.
+When no session is running the request hooks reduce to one attribute check.
+"""
+
+from html import escape
+import os
+import random
+import sys
+import threading
+import time
+
+# Cap on frames kept per sample (deep recursion shouldn't blow up the stack table)
+MAX_STACK_DEPTH = 128
+
+
+class ProfilerBusyError(Exception):
+    """A profiling session is already running"""
+
+
+class ProfileSession:
+    """One time-boxed profiling run"""
+
+    def __init__(self, route=None, fraction=1.0, seconds=30.0, interval_ms=5.0):
+        self.route = route
+        self.fraction = fraction
+        self.seconds = seconds
+        self.interval = interval_ms / 1000.0
+        self.started_at = time.time()
+        self.deadline = time.monotonic() + seconds
+        self.finished_at = None
+        self.threads = {}
+        self.stacks = {}
+        self.samples = 0
+        self.requests_seen = 0
+        self.requests_sampled = 0
+        self.sampler_seconds = 0.0
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+
+    def enter(self, route):
+        """Called at request start; returns True if this request is being sampled"""
+        if self.route is not None and route != self.route:
+            return False
+        self.requests_seen += 1
+        if self.fraction < 1.0 and random.random() >= self.fraction:
+            return False
+        self.requests_sampled += 1
+        self.threads[threading.get_ident()] = route or '<unmatched>'
+        return True
+
+    def exit(self):
+        self.threads.pop(threading.get_ident(), None)
+
+    def _sample(self):
+        frames = sys._current_frames()
+        for ident, route in list(self.threads.items()):
+            frame = frames.get(ident)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)})')
+                frame = frame.f_back
+            stack.append(route)
+            key = ';'.join(reversed(stack))
+            with self.lock:
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+                self.samples += 1
+
+    def run(self):
+        """Sampler loop; ends at the deadline or when stop() is called"""
+        while not self.stopped.is_set() and time.monotonic() < self.deadline:
+            started = time.perf_counter()
+            if self.threads:
+                self._sample()
+            self.sampler_seconds += time.perf_counter() - started
+            self.stopped.wait(self.interval)
+        self.finished_at = time.time()
+
+    def collapsed(self):
+        """Collapsed-stack text: 'root;frame;frame count' per line, hottest first"""
+        with self.lock:
+            items = sorted(self.stacks.items(), key=lambda item: -item[1])
+        return ''.join(f'{stack} {count}\n' for stack, count in items)
+
+    def summary(self):
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            'route': self.route,
+            'fraction': self.fraction,
+            'seconds': self.seconds,
+            'interval_ms': self.interval * 1000,
+            'running': self.finished_at is None,
+            'started_at': self.started_at,
+            'elapsed_seconds': round(elapsed, 3),
+            'requests_seen': self.requests_seen,
+            'requests_sampled': self.requests_sampled,
+            'samples': self.samples,
+            'distinct_stacks': len(self.stacks),
+            # Time the sampler itself held the GIL, as a share of wall time
+            'sampler_overhead': round(self.sampler_seconds / elapsed, 5) if elapsed else None
+        }
+
+
+class SamplingProfiler:
+    """Holds the current (or last finished) session; request hooks check .session"""
+
+    def __init__(self):
+        # Only set while a session runs, so the disabled request path is `if profiler.session`
+        self.session = None
+        self.last = None
+        self.lock = threading.Lock()
+
+    def start(self, route=None, fraction=1.0, seconds=30.0, interval_ms=5.0):
+        with self.lock:
+            if self.session is not None:
+                raise ProfilerBusyError('A profiling session is already running')
+            session = ProfileSession(route, fraction, seconds, interval_ms)
+            self.session = self.last = session
+
+        def run():
+            try:
+                session.run()
+            finally:
+                with self.lock:
+                    if self.session is session:
+                        self.session = None
+
+        threading.Thread(target=run, name='profiler-sampler', daemon=True).start()
+        return session
+
+    def stop(self):
+        """End the running session early; returns it (or None)"""
+        session = self.session
+        if session is not None:
+            session.stopped.set()
+        return session
+
+
+def render_flamegraph(collapsed, title='Flame Graph', width=1200, frame_height=16):
+    """Render collapsed-stack text as a standalone SVG (hover a frame for its sample count)"""
+    root = {'name': 'all', 'count': 0, 'children': {}}
+    for line in collapsed.splitlines():
+        stack, _, count = line.rpartition(' ')
+        if not stack:
+            continue
+        count = int(count)
+        node = root
+        node['count'] += count
+        for name in stack.split(';'):
+            node = node['children'].setdefault(name, {'name': name, 'count': 0, 'children': {}})
+            node['count'] += count
+
+    def depth(node):
+        return 1 + max((depth(child) for child in node['children'].values()), default=0)
+
+    levels = depth(root)
+    total = root['count'] or 1
+    top = 40
+    height = top + levels * frame_height + 10
+    rects = []
+
+    def draw(node, x, level):
+        frame_width = node['count'] / total * (width - 20)
+        if frame_width < 0.3:
+            return
+        y = height - 10 - (level + 1) * frame_height
+        # Stable warm colour per frame name, in the usual flamegraph palette
+        seed = sum(node['name'].encode('utf-8')) % 100
+        fill = f'rgb({205 + seed % 50},{80 + seed * 13 % 150},{seed * 7 % 60})'
+        label = f"{node['name']} ({node['count']} samples, {node['count'] * 100 / total:.1f}%)"
+        text = ''
+        if frame_width > 30:
+            chars = int(frame_width / 7)
+            shown = node['name'] if len(node['name']) <= chars else node['name'][:max(chars - 2, 0)] + '..'
+            text = f'<text x="{x + 3:.1f}" y="{y + frame_height - 4}">{escape(shown)}</text>'
+        rects.append(
+            f'<g><title>{escape(label)}</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{frame_width:.1f}" height="{frame_height - 1}" fill="{fill}" rx="2"/>'
+            f'{text}</g>'
+        )
+        child_x = x
+        for child in sorted(node['children'].values(), key=lambda c: c['name']):
+            draw(child, child_x, level + 1)
+            child_x += child['count'] / total * (width - 20)
+
+    draw(root, 10, 0)
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'font-family="Verdana, sans-serif" font-size="11">'
+        f'<rect width="100%" height="100%" fill="#fdf6e3"/>'
+        f'<text x="{width / 2}" y="24" text-anchor="middle" font-size="16">{escape(title)}</text>'
+        + ''.join(rects) +
+        '</svg>'
+    )
@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+Query Catalog
+Every statement the request handlers run, written exactly once. sqlite3 caches
+prepared statements per connection keyed on the exact SQL text, so one canonical
+text per statement (and no per-call variants such as IN lists of varying length)
+means each statement is prepared once per connection and then reused.
+Row mappers turn result rows into the API's JSON shapes with typed fields.
+"""
+
+import json
+
+# Per-connection prepared statement cache (sqlite3 default is 128). Covers the whole
+# catalog plus the schema/job statements with room to spare.
+STATEMENT_CACHE_SIZE = 256
+
+
+# ===== ROW MAPPERS =====
+
+class RowMapper:
+    """
+    Declarative row -> dict conversion: each field is (key, column) or (key, column, convert).
+    convert is applied to non-NULL values only.
+    """
+
+    def __init__(self, *fields):
+        self.fields = [(field[0], field[1], field[2] if len(field) > 2 else None) for field in fields]
+
+    def __call__(self, row):
+        result = {}
+        for key, column, convert in self.fields:
+            value = row[column]
+            result[key] = convert(value) if convert is not None and value is not None else value
+        return result
+
+    def many(self, rows):
+        return [self(row) for row in rows]
+
+
+SUBSCRIPTION_STATUS = RowMapper(
+    ('plan', 'plan_name'),
+    ('status', 'status'),
+    ('current_period_end', 'current_period_end'),
+    ('cancel_at_period_end', 'cancel_at_period_end', bool)
+)
+
+SUBSCRIPTION_PERIOD = RowMapper(
+    ('plan', 'plan_name'),
+    ('status', 'status'),
+    ('current_period_start', 'current_period_start'),
+    ('current_period_end', 'current_period_end')
+)
+
+ARCHIVED_SUBSCRIPTION = RowMapper(
+    ('plan', 'plan_name'),
+    ('status', 'status'),
+    ('current_period_start', 'current_period_start'),
+    ('current_period_end', 'current_period_end'),
+    ('archived_at', 'archived_at')
+)
+
+USER_PROFILE = RowMapper(
+    ('id', 'id'),
+    ('cognito_user_id', 'cognito_user_id'),
+    ('email', 'email'),
+    ('name', 'name'),
+    ('role', 'role'),
+    ('is_dev_account', 'is_dev_account', bool),
+    ('subscription_tier', 'subscription_tier'),
+    ('subscription_override', 'subscription_override', bool),
+    ('created_at', 'created_at'),
+    ('last_login', 'last_login'),
+    ('permissions', 'permissions', json.loads)
+)
+
+USER_SEARCH_HIT = RowMapper(
+    ('id', 'id'),
+    ('cognito_user_id', 'cognito_user_id'),
+    ('email', 'email'),
+    ('name', 'name'),
+    ('role', 'role'),
+    ('rank', 'rank')
+)
+
+WAITLIST_SEARCH_HIT = RowMapper(
+    ('id', 'id'),
+    ('name', 'name'),
+    ('email', 'email'),
+    ('product', 'product'),
+    ('created_at', 'created_at'),
+    ('rank', 'rank')
+)
+
+
+def user_profile(row):
+    """USER_PROFILE plus the nested current subscription (None without one)"""
+    profile = USER_PROFILE(row)
+    profile['subscription'] = SUBSCRIPTION_PERIOD(row) if row['plan_name'] is not None else None
+    return profile
+
+
+# ===== USERS =====
+
+USER_ID_BY_COGNITO_ID = 'SELECT id FROM users WHERE cognito_user_id = ?'
+USER_ID_BY_EMAIL = 'SELECT id FROM users WHERE email = ?'
+USER_DEV_FLAG_BY_COGNITO_ID = 'SELECT id, is_dev_account FROM users WHERE cognito_user_id = ?'
+USER_DEV_FLAG_BY_EMAIL = 'SELECT id, is_dev_account FROM users WHERE email = ?'
+USER_ROLE_BY_ID = 'SELECT role, is_dev_account, email FROM users WHERE id = ?'
+
+USER_SYNC_LOGIN = '''
+    UPDATE users
+    SET last_login = CURRENT_TIMESTAMP,
+        updated_at = CURRENT_TIMESTAMP,
+        email = ?,
+        name = COALESCE(?, name),
+        is_dev_account = ?,
+        role = CASE WHEN ? = 1 THEN 'admin' ELSE role END
+    WHERE cognito_user_id = ?
+'''
+
+USER_LINK_COGNITO_ID = '''
+    UPDATE users
+    SET cognito_user_id = ?,
+        last_login = CURRENT_TIMESTAMP,
+        updated_at = CURRENT_TIMESTAMP,
+        name = COALESCE(?, name),
+        auth_provider = ?
+    WHERE id = ?
+'''
+
+USER_INSERT = '''
+    INSERT INTO users (cognito_user_id, email, name, auth_provider, last_login, is_dev_account, role)
+    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP, ?, CASE WHEN ? = 1 THEN 'admin' ELSE 'user' END)
+'''
+
+USER_PROMOTE_TO_DEV = '''
+    UPDATE users
+    SET role = 'admin',
+        is_dev_account = 1,
+        subscription_tier = 'enterprise',
+        subscription_override = 1,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE id = ?
+'''
+
+USER_INSERT_DEV = '''
+    INSERT INTO users (cognito_user_id, email, name, role, is_dev_account, subscription_tier, subscription_override)
+    VALUES (?, ?, ?, 'admin', 1, 'enterprise', 1)
+'''
+
+USER_OVERRIDE_TIER = '''
+    UPDATE users
+    SET subscription_tier = ?,
+        subscription_override = 1,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE id = ?
+'''
+
+USERS_LIST = '''
+    SELECT id, cognito_user_id, email, name, auth_provider, created_at, last_login
+    FROM users
+    ORDER BY created_at DESC
+'''
+USERS_LIST_COLUMNS = ('id', 'cognito_user_id', 'email', 'name', 'auth_provider', 'created_at', 'last_login')
+
+# Users, permissions (as JSON) and current subscription in one indexed statement.
+# Looked up values are passed as one JSON array, so every batch size shares one statement.
+_USER_PROFILES = '''
+    SELECT u.id, u.cognito_user_id, u.email, u.name, u.role, u.is_dev_account,
+           u.subscription_tier, u.subscription_override, u.created_at, u.last_login,
+           (SELECT json_group_array(json_object('permission', p.permission, 'resource', p.resource))
+            FROM user_permissions p WHERE p.user_id = u.id) AS permissions,
+           s.plan_name, s.status, s.current_period_start, s.current_period_end
+    FROM users u
+    LEFT JOIN subscriptions s ON s.id = u.current_subscription_id
+    WHERE u.{column} IN (SELECT value FROM json_each(?))
+    ORDER BY u.id
+'''
+USER_PROFILES_BY = {
+    'cognito_user_id': _USER_PROFILES.format(column='cognito_user_id'),
+    'email': _USER_PROFILES.format(column='email')
+}
+
+USER_SEARCH = '''
+    SELECT u.id, u.cognito_user_id, u.email, u.name, u.role, bm25(users_fts) AS rank
+    FROM users_fts
+    JOIN users u ON u.id = users_fts.rowid
+    WHERE users_fts MATCH ?
+    ORDER BY rank
+    LIMIT ? OFFSET ?
+'''
+
+
+# ===== PERMISSIONS =====
+
+PERMISSION_GRANT = '''
+    INSERT OR IGNORE INTO user_permissions (user_id, permission, resource)
+    VALUES (?, ?, ?)
+'''
+
+PERMISSION_CHECK = '''
+    SELECT id FROM user_permissions
+    WHERE user_id = ? AND permission = ? AND (resource = ? OR resource = 'all')
+'''
+
+
+# ===== SUBSCRIPTIONS =====
+
+SUBSCRIPTION_ID_BY_STRIPE_ID = 'SELECT id FROM subscriptions WHERE stripe_subscription_id = ?'
+SUBSCRIPTION_ID_BY_USER_ID = 'SELECT id FROM subscriptions WHERE user_id = ?'
+
+SUBSCRIPTION_UPDATE_FROM_STRIPE = '''
+    UPDATE subscriptions
+    SET user_id = ?,
+        status = ?,
+        current_period_start = ?,
+        current_period_end = ?,
+        cancel_at_period_end = ?,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE stripe_subscription_id = ?
+'''
+
+SUBSCRIPTION_INSERT_FROM_STRIPE = '''
+    INSERT INTO subscriptions
+    (user_id, user_email, stripe_customer_id, stripe_subscription_id, stripe_price_id, plan_name, status, current_period_start, current_period_end)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+SUBSCRIPTION_CANCEL_BY_STRIPE_ID = '''
+    UPDATE subscriptions
+    SET status = 'canceled',
+        updated_at = CURRENT_TIMESTAMP
+    WHERE stripe_subscription_id = ?
+'''
+
+# Period-end sweep: index seek on (status, current_period_end); rows leave the range once transitioned
+SUBSCRIPTIONS_DUE_TO_CANCEL = '''
+    SELECT id FROM subscriptions
+    WHERE status IN ('active', 'trialing', 'past_due')
+      AND current_period_end <= ?
+      AND cancel_at_period_end = 1
+    LIMIT ?
+'''
+SUBSCRIPTIONS_DUE_TO_LAPSE = '''
+    SELECT id FROM subscriptions
+    WHERE status IN ('active', 'trialing')
+      AND current_period_end <= ?
+    LIMIT ?
+'''
+SUBSCRIPTION_SET_STATUS = '''
+    UPDATE subscriptions
+    SET status = ?,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE id = ?
+'''
+
+SUBSCRIPTION_OVERRIDE_PLAN = '''
+    UPDATE subscriptions
+    SET plan_name = ?,
+        status = 'active',
+        updated_at = CURRENT_TIMESTAMP
+    WHERE user_id = ?
+'''
+
+SUBSCRIPTION_INSERT_OVERRIDE = '''
+    INSERT INTO subscriptions (user_id, user_email, plan_name, status)
+    SELECT id, email, ?, 'active'
+    FROM users WHERE id = ?
+'''
+
+# Current subscription via the denormalized pointer: one index seek + one primary-key read
+_CURRENT_SUBSCRIPTION = '''
+    SELECT u.email, s.plan_name, s.status, s.current_period_end, s.cancel_at_period_end
+    FROM users u
+    JOIN subscriptions s ON s.id = u.current_subscription_id
+    WHERE u.{column} = ?
+    ORDER BY u.id
+    LIMIT 1
+'''
+CURRENT_SUBSCRIPTION_BY = {
+    'cognito_user_id': _CURRENT_SUBSCRIPTION.format(column='cognito_user_id'),
+    'email': _CURRENT_SUBSCRIPTION.format(column='email')
+}
+
+# Subscriptions recorded before the user synced aren't linked to a user yet
+LATEST_SUBSCRIPTION_BY_EMAIL = '''
+    SELECT user_email AS email, plan_name, status, current_period_end, cancel_at_period_end
+    FROM subscriptions
+    WHERE user_email = ?
+    ORDER BY created_at DESC, id DESC
+    LIMIT 1
+'''
+
+ARCHIVED_SUBSCRIPTIONS_BY_USER_ID = '''
+    SELECT plan_name, status, current_period_start, current_period_end, archived_at
+    FROM archive.subscriptions
+    WHERE user_id = ?
+    ORDER BY created_at DESC
+'''
+
+
+# ===== WAITLIST =====
+
+WAITLIST_INSERT = '''
+    INSERT INTO waitlist (user_id, name, email, product)
+    VALUES (?, ?, ?, ?)
+'''
+
+# Spooled submissions keep their original timestamp; replays and duplicates are no-ops
+WAITLIST_INSERT_SPOOLED = '''
+    INSERT INTO waitlist (user_id, name, email, product, created_at)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (email) DO NOTHING
+'''
+
+WAITLIST_LIST = '''
+    SELECT id, name, email, product, created_at
+    FROM main.waitlist
+    ORDER BY created_at DESC
+'''
+WAITLIST_LIST_WITH_ARCHIVE = '''
+    SELECT id, name, email, product, created_at
+    FROM main.waitlist
+    UNION ALL
+    SELECT id, name, email, product, created_at
+    FROM archive.waitlist
+    ORDER BY created_at DESC
+'''
+WAITLIST_LIST_COLUMNS = ('id', 'name', 'email', 'product', 'created_at')
+
+WAITLIST_EMAIL_EXISTS = 'SELECT 1 FROM main.waitlist WHERE email = ? LIMIT 1'
+WAITLIST_EMAIL_ARCHIVED = 'SELECT 1 FROM archive.waitlist WHERE email = ? LIMIT 1'
+WAITLIST_EMAILS_ARCHIVED = 'SELECT email FROM archive.waitlist WHERE email IN (SELECT value FROM json_each(?))'
+
+# Waitlist position (see migrate_waitlist_positions): earlier hours come from the
+# trigger-maintained counters, the entry's own hour from an index range count
+WAITLIST_ENTRY_BY_EMAIL = 'SELECT id, product, created_at FROM main.waitlist WHERE email = ?'
+ARCHIVED_WAITLIST_ENTRY_BY_EMAIL = 'SELECT id, product, created_at FROM archive.waitlist WHERE email = ?'
+
+# Entries in every earlier hour (hot and archived), kept as a running count per hour row
+WAITLIST_ENTRIES_BEFORE_HOUR = '''
+    SELECT entries_before FROM waitlist_hour_counts
+    WHERE product = ? AND hour = ?
+'''
+
+WAITLIST_AHEAD_IN_HOUR = '''
+    SELECT COUNT(*) FROM waitlist
+    WHERE product IS ? AND created_at >= ? AND (created_at, id) < (?, ?)
+'''
+WAITLIST_AHEAD_IN_HOUR_ALL_PRODUCTS = '''
+    SELECT COUNT(*) FROM waitlist
+    WHERE created_at >= ? AND (created_at, id) < (?, ?)
+'''
+ARCHIVED_WAITLIST_AHEAD_IN_HOUR = '''
+    SELECT COUNT(*) FROM archive.waitlist
+    WHERE product IS ? AND created_at >= ? AND (created_at, id) < (?, ?)
+'''
+ARCHIVED_WAITLIST_AHEAD_IN_HOUR_ALL_PRODUCTS = '''
+    SELECT COUNT(*) FROM archive.waitlist
+    WHERE created_at >= ? AND (created_at, id) < (?, ?)
+'''
+
+WAITLIST_TOTAL = 'SELECT entries FROM waitlist_totals WHERE product = ?'
+
+WAITLIST_SEARCH = '''
+    SELECT w.id, w.name, w.email, w.product, w.created_at, bm25(waitlist_fts) AS rank
+    FROM waitlist_fts
+    JOIN waitlist w ON w.id = waitlist_fts.rowid
+    WHERE waitlist_fts MATCH ?
+    ORDER BY rank
+    LIMIT ? OFFSET ?
+'''
+
+
+# ===== STRIPE CUSTOMERS =====
+
+USER_STRIPE_CUSTOMER_BY_EMAIL = 'SELECT stripe_customer_id FROM users WHERE email = ?'
+
+# Only fills an empty slot, so a concurrent provisioner can't overwrite a customer in use
+USER_SET_STRIPE_CUSTOMER = '''
+    UPDATE users
+    SET stripe_customer_id = ?,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE email = ? AND stripe_customer_id IS NULL
+'''
+
+USER_CLEAR_STRIPE_CUSTOMER = '''
+    UPDATE users
+    SET stripe_customer_id = NULL,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE email = ? AND stripe_customer_id = ?
+'''
+
+USERS_WITHOUT_STRIPE_CUSTOMER = '''
+    SELECT email FROM users
+    WHERE stripe_customer_id IS NULL
+    ORDER BY id
+    LIMIT ?
+'''
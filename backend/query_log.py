@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Query Log
+Times every statement run through TimedConnection/TimedCursor (execute plus the
+fetches that drain it), aggregates them by normalized SQL, and keeps details of
+statements slower than a threshold: parameter shape, rows, calling route and the
+EXPLAIN QUERY PLAN captured on the same connection. Parameter values are never
+stored (they are mostly emails).
+"""
+
+from collections import deque
+import re
+import sqlite3
+import threading
+import time
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+# Statements worth explaining (PRAGMA/BEGIN/COMMIT have no plan)
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE')
+
+# Re-capture a statement's plan after this long (indexes/statistics may have changed)
+PLAN_REFRESH_SECONDS = 600
+
+
+def params_shape(parameters, many=False):
+    """Describe parameters without their values, e.g. '(str, int)' or '250 x (str, int)'"""
+    if many:
+        rows = list(parameters) if not isinstance(parameters, (list, tuple)) else parameters
+        return f'{len(rows)} x {params_shape(rows[0])}' if rows else '0 x ()'
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(f'{key}: {type(value).__name__}' for key, value in sorted(parameters.items())) + '}'
+    return '(' + ', '.join(type(value).__name__ for value in parameters) + ')'
+
+
+class QueryLog:
+    """Per-statement totals for every query plus details for the slow ones"""
+
+    def __init__(self, threshold_ms=50.0, max_statements=500, recent=200, context=None):
+        """context: callable naming the caller (route or thread) for slow-query entries"""
+        self.threshold_ms = threshold_ms
+        self.max_statements = max_statements
+        self.context = context or (lambda: threading.current_thread().name)
+        self.statements = {}
+        self.recent = deque(maxlen=recent)
+        self.normalized = {}
+        self.started_at = time.time()
+        self.lock = threading.Lock()
+
+    def normalize(self, sql):
+        """Literal-free, whitespace-collapsed SQL used as the aggregation key"""
+        normalized = self.normalized.get(sql)
+        if normalized is None:
+            normalized = _WHITESPACE.sub(' ', sql).strip()
+            normalized = _STRING_LITERAL.sub('?', normalized)
+            normalized = _NUMBER_LITERAL.sub('?', normalized)
+            normalized = _PLACEHOLDER_LIST.sub('(?, ...)', normalized)
+            if len(self.normalized) > 5000:
+                self.normalized.clear()
+            self.normalized[sql] = normalized
+        return normalized
+
+    def record(self, conn, sql, parameters, millis, rows, many=False):
+        normalized = self.normalize(sql)
+        slow = millis >= self.threshold_ms
+        with self.lock:
+            stats = self.statements.get(normalized)
+            if stats is None:
+                if len(self.statements) >= self.max_statements:
+                    # Forget the cheapest statement to stay bounded
+                    cheapest = min(self.statements, key=lambda key: self.statements[key]['total_ms'])
+                    del self.statements[cheapest]
+                stats = self.statements[normalized] = {
+                    'sql': normalized, 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0,
+                    'slow_count': 0, 'slow_ms': 0.0, 'routes': {}, 'params_shape': None,
+                    'plan': None, 'plan_captured_at': None
+                }
+            stats['count'] += 1
+            stats['total_ms'] += millis
+            stats['rows'] += max(rows, 0)
+            if millis > stats['max_ms']:
+                stats['max_ms'] = millis
+            if not slow:
+                return
+            route = self.context()
+            shape = params_shape(parameters, many)
+            stats['slow_count'] += 1
+            stats['slow_ms'] += millis
+            stats['routes'][route] = stats['routes'].get(route, 0) + 1
+            stats['params_shape'] = shape
+            needs_plan = (stats['plan_captured_at'] is None
+                          or time.time() - stats['plan_captured_at'] > PLAN_REFRESH_SECONDS)
+            if needs_plan:
+                stats['plan_captured_at'] = time.time()
+
+        plan = None
+        if needs_plan and sql.lstrip().upper().startswith(EXPLAINABLE):
+            plan = self.explain(conn, sql, parameters, many)
+            with self.lock:
+                stats['plan'] = plan
+        else:
+            plan = stats['plan']
+
+        self.recent.append({
+            'at': time.time(),
+            'sql': normalized,
+            'ms': round(millis, 3),
+            'rows': rows,
+            'route': route,
+            'params_shape': shape
+        })
+        print(f"[SLOW QUERY] {millis:.1f}ms {route} rows={rows} params={shape} {normalized[:300]}")
+        if plan and needs_plan:
+            print(f"[SLOW QUERY]   plan: {' | '.join(plan)}")
+
+    def explain(self, conn, sql, parameters, many=False):
+        """EXPLAIN QUERY PLAN lines for sql on conn (nothing is executed)"""
+        if many:
+            rows = list(parameters) if not isinstance(parameters, (list, tuple)) else parameters
+            parameters = rows[0] if rows else ()
+        try:
+            cursor = sqlite3.Cursor(conn)
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, parameters)
+            rows = cursor.fetchall()
+            cursor.close()
+        except sqlite3.Error as e:
+            return [f'(plan unavailable: {e})']
+        # Rows are (id, parent, notused, detail); indent each step under its parent
+        depths = {}
+        plan = []
+        for step_id, parent, _, detail in rows:
+            depths[step_id] = depths.get(parent, -1) + 1
+            plan.append('  ' * depths[step_id] + detail)
+        return plan
+
+    def top(self, limit=20, order='total_ms'):
+        """Statements ranked by order (total_ms, max_ms, count, slow_ms or slow_count)"""
+        with self.lock:
+            items = [dict(stats, routes=dict(stats['routes'])) for stats in self.statements.values()]
+        items.sort(key=lambda stats: stats[order], reverse=True)
+        for stats in items:
+            stats['avg_ms'] = round(stats['total_ms'] / stats['count'], 3) if stats['count'] else 0.0
+            stats['total_ms'] = round(stats['total_ms'], 3)
+            stats['max_ms'] = round(stats['max_ms'], 3)
+            stats['slow_ms'] = round(stats['slow_ms'], 3)
+        return items[:limit]
+
+    def reset(self):
+        with self.lock:
+            self.statements.clear()
+            self.recent.clear()
+            self.started_at = time.time()
+
+
+class TimedCursor(sqlite3.Cursor):
+    """
+    Cursor that reports each statement to connection.query_log once it is drained,
+    re-executed, closed or garbage collected (SQLite does most SELECT work in fetches)
+    """
+
+    _pending = None
+
+    def _finish(self):
+        pending = self._pending
+        if pending is not None:
+            self._pending = None
+            sql, parameters, seconds, rows, many = pending
+            self.connection.query_log.record(self.connection, sql, parameters, seconds * 1000, rows, many)
+
+    def _start(self, sql, parameters, seconds, many):
+        if self.description is None:
+            # No result set (DML/DDL): all the work happened in execute
+            self._pending = [sql, parameters, seconds, self.rowcount, many]
+            self._finish()
+        else:
+            self._pending = [sql, parameters, seconds, 0, many]
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        started = time.perf_counter()
+        super().execute(sql, parameters)
+        self._start(sql, parameters, time.perf_counter() - started, False)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        if not isinstance(seq_of_parameters, (list, tuple)):
+            seq_of_parameters = list(seq_of_parameters)
+        started = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        self._start(sql, seq_of_parameters, time.perf_counter() - started, True)
+        return self
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        pending = self._pending
+        if pending is not None:
+            pending[2] += time.perf_counter() - started
+            if row is None:
+                self._finish()
+            else:
+                pending[3] += 1
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        pending = self._pending
+        if pending is not None:
+            pending[2] += time.perf_counter() - started
+            pending[3] += len(rows)
+            if not rows:
+                self._finish()
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        pending = self._pending
+        if pending is not None:
+            pending[2] += time.perf_counter() - started
+            pending[3] += len(rows)
+            self._finish()
+        return rows
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+    def close(self):
+        try:
+            self._finish()
+        finally:
+            super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose cursors (and execute shortcuts) are timed when query_log is set"""
+
+    query_log = None
+
+    def cursor(self, factory=sqlite3.Cursor):
+        if self.query_log is not None and factory is sqlite3.Cursor:
+            factory = TimedCursor
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Stripe Subscription Reconciliation
+Pages through every Stripe subscription and repairs drift in the local
+subscriptions table (e.g. after lost webhooks). Each page is applied in a single
+transaction together with its cursor, so an interrupted run resumes where it stopped.
+
+Usage:
+    python3 reconcile_subscriptions.py [--page-size 100] [--restart] [--dry-run]
+    STRIPE_API_BASE=http://127.0.0.1:12111 python3 reconcile_subscriptions.py
+"""
+
+from datetime import datetime
+import argparse
+import sys
+import time
+
+from waitlist_api import ensure_db, get_db_connection, get_stripe, plan_for_price_id, stripe_gateway
+from stripe_gateway import StripeUnavailableError
+
+JOB_NAME = 'stripe_subscription_reconcile'
+
+# Columns compared between Stripe and the local row (order matters for the UPDATE below)
+SYNCED_FIELDS = (
+    'user_id', 'user_email', 'stripe_customer_id', 'stripe_price_id', 'plan_name',
+    'status', 'current_period_start', 'current_period_end', 'cancel_at_period_end'
+)
+
+
+def load_local_state(conn):
+    """Load local subscriptions (keyed by Stripe ID) and the email -> user_id map into memory"""
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT stripe_subscription_id, {', '.join(SYNCED_FIELDS)}
+        FROM subscriptions
+        WHERE stripe_subscription_id IS NOT NULL
+        ORDER BY id
+    ''')
+    # Later rows win, matching save_subscription which updates every row for the ID
+    local = {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+
+    cursor.execute('SELECT email, id FROM users ORDER BY id DESC')
+    users = {row[0]: row[1] for row in cursor.fetchall()}
+    return local, users
+
+
+def load_checkpoint(conn):
+    """Return the saved cursor for this job, or None"""
+    row = conn.execute('SELECT cursor FROM job_checkpoints WHERE job_name = ?', (JOB_NAME,)).fetchone()
+    return row[0] if row else None
+
+
+def lookup_customer_email(customer_id, customers):
+    """Email of a Stripe customer (memoized in `customers`); None if it has none or can't be fetched"""
+    if customer_id not in customers:
+        try:
+            customers[customer_id] = stripe_gateway.customer_retrieve(customer_id).get('email')
+        except StripeUnavailableError:
+            raise
+        except Exception as e:
+            print(f"  could not retrieve customer {customer_id}: {str(e)}")
+            customers[customer_id] = None
+    return customers[customer_id]
+
+
+def remote_values(subscription, local_row, users, customers):
+    """Build the SYNCED_FIELDS tuple for a Stripe subscription; None when no email is known for it"""
+    customer = subscription.customer
+    local_email = local_row[1] if local_row else None
+    if isinstance(customer, str):
+        customer_id = customer
+        # Customer not expanded: keep whatever email we already have, else look it up
+        email = local_email or lookup_customer_email(customer_id, customers)
+    else:
+        customer_id = customer.id
+        # Deleted customers have no email at all
+        email = customer.get('email') or local_email
+    if not email:
+        # user_email is NOT NULL; one such subscription mustn't abort the whole page
+        return None
+
+    price_id = subscription['items']['data'][0]['price']['id']
+    return (
+        users.get(email),
+        email,
+        customer_id,
+        price_id,
+        plan_for_price_id(price_id),
+        subscription.status,
+        datetime.fromtimestamp(subscription.current_period_start).isoformat(),
+        datetime.fromtimestamp(subscription.current_period_end).isoformat(),
+        1 if subscription.cancel_at_period_end else 0
+    )
+
+
+def apply_batch(conn, inserts, updates, cursor_id, scanned, changed):
+    """Write one page of changes and its checkpoint in a single transaction"""
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        if inserts:
+            cursor.executemany(f'''
+                INSERT INTO subscriptions (stripe_subscription_id, {', '.join(SYNCED_FIELDS)})
+                VALUES ({', '.join('?' * (len(SYNCED_FIELDS) + 1))})
+            ''', inserts)
+        if updates:
+            cursor.executemany(f'''
+                UPDATE subscriptions
+                SET {', '.join(f'{field} = ?' for field in SYNCED_FIELDS)},
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE stripe_subscription_id = ?
+            ''', updates)
+        cursor.execute('''
+            INSERT INTO job_checkpoints (job_name, cursor, rows_scanned, rows_changed, updated_at)
+            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(job_name) DO UPDATE SET
+                cursor = excluded.cursor,
+                rows_scanned = excluded.rows_scanned,
+                rows_changed = excluded.rows_changed,
+                updated_at = CURRENT_TIMESTAMP
+        ''', (JOB_NAME, cursor_id, scanned, changed))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def list_subscriptions(params):
+    """Every Stripe subscription after params['starting_after'], one gateway call per page"""
+    params = dict(params)
+    while True:
+        page = stripe_gateway.subscription_list(**params)
+        yield from page.data
+        if not page.has_more or not page.data:
+            return
+        params['starting_after'] = page.data[-1].id
+
+
+def reconcile(page_size=100, restart=False, dry_run=False):
+    """
+    Diff every Stripe subscription against the local table; returns a stats dict
+    Stops early (stats['interrupted']) when Stripe is unavailable; the next run resumes there
+    """
+    if get_stripe() is None:
+        raise RuntimeError('stripe package is not installed')
+
+    conn = get_db_connection()
+    # Transactions are managed explicitly in apply_batch
+    conn.isolation_level = None
+    started = time.perf_counter()
+    stats = {'scanned': 0, 'changed': 0, 'inserted': 0, 'updated': 0, 'skipped_no_email': 0, 'pages': 0,
+             'interrupted': None}
+    customers = {}
+
+    try:
+        local, users = load_local_state(conn)
+        starting_after = None if restart else load_checkpoint(conn)
+        if starting_after:
+            print(f"Resuming after {starting_after}")
+
+        params = {'limit': page_size, 'status': 'all', 'expand': ['data.customer']}
+        if starting_after:
+            params['starting_after'] = starting_after
+
+        inserts, updates, batch = [], [], 0
+        last_id = starting_after
+
+        def flush():
+            stats['pages'] += 1
+            stats['inserted'] += len(inserts)
+            stats['updated'] += len(updates)
+            stats['changed'] += len(inserts) + len(updates)
+            if not dry_run:
+                apply_batch(conn, inserts, updates, last_id, stats['scanned'], stats['changed'])
+            elapsed = time.perf_counter() - started
+            print(f"  page {stats['pages']}: scanned {stats['scanned']}, changed {stats['changed']} "
+                  f"({stats['scanned'] / elapsed:.0f} rows/s)")
+            inserts.clear()
+            updates.clear()
+
+        try:
+            # Through the gateway: per-call timeout, retries and the circuit breaker
+            for subscription in list_subscriptions(params):
+                local_row = local.get(subscription.id)
+                values = remote_values(subscription, local_row, users, customers)
+                stats['scanned'] += 1
+                batch += 1
+                last_id = subscription.id
+                if values is None:
+                    stats['skipped_no_email'] += 1
+                    print(f"  skipped {subscription.id}: no email for customer")
+                elif local_row is None:
+                    inserts.append((subscription.id,) + values)
+                elif values != local_row:
+                    updates.append(values + (subscription.id,))
+                if values is not None:
+                    local[subscription.id] = values
+
+                if batch >= page_size:
+                    flush()
+                    batch = 0
+        except StripeUnavailableError as e:
+            stats['interrupted'] = str(e)
+            print(f"Stripe unavailable, stopping after {last_id}: {str(e)}")
+
+        if batch or stats['pages'] == 0:
+            flush()
+
+        if not dry_run and not stats['interrupted']:
+            # Completed: the next run starts from the top again
+            conn.execute('UPDATE job_checkpoints SET cursor = NULL WHERE job_name = ?', (JOB_NAME,))
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - started
+    stats['seconds'] = elapsed
+    stats['scanned_per_second'] = stats['scanned'] / elapsed if elapsed else 0.0
+    stats['changed_per_second'] = stats['changed'] / elapsed if elapsed else 0.0
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reconcile local subscriptions against Stripe')
+    parser.add_argument('--page-size', type=int, default=100, help='Stripe page size and transaction batch size (max 100)')
+    parser.add_argument('--restart', action='store_true', help='ignore any saved checkpoint')
+    parser.add_argument('--dry-run', action='store_true', help='report drift without writing')
+    args = parser.parse_args()
+
+    ensure_db()
+    stats = reconcile(page_size=min(args.page_size, 100), restart=args.restart, dry_run=args.dry_run)
+
+    outcome = 'stopped' if stats['interrupted'] else 'complete'
+    print(f"Reconciliation {'(dry run) ' if args.dry_run else ''}{outcome} in {stats['seconds']:.2f}s")
+    print(f"  scanned:  {stats['scanned']} ({stats['scanned_per_second']:.0f} rows/s)")
+    print(f"  changed:  {stats['changed']} ({stats['changed_per_second']:.0f} rows/s)"
+          f" - {stats['inserted']} inserted, {stats['updated']} updated")
+    if stats['skipped_no_email']:
+        print(f"  skipped:  {stats['skipped_no_email']} with no customer email")
+    if stats['interrupted']:
+        print("  interrupted: Stripe was unavailable; rerun to resume from the checkpoint")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
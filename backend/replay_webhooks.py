@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Stripe Webhook Replay
+Re-applies a saved batch of Stripe events (e.g. `stripe events list` output or
+an NDJSON export) through the same resolve/write logic as the live webhook,
+without signature checks. Events are deduplicated by id and grouped per
+subscription in created order; whole groups are handed to worker threads, so one
+subscription's events always apply in order while different subscriptions run in
+parallel. Each worker batch is written in one transaction, with a savepoint per
+event so one bad event is counted as failed without undoing the rest; events
+with no customer email are skipped and counted. Writes log the same admin events
+as the live handlers (and fire the change_log triggers), so caches and the admin
+stream follow a replay. Stripe is only called when a payload doesn't already
+expand the customer/subscription it needs.
+
+Usage:
+    python3 replay_webhooks.py events.ndjson [--workers 8] [--batch-size 200] [--dry-run]
+    python3 replay_webhooks.py events.json --failed-out failed.ndjson
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import sqlite3
+import threading
+import time
+
+from waitlist_api import (
+    SUBSCRIPTION_EVENT_TYPES, ensure_db, get_stripe, publish_local_changes, resolve_subscription_event,
+    write_subscription, write_subscription_canceled, write_transactions
+)
+
+# Within one second (Stripe's created resolution) apply lifecycle events in this order
+EVENT_ORDER = {
+    'checkout.session.completed': 0,
+    'customer.subscription.created': 0,
+    'customer.subscription.updated': 1,
+    'customer.subscription.deleted': 2
+}
+
+
+def load_events(path):
+    """Read events from a JSON array, a Stripe list object ({"data": [...]}) or NDJSON"""
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    try:
+        document = json.loads(text)
+    except ValueError:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    if isinstance(document, dict):
+        return document['data'] if document.get('object') == 'list' else [document]
+    return document
+
+
+def subscription_key(event):
+    """Stripe subscription id an event applies to (None if it has none)"""
+    obj = event['data']['object']
+    if event['type'] == 'checkout.session.completed':
+        subscription = obj.get('subscription')
+        return subscription.get('id') if isinstance(subscription, dict) else subscription
+    return obj.get('id')
+
+
+def plan_batches(events, batch_size):
+    """Dedupe, group per subscription in order, and pack whole groups into batches"""
+    stats = {'read': len(events), 'duplicates': 0, 'ignored': 0}
+    seen = set()
+    groups = {}
+    for event in events:
+        if event.get('id') in seen:
+            stats['duplicates'] += 1
+            continue
+        seen.add(event.get('id'))
+        key = subscription_key(event) if event.get('type') in SUBSCRIPTION_EVENT_TYPES else None
+        if key is None:
+            stats['ignored'] += 1
+            continue
+        groups.setdefault(key, []).append(event)
+
+    batches, batch = [], []
+    for group in groups.values():
+        group.sort(key=lambda event: (event.get('created', 0), EVENT_ORDER[event['type']]))
+        batch.extend(group)
+        if len(batch) >= batch_size:
+            batches.append(batch)
+            batch = []
+    if batch:
+        batches.append(batch)
+    stats['subscriptions'] = len(groups)
+    return batches, stats
+
+
+class Replayer:
+    """Applies planned batches on a thread pool and keeps the run's counters"""
+
+    def __init__(self, stripe, dry_run=False):
+        self.stripe = stripe
+        self.dry_run = dry_run
+        # Customer id -> email, shared so each unexpanded customer is fetched once per run
+        self.customers = {}
+        self.failed = []
+        self.stats = {'applied': 0, 'skipped': 0, 'skipped_no_email': 0, 'failed': 0, 'batches': 0}
+        self.lock = threading.Lock()
+
+    def apply_batch(self, batch):
+        writes = []
+        failed = []
+        no_email = 0
+        for raw in batch:
+            try:
+                event = self.stripe.Event.construct_from(raw, self.stripe.api_key)
+                write = resolve_subscription_event(event, self.customers)
+            except Exception as e:
+                print(f"  event {raw.get('id')} ({raw.get('type')}) failed: {str(e)}")
+                failed.append(raw)
+                continue
+            if write is not None and write[0] == 'save' and not write[1]:
+                # subscriptions.user_email is NOT NULL: nothing to store it under
+                print(f"  skipped {raw.get('id')} ({raw.get('type')}): no email for customer")
+                no_email += 1
+            elif write is not None:
+                writes.append((raw, write))
+        skipped = len(batch) - len(failed) - len(writes) - no_email
+
+        if writes and not self.dry_run:
+            def apply(conn):
+                # Runs again on lock contention, so it rebuilds its result each time
+                cursor = conn.cursor()
+                applied, rejected = 0, []
+                for raw, write in writes:
+                    conn.execute('SAVEPOINT replay_event')
+                    try:
+                        if write[0] == 'cancel':
+                            write_subscription_canceled(cursor, write[1])
+                        else:
+                            write_subscription(cursor, *write[1:])
+                    except sqlite3.OperationalError:
+                        raise
+                    except Exception as e:
+                        conn.execute('ROLLBACK TO replay_event')
+                        print(f"  event {raw.get('id')} ({raw.get('type')}) failed to write: {str(e)}")
+                        rejected.append(raw)
+                    else:
+                        applied += 1
+                    conn.execute('RELEASE replay_event')
+                return applied, rejected
+            try:
+                # One IMMEDIATE transaction per batch, retried while the live server holds the lock
+                applied, rejected = write_transactions.run(apply, route='replay_webhooks')
+                failed.extend(rejected)
+                if applied:
+                    publish_local_changes()
+            except Exception as e:
+                print(f"  batch of {len(batch)} events failed to write: {str(e)}")
+                failed = batch
+                applied = no_email = skipped = 0
+        else:
+            applied = len(writes)
+
+        with self.lock:
+            self.stats['batches'] += 1
+            self.stats['applied'] += applied
+            self.stats['skipped'] += skipped
+            self.stats['skipped_no_email'] += no_email
+            self.stats['failed'] += len(failed)
+            self.failed.extend(failed)
+
+
+def replay(events, workers=8, batch_size=200, dry_run=False):
+    """Replay events; returns (stats dict, list of failed raw events)"""
+    stripe = get_stripe()
+    if stripe is None:
+        raise RuntimeError('stripe package is not installed')
+
+    started = time.perf_counter()
+    batches, stats = plan_batches(events, batch_size)
+    replayer = Replayer(stripe, dry_run)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='replay') as executor:
+        list(executor.map(replayer.apply_batch, batches))
+
+    elapsed = time.perf_counter() - started
+    stats.update(replayer.stats)
+    stats['customers_fetched'] = len(replayer.customers)
+    stats['seconds'] = elapsed
+    stats['events_per_second'] = (stats['read'] - stats['duplicates']) / elapsed if elapsed else 0.0
+    return stats, replayer.failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay exported Stripe webhook events into the local database')
+    parser.add_argument('path', help='JSON array, Stripe list object or NDJSON file of events')
+    parser.add_argument('--workers', type=int, default=8, help='parallel worker threads')
+    parser.add_argument('--batch-size', type=int, default=200, help='events per worker transaction')
+    parser.add_argument('--dry-run', action='store_true', help='resolve events without writing')
+    parser.add_argument('--failed-out', help='write events that failed as NDJSON (replayable)')
+    args = parser.parse_args()
+
+    ensure_db()
+    events = load_events(args.path)
+    stats, failed = replay(events, workers=max(args.workers, 1), batch_size=max(args.batch_size, 1),
+                           dry_run=args.dry_run)
+
+    if args.failed_out and failed:
+        with open(args.failed_out, 'w', encoding='utf-8') as f:
+            for event in failed:
+                f.write(json.dumps(event) + '\n')
+
+    print(f"Replay {'(dry run) ' if args.dry_run else ''}complete in {stats['seconds']:.2f}s "
+          f"({stats['events_per_second']:.0f} events/s)")
+    print(f"  read:     {stats['read']} ({stats['duplicates']} duplicates, {stats['ignored']} not subscription events)")
+    print(f"  applied:  {stats['applied']} across {stats['subscriptions']} subscriptions in {stats['batches']} batches")
+    print(f"  skipped:  {stats['skipped']}, no customer email: {stats['skipped_no_email']}, failed: {stats['failed']}"
+          f"{f' (written to {args.failed_out})' if args.failed_out and failed else ''}")
+    print(f"  customers fetched from Stripe: {stats['customers_fetched']}")
+
+
+if __name__ == '__main__':
+    main()
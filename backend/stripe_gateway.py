@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Stripe Gateway
+Wraps every Stripe API call made by the backend with a per-operation timeout,
+bounded retries with jittered backoff, hedged reads and a shared circuit breaker,
+so a slow or failing Stripe region fails fast instead of tying up every worker.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from collections import deque
+import random
+import threading
+import time
+import uuid
+
+# Seconds allowed per attempt (including time queued for a gateway thread)
+DEFAULT_TIMEOUTS = {
+    'customer.list': 4.0,
+    'customer.create': 6.0,
+    'customer.retrieve': 4.0,
+    'subscription.list': 15.0,
+    'subscription.retrieve': 4.0,
+    'checkout.session.create': 8.0
+}
+
+# Read-only operations may be hedged (a duplicate attempt is raced against a slow one)
+HEDGEABLE = {'customer.list', 'customer.retrieve', 'subscription.list', 'subscription.retrieve'}
+
+
+class StripeUnavailableError(Exception):
+    """Stripe could not be reached in time (circuit open, timeouts or server errors)"""
+
+
+class StripeTimeoutError(StripeUnavailableError):
+    """A Stripe call exceeded its per-operation timeout"""
+
+
+class CircuitOpenError(StripeUnavailableError):
+    """The circuit breaker is open; the call was rejected without contacting Stripe"""
+
+
+def parse_timeouts(spec):
+    """Parse 'op=seconds,op=seconds' overrides on top of DEFAULT_TIMEOUTS"""
+    timeouts = dict(DEFAULT_TIMEOUTS)
+    for item in (spec or '').split(','):
+        if '=' in item:
+            operation, seconds = item.split('=', 1)
+            timeouts[operation.strip()] = float(seconds)
+    return timeouts
+
+
+class CircuitBreaker:
+    """
+    Rolling-window breaker: opens when the failure rate over the last `window`
+    calls reaches `error_rate` (after at least `min_calls`), rejects calls for
+    `cooldown` seconds, then lets a single probe through (half-open).
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, error_rate=0.5, window=20, min_calls=10, cooldown=30.0):
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.outcomes = deque(maxlen=window)
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.transitions = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    return False
+                self.state = self.HALF_OPEN
+                self.transitions += 1
+            if self.state == self.HALF_OPEN:
+                if self.probe_in_flight:
+                    return False
+                self.probe_in_flight = True
+            return True
+
+    def is_open(self):
+        with self.lock:
+            return self.state == self.OPEN
+
+    def record(self, success):
+        with self.lock:
+            if self.state == self.HALF_OPEN:
+                self.probe_in_flight = False
+                if success:
+                    self.state = self.CLOSED
+                    self.outcomes.clear()
+                else:
+                    self.state = self.OPEN
+                    self.opened_at = time.monotonic()
+                self.transitions += 1
+                return
+
+            self.outcomes.append(success)
+            failures = self.outcomes.count(False)
+            if (self.state == self.CLOSED and len(self.outcomes) >= self.min_calls
+                    and failures / len(self.outcomes) >= self.error_rate):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.transitions += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'state': self.state,
+                'window_calls': len(self.outcomes),
+                'window_failures': self.outcomes.count(False),
+                'transitions': self.transitions
+            }
+
+
+class StripeGateway:
+    """Single entry point for Stripe calls; see module docstring"""
+
+    def __init__(self, load_sdk, timeouts=None, max_retries=2, backoff_base=0.1, backoff_cap=2.0,
+                 hedge_after=None, max_concurrency=16, breaker=None, latency=None):
+        """
+        load_sdk: callable returning the stripe module (lets callers import it lazily)
+        hedge_after: seconds before a duplicate attempt is raced against a slow read (None disables)
+        latency: optional object with record(key, millis) for per-operation latency
+        """
+        self.load_sdk = load_sdk
+        self.timeouts = timeouts or dict(DEFAULT_TIMEOUTS)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = latency
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='stripe-gateway')
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    # ----- typed operations used by the API -----
+
+    def customer_list(self, **params):
+        return self.call('customer.list', lambda sdk, opts: sdk.Customer.list(**params))
+
+    def customer_create(self, **params):
+        return self.call('customer.create', lambda sdk, opts: sdk.Customer.create(**params, **opts))
+
+    def customer_retrieve(self, customer_id):
+        return self.call('customer.retrieve', lambda sdk, opts: sdk.Customer.retrieve(customer_id))
+
+    def subscription_list(self, **params):
+        return self.call('subscription.list', lambda sdk, opts: sdk.Subscription.list(**params))
+
+    def subscription_retrieve(self, subscription_id, **params):
+        return self.call('subscription.retrieve', lambda sdk, opts: sdk.Subscription.retrieve(subscription_id, **params))
+
+    def checkout_session_create(self, **params):
+        return self.call('checkout.session.create', lambda sdk, opts: sdk.checkout.Session.create(**params, **opts))
+
+    # ----- machinery -----
+
+    def _count(self, operation, outcome):
+        with self.lock:
+            per_op = self.counters.setdefault(operation, {})
+            per_op[outcome] = per_op.get(outcome, 0) + 1
+
+    def _is_retryable(self, error):
+        """Connection problems, timeouts, rate limits and 5xx responses are worth retrying"""
+        if isinstance(error, StripeTimeoutError):
+            return True
+        sdk_error = getattr(self.load_sdk(), 'error', None)
+        if sdk_error is None:
+            return False
+        if isinstance(error, (sdk_error.APIConnectionError, sdk_error.RateLimitError)):
+            return True
+        if isinstance(error, sdk_error.StripeError):
+            status = getattr(error, 'http_status', None)
+            return status is not None and status >= 500
+        return False
+
+    def _attempt(self, operation, fn, opts):
+        """Run one attempt (hedged for reads) and enforce the operation timeout"""
+        sdk = self.load_sdk()
+        timeout = self.timeouts.get(operation, 10.0)
+        futures = [self.executor.submit(fn, sdk, opts)]
+        deadline = time.monotonic() + timeout
+
+        if self.hedge_after is not None and operation in HEDGEABLE and self.hedge_after < timeout:
+            done, _ = wait(futures, timeout=self.hedge_after)
+            if not done:
+                self._count(operation, 'hedged')
+                futures.append(self.executor.submit(fn, sdk, opts))
+
+        error = None
+        pending = set(futures)
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        if error is not None and not pending:
+            raise error
+        # Abandoned attempts finish in the background, bounded by the HTTP client timeout
+        raise StripeTimeoutError(f'{operation} timed out after {timeout:.1f}s')
+
+    def call(self, operation, fn):
+        """Execute fn(sdk, request_opts) under the breaker, timeout and retry policy"""
+        if not self.breaker.allow():
+            self._count(operation, 'short_circuited')
+            raise CircuitOpenError(f'Stripe circuit open; {operation} rejected')
+
+        # One idempotency key across retries makes retried POSTs safe
+        opts = {'idempotency_key': str(uuid.uuid4())}
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                result = self._attempt(operation, fn, opts)
+            except Exception as error:
+                retryable = self._is_retryable(error)
+                if not retryable:
+                    # Client errors (bad params, card declined) say nothing about Stripe's health
+                    self.breaker.record(True)
+                    self._count(operation, 'client_error')
+                    raise
+                self._count(operation, 'timeout' if isinstance(error, StripeTimeoutError) else 'error')
+                if attempt >= self.max_retries or self.breaker.is_open():
+                    self.breaker.record(False)
+                    self._record_latency(operation, started)
+                    if isinstance(error, StripeUnavailableError):
+                        raise
+                    raise StripeUnavailableError(f'{operation} failed: {error}') from error
+                attempt += 1
+                self._count(operation, 'retried')
+                # Full jitter: sleep uniformly in [0, min(cap, base * 2^attempt)]
+                time.sleep(random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt))))
+                continue
+            self.breaker.record(True)
+            self._count(operation, 'success')
+            self._record_latency(operation, started)
+            return result
+
+    def _record_latency(self, operation, started):
+        if self.latency is not None:
+            self.latency.record(operation, (time.perf_counter() - started) * 1000)
+
+    def stats(self):
+        """Breaker state, per-operation outcome counters and (if configured) latency"""
+        with self.lock:
+            counters = {operation: dict(values) for operation, values in self.counters.items()}
+        return {
+            'breaker': self.breaker.snapshot(),
+            'timeouts': self.timeouts,
+            'max_retries': self.max_retries,
+            'operations': counters,
+            'latency': self.latency.summary() if self.latency is not None else {}
+        }
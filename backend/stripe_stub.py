@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Local Stripe API Stub
+Serves a small, in-memory subset of the Stripe REST API so the backend tools
+can be exercised without network access or a Stripe account.
+
+Point the backend at it with STRIPE_API_BASE=http://127.0.0.1:12111
+Faults can be changed while running:
+    curl -X POST localhost:12111/__stub__/faults -d '{"latency_ms": 500, "error_rate": 0.3}'
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import argparse
+import json
+import random
+import threading
+import time
+
+DEFAULT_PRICE_IDS = [
+    'price_1SPlRyBTJt2ybYLKPxnE2bKY',
+    'price_1SPlSrBTJt2ybYLKzrlEToNK',
+    'price_1SPlTXBTJt2ybYLKlMMyEwdb'
+]
+
+STATUSES = ['active', 'active', 'active', 'trialing', 'past_due', 'canceled']
+
+
+class StubState:
+    """In-memory Stripe objects, kept in creation order (newest first, like Stripe lists)"""
+
+    def __init__(self, subscriptions=0, seed=0, price_ids=None):
+        self.lock = threading.Lock()
+        self.customers = {}
+        self.subscriptions = {}
+        self.subscription_order = []
+        self.sessions = {}
+        self.counter = 0
+        rng = random.Random(seed)
+        price_ids = price_ids or DEFAULT_PRICE_IDS
+        now = int(time.time())
+
+        for i in range(subscriptions):
+            customer = self.create_customer(f'user{i}@example.com')
+            start = now - rng.randint(0, 60) * 86400
+            sub_id = f'sub_stub_{i:08d}'
+            self.subscriptions[sub_id] = {
+                'id': sub_id,
+                'object': 'subscription',
+                'customer': customer['id'],
+                'status': rng.choice(STATUSES),
+                'current_period_start': start,
+                'current_period_end': start + 30 * 86400,
+                'cancel_at_period_end': rng.random() < 0.1,
+                'items': {
+                    'object': 'list',
+                    'url': f'/v1/subscription_items?subscription={sub_id}',
+                    'has_more': False,
+                    'data': [{
+                        'id': f'si_stub_{i:08d}',
+                        'object': 'subscription_item',
+                        'price': {'id': rng.choice(price_ids), 'object': 'price'}
+                    }]
+                }
+            }
+            self.subscription_order.insert(0, sub_id)
+
+    def next_id(self, prefix):
+        self.counter += 1
+        return f'{prefix}_stub_{self.counter:08d}'
+
+    def create_customer(self, email):
+        customer = {
+            'id': self.next_id('cus'),
+            'object': 'customer',
+            'email': email,
+            'created': int(time.time())
+        }
+        self.customers[customer['id']] = customer
+        return customer
+
+    def expand_subscription(self, subscription, expand):
+        if 'customer' in expand or 'data.customer' in expand:
+            subscription = dict(subscription)
+            subscription['customer'] = self.customers.get(subscription['customer'], subscription['customer'])
+        return subscription
+
+
+class FaultConfig:
+    """Latency and error injection applied to every API request"""
+
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0, hang_rate=0.0, hang_ms=30000, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.hang_rate = hang_rate
+        self.hang_ms = hang_ms
+        self.rng = random.Random(seed)
+
+    def apply(self):
+        """Sleep for the configured latency; return an HTTP error status to inject, or None"""
+        roll = self.rng.random()
+        if roll < self.hang_rate:
+            time.sleep(self.hang_ms / 1000.0)
+        delay = self.latency_ms + (self.rng.uniform(0, self.jitter_ms) if self.jitter_ms else 0)
+        if delay:
+            time.sleep(delay / 1000.0)
+        if self.rng.random() < self.error_rate:
+            return 500
+        return None
+
+
+def _flatten(params):
+    """Collapse parse_qs output and gather Stripe's expand[N] encoding into one list"""
+    flat = {}
+    expand = []
+    for key, values in params.items():
+        if key == 'expand' or key.startswith('expand['):
+            expand.extend(values)
+        else:
+            flat[key] = values[0]
+    flat['expand'] = expand
+    return flat
+
+
+class StripeStubHandler(BaseHTTPRequestHandler):
+    """Routes a handful of /v1 endpoints onto StubState"""
+
+    state = None
+    faults = None
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; don't let Nagle hold the body back
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _not_found(self, path):
+        self._send(404, {'error': {
+            'type': 'invalid_request_error',
+            'message': f'No such resource: {path}'
+        }})
+
+    def _params(self):
+        parsed = urlparse(self.path)
+        params = parse_qs(parsed.query)
+        if self.command == 'POST':
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length).decode('utf-8') if length else ''
+            params.update(parse_qs(body))
+        return parsed.path.rstrip('/'), _flatten(params)
+
+    def _configure_faults(self):
+        """POST /__stub__/faults with a JSON body of FaultConfig fields to change faults at runtime"""
+        length = int(self.headers.get('Content-Length') or 0)
+        updates = json.loads(self.rfile.read(length) or b'{}')
+        if self.faults is None:
+            type(self).faults = FaultConfig()
+        for key, value in updates.items():
+            if key in ('latency_ms', 'jitter_ms', 'error_rate', 'hang_rate', 'hang_ms'):
+                setattr(self.faults, key, float(value))
+        self._send(200, {key: getattr(self.faults, key) for key in
+                         ('latency_ms', 'jitter_ms', 'error_rate', 'hang_rate', 'hang_ms')})
+
+    def _handle(self):
+        if self.path == '/__stub__/faults' and self.command == 'POST':
+            return self._configure_faults()
+
+        path, params = self._params()
+
+        injected = self.faults.apply() if self.faults else None
+        if injected:
+            return self._send(injected, {'error': {
+                'type': 'api_error',
+                'message': 'Injected fault from stripe_stub'
+            }})
+
+        state = self.state
+        parts = path.split('/')[2:] if path.startswith('/v1/') else []
+
+        with state.lock:
+            if parts == ['subscriptions'] and self.command == 'GET':
+                return self._send(200, self._list_subscriptions(params))
+            if len(parts) == 2 and parts[0] == 'subscriptions' and self.command == 'GET':
+                subscription = state.subscriptions.get(parts[1])
+                if not subscription:
+                    return self._not_found(path)
+                return self._send(200, state.expand_subscription(subscription, params['expand']))
+            if parts == ['customers'] and self.command == 'GET':
+                email = params.get('email')
+                limit = int(params.get('limit', 10))
+                data = [c for c in state.customers.values() if not email or c['email'] == email][:limit]
+                return self._send(200, {'object': 'list', 'url': '/v1/customers', 'has_more': False, 'data': data})
+            if parts == ['customers'] and self.command == 'POST':
+                return self._send(200, state.create_customer(params.get('email')))
+            if len(parts) == 2 and parts[0] == 'customers' and self.command == 'GET':
+                customer = state.customers.get(parts[1])
+                if not customer:
+                    return self._not_found(path)
+                return self._send(200, customer)
+            if parts == ['checkout', 'sessions'] and self.command == 'POST':
+                if params.get('customer') and params['customer'] not in state.customers:
+                    return self._send(400, {'error': {
+                        'type': 'invalid_request_error',
+                        'code': 'resource_missing',
+                        'param': 'customer',
+                        'message': f"No such customer: '{params['customer']}'"
+                    }})
+                session_id = state.next_id('cs')
+                session = {
+                    'id': session_id,
+                    'object': 'checkout.session',
+                    'customer': params.get('customer'),
+                    'mode': params.get('mode'),
+                    'url': f'https://checkout.stripe.test/pay/{session_id}'
+                }
+                state.sessions[session_id] = session
+                return self._send(200, session)
+
+        return self._not_found(path)
+
+    def _list_subscriptions(self, params):
+        state = self.state
+        limit = min(int(params.get('limit', 10)), 100)
+        status = params.get('status')
+        order = state.subscription_order
+
+        start = 0
+        if params.get('starting_after'):
+            try:
+                start = order.index(params['starting_after']) + 1
+            except ValueError:
+                start = len(order)
+
+        data = []
+        index = start
+        while index < len(order) and len(data) < limit:
+            subscription = state.subscriptions[order[index]]
+            index += 1
+            if status and status != 'all' and subscription['status'] != status:
+                continue
+            data.append(state.expand_subscription(subscription, params['expand']))
+
+        return {
+            'object': 'list',
+            'url': '/v1/subscriptions',
+            'has_more': index < len(order),
+            'data': data
+        }
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def do_DELETE(self):
+        self._handle()
+
+
+def make_server(host='127.0.0.1', port=12111, state=None, faults=None):
+    """Build (but do not start) a threaded stub server"""
+    handler = type('BoundStripeStubHandler', (StripeStubHandler,), {
+        'state': state or StubState(),
+        'faults': faults
+    })
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local Stripe API stub')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=12111)
+    parser.add_argument('--subscriptions', type=int, default=1000, help='number of seeded subscriptions')
+    parser.add_argument('--seed', type=int, default=0, help='random seed for generated data')
+    parser.add_argument('--latency-ms', type=float, default=0, help='fixed latency added to every request')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='random extra latency (uniform 0..N ms)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with HTTP 500')
+    parser.add_argument('--hang-rate', type=float, default=0.0, help='fraction of requests that stall for --hang-ms')
+    parser.add_argument('--hang-ms', type=float, default=30000)
+    args = parser.parse_args()
+
+    state = StubState(subscriptions=args.subscriptions, seed=args.seed)
+    faults = FaultConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        hang_rate=args.hang_rate,
+        hang_ms=args.hang_ms
+    )
+    server = make_server(args.host, args.port, state, faults)
+    print(f"Stripe stub listening on http://{args.host}:{args.port} with {args.subscriptions} subscriptions")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Waitlist Spool Recovery Tests
+Torn tails, corrupt records and replay after a restart, first on the spool
+file itself and then through drain_waitlist_spool against a scratch database.
+
+Usage:
+    python3 -m pytest backend/tests
+    python3 -m unittest discover -s backend/tests
+"""
+
+import importlib
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from waitlist_spool import Spool, encode_record  # noqa: E402
+
+
+def submission(n):
+    return {
+        'name': f'Spooled {n}', 'email': f'spooled{n}@example.com', 'product': 'pro',
+        'received_at': '2026-01-01 00:00:00', 'user_id': None, 'cognito_user_id': None
+    }
+
+
+class SpoolRecoveryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'spool.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def append_all(self, records):
+        spool = Spool(self.path, fsync_window_ms=0)
+        for record in records:
+            spool.append(record)
+        return spool
+
+    def test_torn_tail_is_cut_on_reopen(self):
+        records = [submission(n) for n in range(5)]
+        self.append_all(records)
+        intact_size = os.path.getsize(self.path)
+        torn = encode_record(submission(99))[:-7]
+        with open(self.path, 'ab') as f:
+            f.write(torn)
+
+        spool = Spool(self.path)
+        self.assertEqual(spool.counters['torn_bytes_discarded'], len(torn))
+        self.assertEqual(os.path.getsize(self.path), intact_size)
+        self.assertEqual(spool.pending_records(), (5, intact_size))
+        batch, offset = spool.read_batch()
+        self.assertEqual(batch, records)
+        self.assertEqual(offset, intact_size)
+
+    def test_appends_after_torn_tail_start_on_a_fresh_line(self):
+        self.append_all([submission(0)])
+        with open(self.path, 'ab') as f:
+            f.write(encode_record(submission(1))[:10])
+
+        spool = Spool(self.path, fsync_window_ms=0)
+        spool.append(submission(2))
+        batch, _ = spool.read_batch()
+        self.assertEqual(batch, [submission(0), submission(2)])
+
+    def test_corrupt_record_is_skipped(self):
+        self.append_all([submission(n) for n in range(3)])
+        with open(self.path, 'rb') as f:
+            lines = f.readlines()
+        lines[1] = lines[1].replace(b'Spooled 1', b'Spooled X')
+        with open(self.path, 'wb') as f:
+            f.writelines(lines)
+
+        spool = Spool(self.path)
+        batch, offset = spool.read_batch()
+        self.assertEqual(batch, [submission(0), submission(2)])
+        self.assertEqual(spool.counters['corrupt_records'], 1)
+        self.assertEqual(offset, os.path.getsize(self.path))
+
+    def test_checkpoint_survives_restart(self):
+        spool = self.append_all([submission(n) for n in range(4)])
+        batch, offset = spool.read_batch(limit=2)
+        spool.commit(offset, len(batch))
+
+        spool = Spool(self.path)
+        self.assertTrue(spool.has_pending())
+        batch, _ = spool.read_batch()
+        self.assertEqual(batch, [submission(2), submission(3)])
+
+    def test_uncommitted_batch_replays_after_restart(self):
+        records = [submission(n) for n in range(3)]
+        spool = self.append_all(records)
+        batch, _ = spool.read_batch()
+        self.assertEqual(batch, records)
+        # Crash between the database commit and the checkpoint: nothing was committed
+
+        spool = Spool(self.path)
+        with spool.draining() as draining:
+            self.assertTrue(draining)
+            batch, offset = spool.read_batch()
+        self.assertEqual(batch, records)
+        spool.commit(offset, len(batch))
+        self.assertFalse(spool.has_pending())
+        self.assertEqual(os.path.getsize(self.path), 0)
+
+    def test_only_one_drainer_at_a_time(self):
+        spool = self.append_all([submission(0)])
+        other = Spool(self.path)
+        with spool.draining() as draining:
+            self.assertTrue(draining)
+            with other.draining() as other_draining:
+                self.assertFalse(other_draining)
+
+
+class DrainRecoveryTest(unittest.TestCase):
+    """drain_waitlist_spool against a scratch database"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.mkdtemp()
+        os.environ['WAITLIST_DB_PATH'] = os.path.join(cls.dir, 'waitlist.db')
+        os.environ['ARCHIVE_DB_PATH'] = os.path.join(cls.dir, 'waitlist_archive.db')
+        os.environ['WAITLIST_SPOOL_PATH'] = os.path.join(cls.dir, 'waitlist_spool.log')
+        os.environ['READ_SNAPSHOT_MAX_STALENESS_MS'] = '0'
+        os.environ.setdefault('SLOW_QUERY_MS', '-1')
+        cls.api = importlib.import_module('waitlist_api')
+        cls.api.ensure_db()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dir)
+
+    def setUp(self):
+        conn = sqlite3.connect(self.api.DB_PATH)
+        conn.execute('DELETE FROM waitlist')
+        conn.commit()
+        conn.close()
+        archive = sqlite3.connect(self.api.ARCHIVE_DB_PATH)
+        archive.execute('DELETE FROM waitlist')
+        archive.commit()
+        archive.close()
+
+    def reopen_spool(self):
+        """A fresh Spool on the same files, as after a process restart"""
+        self.api._waitlist_spool = Spool(self.api.WAITLIST_SPOOL_PATH)
+        return self.api._waitlist_spool
+
+    def waitlist_emails(self):
+        conn = sqlite3.connect(self.api.DB_PATH)
+        try:
+            return sorted(row[0] for row in conn.execute('SELECT email FROM waitlist'))
+        finally:
+            conn.close()
+
+    def test_replay_after_restart_inserts_each_submission_once(self):
+        spool = self.reopen_spool()
+        for n in range(3):
+            spool.append(submission(n))
+        with open(self.api.WAITLIST_SPOOL_PATH, 'ab') as f:
+            f.write(encode_record(submission(3))[:-5])
+        spool_bytes = open(self.api.WAITLIST_SPOOL_PATH, 'rb').read()
+
+        self.reopen_spool()
+        self.assertEqual(self.api.drain_waitlist_spool(), 3)
+        expected = [submission(n)['email'] for n in range(3)]
+        self.assertEqual(self.waitlist_emails(), expected)
+
+        # Crash between the database commit and the checkpoint: the same records come back
+        with open(self.api.WAITLIST_SPOOL_PATH, 'wb') as f:
+            f.write(spool_bytes)
+        os.unlink(self.api._waitlist_spool.offset_path)
+        spool = self.reopen_spool()
+        self.assertEqual(spool.pending_records()[0], 3)
+        self.assertEqual(self.api.drain_waitlist_spool(), 0)
+        self.assertEqual(self.waitlist_emails(), expected)
+        self.assertFalse(spool.has_pending())
+
+    def test_archived_email_is_not_inserted_again(self):
+        archived = submission(0)
+        archive = sqlite3.connect(self.api.ARCHIVE_DB_PATH)
+        archive.execute(
+            'INSERT INTO waitlist (name, email, product, created_at) VALUES (?, ?, ?, ?)',
+            (archived['name'], archived['email'], archived['product'], '2024-01-01 00:00:00')
+        )
+        archive.commit()
+        archive.close()
+
+        spool = self.reopen_spool()
+        spool.append(archived)
+        spool.append(submission(1))
+        self.assertEqual(self.api.drain_waitlist_spool(), 1)
+        self.assertEqual(self.waitlist_emails(), [submission(1)['email']])
+        self.assertFalse(spool.has_pending())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,25 +4,81 @@ Waitlist API Server
 Handles waitlist form submissions and stores data in SQLite database
 """
 
-from flask import Flask, request, jsonify, render_template_string
+import time
+IMPORT_STARTED = time.perf_counter()  # Start of the startup-time report (see STARTUP_TIMINGS)
+
+from flask import Flask, Response, request, jsonify, render_template_string, has_request_context, g
 from flask_cors import CORS
+from collections import deque
+from functools import wraps
+from pathlib import Path
+import hmac
+import json
 import sqlite3
 import os
-from datetime import datetime
-try:
-    import stripe
-except ImportError:
-    stripe = None  # Stripe is optional
+import queue
+import secrets
+import threading
+from datetime import datetime, timedelta
+from db_backup import backup_database, prune_snapshots, list_snapshots
+from json_provider import FastJSONProvider, query_json_rows
+import queries
+from change_feed import ChangeFeed, KeyedCache
+from db_writes import RetryPolicy, WriteBusyError, WriteTransactions
+from event_stream import EventBus, EventStreamServer
+from waitlist_spool import Spool
+from query_log import QueryLog, TimedConnection
+from profiler import SamplingProfiler, ProfilerBusyError, render_flamegraph
+from stripe_gateway import StripeGateway, CircuitBreaker, StripeUnavailableError, parse_timeouts
 
 app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
+app.json = FastJSONProvider(app)  # orjson when installed, stdlib otherwise
+# The admin event stream is only readable cross-origin from the portal (unset = same-origin only)
+ADMIN_EVENTS_ORIGIN = os.environ.get('ADMIN_EVENTS_ORIGIN', '')
+CORS(app, resources={  # Enable CORS for all routes except the admin event stream
+    r'/api/admin/events': {'origins': [ADMIN_EVENTS_ORIGIN] if ADMIN_EVENTS_ORIGIN else []},
+    r'/*': {'origins': '*'}
+})
+
+# Startup cost breakdown, reported at the first request and by /api/admin/startup
+STARTUP_TIMINGS = {
+    'import_ms': None,
+    'init_ms': None,
+    'init_db_ran': None,
+    'first_request_ms': None,
+    'stripe_import_ms': None
+}
 
 # Stripe configuration (optional)
-if stripe:
-    stripe.api_key = os.environ.get('STRIPE_SECRET_KEY', '')
-    STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET', '')
-else:
-    STRIPE_WEBHOOK_SECRET = ''
+STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET', '')
+_stripe = None
+_stripe_loaded = False
+_stripe_lock = threading.Lock()
+
+def get_stripe():
+    """Import and configure the Stripe SDK on first use (None if it isn't installed)"""
+    global _stripe, _stripe_loaded
+    if _stripe_loaded:
+        return _stripe
+    with _stripe_lock:
+        if _stripe_loaded:
+            return _stripe
+        started = time.perf_counter()
+        try:
+            import stripe
+        except ImportError:
+            stripe = None  # Stripe is optional
+        if stripe:
+            stripe.api_key = os.environ.get('STRIPE_SECRET_KEY', '')
+            if os.environ.get('STRIPE_API_BASE'):
+                # Point at a local stub (see stripe_stub.py) for development and load tests
+                stripe.api_base = os.environ['STRIPE_API_BASE']
+            # The gateway abandons slow attempts; this bounds how long they linger in the background
+            stripe.default_http_client = stripe.http_client.RequestsClient(timeout=max(STRIPE_TIMEOUTS.values()))
+        STARTUP_TIMINGS['stripe_import_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        _stripe = stripe
+        _stripe_loaded = True
+        return _stripe
 
 # Subscription plans (price IDs from Stripe)
 PLANS = {
@@ -52,14 +108,95 @@ PLANS = {
     }
 }
 
+def plan_for_price_id(price_id):
+    """Map a Stripe price ID to a plan key (defaults to 'pro' for unknown prices)"""
+    for key, plan in PLANS.items():
+        if plan.get('stripe_price_id') == price_id:
+            return key
+    return 'pro'
+
+# Subscription expiry sweeper (seconds between sweeps; 0 disables it)
+SUBSCRIPTION_SWEEP_INTERVAL = int(os.environ.get('SUBSCRIPTION_SWEEP_INTERVAL', '300'))
+SUBSCRIPTION_SWEEP_BATCH_SIZE = int(os.environ.get('SUBSCRIPTION_SWEEP_BATCH_SIZE', '500'))
+# How long a non-canceling subscription may sit past its period end (waiting on a renewal webhook)
+SUBSCRIPTION_RENEWAL_GRACE = int(os.environ.get('SUBSCRIPTION_RENEWAL_GRACE', str(3 * 24 * 3600)))
+
+# Stripe customers created in the background after user sync, so checkout is one Stripe call
+STRIPE_PREPROVISION_CUSTOMERS = os.environ.get('STRIPE_PREPROVISION_CUSTOMERS', '1') == '1'
+# Users without a customer queued at startup (catches syncs lost to a restart)
+STRIPE_PREPROVISION_BACKFILL = int(os.environ.get('STRIPE_PREPROVISION_BACKFILL', '500'))
+
 # Database configuration
-DB_PATH = os.path.join(os.path.dirname(__file__), 'waitlist.db')
+DB_PATH = os.environ.get('WAITLIST_DB_PATH', os.path.join(os.path.dirname(__file__), 'waitlist.db'))
+
+# Cold storage for old waitlist entries and canceled subscriptions (ATTACHed as 'archive')
+ARCHIVE_DB_PATH = os.environ.get('ARCHIVE_DB_PATH', os.path.join(os.path.dirname(DB_PATH), 'waitlist_archive.db'))
+ARCHIVE_INTERVAL = int(os.environ.get('ARCHIVE_INTERVAL', str(24 * 3600)))  # 0 disables the job
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', '1000'))
+WAITLIST_ARCHIVE_AFTER_DAYS = int(os.environ.get('WAITLIST_ARCHIVE_AFTER_DAYS', '365'))
+SUBSCRIPTION_ARCHIVE_AFTER_DAYS = int(os.environ.get('SUBSCRIPTION_ARCHIVE_AFTER_DAYS', '90'))
+
+# Online backups (seconds between snapshots; 0 disables the scheduler)
+BACKUP_INTERVAL = int(os.environ.get('BACKUP_INTERVAL', str(6 * 3600)))
+BACKUP_DIR = os.environ.get('BACKUP_DIR', os.path.join(os.path.dirname(__file__), 'backups'))
+BACKUP_RETENTION = int(os.environ.get('BACKUP_RETENTION', '8'))
+BACKUP_COMPRESS = os.environ.get('BACKUP_COMPRESS', '1') == '1'
+BACKUP_STEP_PAGES = int(os.environ.get('BACKUP_STEP_PAGES', '256'))
+BACKUP_STEP_SLEEP_MS = float(os.environ.get('BACKUP_STEP_SLEEP_MS', '5'))
+
+# Read lane: GET routes use read-only connections so admin dumps never hold up writers
+READ_LANE_ENABLED = os.environ.get('READ_LANE_ENABLED', '1') == '1'
+# How long (ms) a read connection may keep serving the same snapshot; 0 = fresh snapshot per request
+READ_SNAPSHOT_MAX_STALENESS_MS = float(os.environ.get('READ_SNAPSHOT_MAX_STALENESS_MS', '0'))
+READ_LANE_POOL_SIZE = int(os.environ.get('READ_LANE_POOL_SIZE', '8'))
+READ_METHODS = ('GET', 'HEAD')
+
+# Write transactions: SQLite busy wait per attempt, then jittered retries until the deadline (then 503)
+WRITE_BUSY_TIMEOUT_MS = float(os.environ.get('WRITE_BUSY_TIMEOUT_MS', '100'))
+WRITE_DEADLINE_MS = float(os.environ.get('WRITE_DEADLINE_MS', '5000'))
+WRITE_BACKOFF_CAP_MS = float(os.environ.get('WRITE_BACKOFF_CAP_MS', '100'))
+
+# Admin event stream (GET /api/admin/events): event_log rows kept for Last-Event-ID resume,
+# events buffered per client before a slow client is dropped, and the single-threaded SSE
+# server's address (loopback: nginx proxies to it; 0 = only the Flask route, which holds a
+# worker thread per client)
+EVENT_LOG_RETENTION = int(os.environ.get('EVENT_LOG_RETENTION', '10000'))
+EVENT_STREAM_BUFFER = int(os.environ.get('EVENT_STREAM_BUFFER', '256'))
+EVENT_STREAM_HOST = os.environ.get('EVENT_STREAM_HOST', '127.0.0.1')
+EVENT_STREAM_PORT = int(os.environ.get('EVENT_STREAM_PORT', '5001'))
+EVENT_STREAM_MAX_CLIENTS = int(os.environ.get('EVENT_STREAM_MAX_CLIENTS', '1000'))
+EVENT_STREAM_HEARTBEAT = float(os.environ.get('EVENT_STREAM_HEARTBEAT', '15'))
+# Local commits wake the dispatcher; this poll picks up events other processes logged
+EVENT_STREAM_POLL_MS = float(os.environ.get('EVENT_STREAM_POLL_MS', '500'))
+EVENT_STREAM_MAX_THREADED = int(os.environ.get('EVENT_STREAM_MAX_THREADED', '8'))
+# Lifetime of the single-use ?ticket= an EventSource connects with (it can't send headers)
+EVENT_STREAM_TICKET_TTL = float(os.environ.get('EVENT_STREAM_TICKET_TTL', '30'))
+
+# Waitlist spool: submissions the database can't take are fsynced to an append-only file
+# (answered 202) and replayed by a background drainer once writes succeed again. Only
+# processes running the drainer spool (a drain interval <= 0 turns spooling off)
+WAITLIST_SPOOL_ENABLED = os.environ.get('WAITLIST_SPOOL_ENABLED', '1') == '1'
+WAITLIST_SPOOL_PATH = os.environ.get('WAITLIST_SPOOL_PATH', os.path.join(os.path.dirname(DB_PATH), 'waitlist_spool.log'))
+WAITLIST_SPOOL_FSYNC_WINDOW_MS = float(os.environ.get('WAITLIST_SPOOL_FSYNC_WINDOW_MS', '2'))
+WAITLIST_SPOOL_MAX_BYTES = int(os.environ.get('WAITLIST_SPOOL_MAX_BYTES', str(64 * 1024 * 1024)))
+WAITLIST_SPOOL_DRAIN_INTERVAL = float(os.environ.get('WAITLIST_SPOOL_DRAIN_INTERVAL', '2'))
+WAITLIST_SPOOL_BATCH_SIZE = int(os.environ.get('WAITLIST_SPOOL_BATCH_SIZE', '500'))
+
+# Statements slower than this (ms) are logged with their query plan; negative disables query timing
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '50'))
+
+# Admin search input limits (longer input or more terms is rejected before the FTS MATCH)
+SEARCH_MAX_QUERY_LENGTH = int(os.environ.get('SEARCH_MAX_QUERY_LENGTH', '200'))
+SEARCH_MAX_TERMS = int(os.environ.get('SEARCH_MAX_TERMS', '8'))
 
 def init_db():
     """Initialize the database and create tables if they don't exist"""
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
+    # WAL lets read-lane connections keep reading while a writer commits (persistent setting)
+    cursor.execute('PRAGMA journal_mode=WAL')
+    
     # Waitlist table (linked to users)
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS waitlist (
@@ -125,16 +262,943 @@ def init_db():
         )
     ''')
     
+    # Lookups by email (profiles, subscription linking) and latest subscription per user
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_email ON users(email)')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_subscriptions_user_created
+        ON subscriptions(user_id, created_at)
+    ''')
+    
+    # Lets the expiry sweeper seek straight to due rows instead of scanning
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_subscriptions_status_period_end
+        ON subscriptions(status, current_period_end)
+    ''')
+    
+    # Full-text search for admin lookups
+    try:
+        init_search_index(cursor)
+    except sqlite3.OperationalError as e:
+        print(f"Full-text search unavailable (SQLite built without FTS5?): {str(e)}")
+    
+    # Resume points for batch jobs (e.g. Stripe reconciliation)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS job_checkpoints (
+            job_name TEXT PRIMARY KEY,
+            cursor TEXT,
+            rows_scanned INTEGER DEFAULT 0,
+            rows_changed INTEGER DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
     conn.commit()
+    
+    run_migrations(conn)
     conn.close()
     print(f"Database initialized at {DB_PATH}")
 
-def get_db_connection():
-    """Get database connection"""
-    conn = sqlite3.connect(DB_PATH)
+# ===== SCHEMA MIGRATIONS =====
+# Applied in order by run_migrations(); PRAGMA user_version records the last one applied.
+# ensure_db() skips init_db() when user_version == SCHEMA_VERSION, so every schema change
+# (including new tables/indexes) must ship as a migration, not only as init_db DDL.
+
+def add_column_if_missing(cursor, table, column, definition):
+    """ALTER TABLE ... ADD COLUMN unless the column already exists"""
+    cursor.execute(f'PRAGMA table_info({table})')
+    if column not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+# Recompute the denormalized current-subscription columns for the users matched by {where}
+REFRESH_CURRENT_SUBSCRIPTION = '''
+    UPDATE users
+    SET (current_subscription_id, current_plan, current_subscription_status) = (
+            SELECT id, plan_name, status FROM subscriptions
+            WHERE user_id = users.id
+            ORDER BY created_at DESC, id DESC LIMIT 1
+        ),
+        subscription_tier = CASE
+            WHEN subscription_override = 1 THEN subscription_tier
+            ELSE COALESCE((
+                SELECT CASE WHEN status IN ('active', 'trialing') THEN plan_name ELSE 'free' END
+                FROM subscriptions
+                WHERE user_id = users.id
+                ORDER BY created_at DESC, id DESC LIMIT 1
+            ), 'free')
+        END
+    WHERE {where};
+'''
+
+def migrate_current_subscription_pointer(cursor):
+    """users.current_subscription_id (+ plan/status copies) maintained by triggers on subscriptions"""
+    add_column_if_missing(cursor, 'users', 'current_subscription_id', 'INTEGER REFERENCES subscriptions(id) ON DELETE SET NULL')
+    add_column_if_missing(cursor, 'users', 'current_plan', 'TEXT')
+    add_column_if_missing(cursor, 'users', 'current_subscription_status', 'TEXT')
+    
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS subscriptions_current_insert
+        AFTER INSERT ON subscriptions WHEN new.user_id IS NOT NULL BEGIN
+            {REFRESH_CURRENT_SUBSCRIPTION.format(where='id = new.user_id')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS subscriptions_current_update
+        AFTER UPDATE OF user_id, plan_name, status, created_at ON subscriptions BEGIN
+            {REFRESH_CURRENT_SUBSCRIPTION.format(where='id IN (old.user_id, new.user_id)')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS subscriptions_current_delete
+        AFTER DELETE ON subscriptions WHEN old.user_id IS NOT NULL BEGIN
+            {REFRESH_CURRENT_SUBSCRIPTION.format(where='id = old.user_id')}
+        END
+    ''')
+    
+    # Backfill existing users (one statement: the whole migration is a single transaction anyway)
+    cursor.execute(REFRESH_CURRENT_SUBSCRIPTION.format(where='1'))
+    
+    # Email status lookups for subscriptions not yet linked to a user
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_subscriptions_email_created
+        ON subscriptions(user_email, created_at)
+    ''')
+
+def init_archive_db():
+    """Create the archive database (same columns as the hot tables, plus archived_at)"""
+    conn = sqlite3.connect(ARCHIVE_DB_PATH)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS waitlist (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            name TEXT NOT NULL,
+            email TEXT NOT NULL,
+            product TEXT,
+            created_at TIMESTAMP,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS subscriptions (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            user_email TEXT NOT NULL,
+            stripe_customer_id TEXT,
+            stripe_subscription_id TEXT,
+            stripe_price_id TEXT,
+            plan_name TEXT NOT NULL,
+            status TEXT NOT NULL,
+            current_period_start TIMESTAMP,
+            current_period_end TIMESTAMP,
+            cancel_at_period_end INTEGER DEFAULT 0,
+            created_at TIMESTAMP,
+            updated_at TIMESTAMP,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_archive_waitlist_created ON waitlist(created_at)')
+    # Signups check archived emails too (UNIQUE(email) only covers the hot table)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_archive_waitlist_email ON waitlist(email)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_archive_subscriptions_user ON subscriptions(user_id, created_at)')
+    # Waitlist position counts archived entries inside an hour
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_archive_waitlist_product_created ON waitlist(product, created_at, id)')
+    conn.commit()
+    conn.close()
+
+def migrate_archive(cursor):
+    """Archive database plus the indexes the archival job walks"""
+    init_archive_db()
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_waitlist_created_at ON waitlist(created_at)')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_subscriptions_status_updated
+        ON subscriptions(status, updated_at)
+    ''')
+    # Lets the job skip canceled subscriptions that are still a user's current one
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_users_current_subscription
+        ON users(current_subscription_id)
+    ''')
+
+# change_log row keys per table: every cache entry derived from a row is tagged with this key
+CHANGE_LOG_KEYS = {
+    'users': ('users', 'new.email', 'old.email'),
+    'subscriptions': ('subscriptions', 'new.user_email', 'old.user_email'),
+    'user_permissions': (
+        'users',
+        '(SELECT email FROM users WHERE id = new.user_id)',
+        '(SELECT email FROM users WHERE id = old.user_id)'
+    )
+}
+
+def migrate_change_log(cursor):
+    """change_log table filled by triggers, so every writer (other workers, scripts) is covered"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            version INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_key TEXT,
+            changed_at REAL DEFAULT (julianday('now'))
+        )
+    ''')
+    for table, (logged_as, new_key, old_key) in CHANGE_LOG_KEYS.items():
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_change_log_insert
+            AFTER INSERT ON {table} BEGIN
+                INSERT INTO change_log (table_name, row_key) VALUES ('{logged_as}', {new_key});
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_change_log_update
+            AFTER UPDATE ON {table} BEGIN
+                INSERT INTO change_log (table_name, row_key) VALUES ('{logged_as}', {new_key});
+                INSERT INTO change_log (table_name, row_key)
+                SELECT '{logged_as}', {old_key} WHERE {old_key} IS NOT {new_key};
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_change_log_delete
+            AFTER DELETE ON {table} BEGIN
+                INSERT INTO change_log (table_name, row_key) VALUES ('{logged_as}', {old_key});
+            END
+        ''')
+
+def migrate_stripe_customer_id(cursor):
+    """users.stripe_customer_id, filled in the background after sync so checkout skips the customer lookup"""
+    add_column_if_missing(cursor, 'users', 'stripe_customer_id', 'TEXT')
+
+# Waitlist position: per-hour entry counts (and totals) per product, plus '*' for all products.
+# An entry's rank is its hour's entries_before (see migrate_waitlist_position_prefix) plus an
+# index range count inside its own hour.
+WAITLIST_ALL_PRODUCTS = '*'
+
+def _waitlist_count_updates(row, delta):
+    """Trigger statements adding delta to row's hour and total counters (its product and '*')"""
+    statements = ''
+    for product in (f"IFNULL({row}.product, '')", f"'{WAITLIST_ALL_PRODUCTS}'"):
+        statements += f'''
+                INSERT INTO waitlist_hour_counts (product, hour, entries)
+                VALUES ({product}, substr({row}.created_at, 1, 13), {delta})
+                ON CONFLICT (product, hour) DO UPDATE SET entries = entries + ({delta});
+                INSERT INTO waitlist_totals (product, entries) VALUES ({product}, {delta})
+                ON CONFLICT (product) DO UPDATE SET entries = entries + ({delta});'''
+    return statements
+
+def migrate_waitlist_positions(cursor):
+    """Index and trigger-maintained counters behind GET /api/waitlist/position"""
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_waitlist_product_created
+        ON waitlist(product, created_at, id)
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS waitlist_hour_counts (
+            product TEXT NOT NULL,
+            hour TEXT NOT NULL,
+            entries INTEGER NOT NULL,
+            PRIMARY KEY (product, hour)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS waitlist_totals (
+            product TEXT PRIMARY KEY,
+            entries INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    triggers = {
+        'insert': ('AFTER INSERT', _waitlist_count_updates('new', 1)),
+        'delete': ('AFTER DELETE', _waitlist_count_updates('old', -1)),
+        'update': ('AFTER UPDATE OF product, created_at',
+                   _waitlist_count_updates('old', -1) + _waitlist_count_updates('new', 1))
+    }
+    for name, (timing, body) in triggers.items():
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS waitlist_counts_{name}
+            {timing} ON waitlist BEGIN{body}
+            END
+        ''')
+    # Backfill from existing rows
+    cursor.execute('DELETE FROM waitlist_hour_counts')
+    cursor.execute('DELETE FROM waitlist_totals')
+    cursor.execute('''
+        INSERT INTO waitlist_hour_counts (product, hour, entries)
+        SELECT IFNULL(product, ''), substr(created_at, 1, 13), COUNT(*) FROM waitlist GROUP BY 1, 2
+        UNION ALL
+        SELECT ?, substr(created_at, 1, 13), COUNT(*) FROM waitlist GROUP BY 2
+    ''', (WAITLIST_ALL_PRODUCTS,))
+    cursor.execute('''
+        INSERT INTO waitlist_totals (product, entries)
+        SELECT product, SUM(entries) FROM waitlist_hour_counts GROUP BY product
+    ''')
+
+def migrate_event_log(cursor):
+    """event_log table behind the admin event stream (ids double as SSE event ids)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS event_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            type TEXT NOT NULL,
+            data TEXT NOT NULL,
+            created_at REAL DEFAULT (julianday('now'))
+        )
+    ''')
+
+def migrate_archive_email_index(cursor):
+    """Archive index behind the archived-email check in submit_waitlist"""
+    init_archive_db()
+
+def _waitlist_prefix_count_updates(row, delta):
+    """
+    Trigger statements adding delta to row's hour and total counters (its product and '*'),
+    keeping each hour's entries_before (entries in all earlier hours) in step. Only hours after
+    the row's are shifted, which for a new signup is none.
+    """
+    statements = ''
+    for product in (f"IFNULL({row}.product, '')", f"'{WAITLIST_ALL_PRODUCTS}'"):
+        hour = f'substr({row}.created_at, 1, 13)'
+        statements += f'''
+                INSERT INTO waitlist_hour_counts (product, hour, entries, entries_before)
+                VALUES ({product}, {hour}, {delta}, IFNULL((
+                    SELECT entries_before + entries FROM waitlist_hour_counts
+                    WHERE product = {product} AND hour < {hour} ORDER BY hour DESC LIMIT 1
+                ), 0))
+                ON CONFLICT (product, hour) DO UPDATE SET entries = entries + ({delta});
+                UPDATE waitlist_hour_counts SET entries_before = entries_before + ({delta})
+                WHERE product = {product} AND hour > {hour};
+                INSERT INTO waitlist_totals (product, entries) VALUES ({product}, {delta})
+                ON CONFLICT (product) DO UPDATE SET entries = entries + ({delta});'''
+    return statements
+
+def migrate_waitlist_position_prefix(cursor):
+    """
+    Waitlist counters with a running entries_before per hour (one lookup instead of summing every
+    earlier hour), which keep counting entries the archival job moves to archive.waitlist
+    """
+    # The archival job marks its own deletes here so the counters skip them
+    cursor.execute('CREATE TABLE IF NOT EXISTS archive_moves (table_name TEXT PRIMARY KEY)')
+    add_column_if_missing(cursor, 'waitlist_hour_counts', 'entries_before', 'INTEGER NOT NULL DEFAULT 0')
+    not_archiving = "NOT EXISTS (SELECT 1 FROM archive_moves WHERE table_name = 'waitlist')"
+    triggers = {
+        'insert': ('AFTER INSERT', '', _waitlist_prefix_count_updates('new', 1)),
+        'delete': ('AFTER DELETE', f'WHEN {not_archiving}', _waitlist_prefix_count_updates('old', -1)),
+        'update': ('AFTER UPDATE OF product, created_at', '',
+                   _waitlist_prefix_count_updates('old', -1) + _waitlist_prefix_count_updates('new', 1))
+    }
+    for name, (timing, condition, body) in triggers.items():
+        cursor.execute(f'DROP TRIGGER IF EXISTS waitlist_counts_{name}')
+        cursor.execute(f'''
+            CREATE TRIGGER waitlist_counts_{name}
+            {timing} ON waitlist {condition} BEGIN{body}
+            END
+        ''')
+    
+    # Backfill from hot and archived rows
+    cursor.execute('DELETE FROM waitlist_hour_counts')
+    cursor.execute('DELETE FROM waitlist_totals')
+    cursor.execute('''
+        INSERT INTO waitlist_hour_counts (product, hour, entries)
+        SELECT IFNULL(product, ''), substr(created_at, 1, 13), COUNT(*) FROM waitlist GROUP BY 1, 2
+        UNION ALL
+        SELECT ?, substr(created_at, 1, 13), COUNT(*) FROM waitlist GROUP BY 2
+    ''', (WAITLIST_ALL_PRODUCTS,))
+    if os.path.exists(ARCHIVE_DB_PATH):
+        archive = sqlite3.connect(ARCHIVE_DB_PATH)
+        try:
+            archived = archive.execute('''
+                SELECT IFNULL(product, ''), substr(created_at, 1, 13), COUNT(*) FROM waitlist GROUP BY 1, 2
+                UNION ALL
+                SELECT ?, substr(created_at, 1, 13), COUNT(*) FROM waitlist GROUP BY 2
+            ''', (WAITLIST_ALL_PRODUCTS,)).fetchall()
+        finally:
+            archive.close()
+        cursor.executemany('''
+            INSERT INTO waitlist_hour_counts (product, hour, entries) VALUES (?, ?, ?)
+            ON CONFLICT (product, hour) DO UPDATE SET entries = entries + excluded.entries
+        ''', archived)
+    cursor.execute('''
+        UPDATE waitlist_hour_counts SET entries_before = running.entries_before
+        FROM (
+            SELECT product, hour, IFNULL(SUM(entries) OVER (
+                PARTITION BY product ORDER BY hour ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+            ), 0) AS entries_before
+            FROM waitlist_hour_counts
+        ) AS running
+        WHERE waitlist_hour_counts.product = running.product AND waitlist_hour_counts.hour = running.hour
+    ''')
+    cursor.execute('''
+        INSERT INTO waitlist_totals (product, entries)
+        SELECT product, SUM(entries) FROM waitlist_hour_counts GROUP BY product
+    ''')
+    init_archive_db()
+
+SCHEMA_MIGRATIONS = [
+    (1, migrate_current_subscription_pointer),
+    (2, migrate_archive),
+    (3, migrate_change_log),
+    (4, migrate_stripe_customer_id),
+    (5, migrate_waitlist_positions),
+    (6, migrate_event_log),
+    (7, migrate_archive_email_index),
+    (8, migrate_waitlist_position_prefix)
+]
+
+SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1][0]
+
+def run_migrations(conn):
+    """Apply pending migrations, each in its own transaction"""
+    cursor = conn.cursor()
+    version = cursor.execute('PRAGMA user_version').fetchone()[0]
+    for target, migration in SCHEMA_MIGRATIONS:
+        if version >= target:
+            continue
+        started = time.perf_counter()
+        try:
+            migration(cursor)
+            cursor.execute(f'PRAGMA user_version = {int(target)}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        version = target
+        print(f"Applied schema migration {target} ({migration.__name__}) in {time.perf_counter() - started:.2f}s")
+
+def ensure_db():
+    """Run init_db() only when the database is missing or behind SCHEMA_VERSION; returns True if it ran"""
+    try:
+        # mode=ro: checking the version must not create an empty database file
+        conn = sqlite3.connect(Path(DB_PATH).resolve().as_uri() + '?mode=ro', uri=True)
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        conn.close()
+    except sqlite3.OperationalError:
+        version = None
+    if version == SCHEMA_VERSION:
+        return False
+    init_db()
+    return True
+
+# FTS5 indexes over existing tables: (index table, content table, indexed columns)
+SEARCH_INDEXES = [
+    ('users_fts', 'users', ('email', 'name')),
+    ('waitlist_fts', 'waitlist', ('name', 'email', 'product'))
+]
+
+def init_search_index(cursor):
+    """Create FTS5 indexes and the triggers that keep them in sync with their tables"""
+    for fts_table, table, columns in SEARCH_INDEXES:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts_table,))
+        exists = cursor.fetchone() is not None
+        
+        column_list = ', '.join(columns)
+        new_values = ', '.join(f'new.{column}' for column in columns)
+        old_values = ', '.join(f'old.{column}' for column in columns)
+        
+        # External-content table: the index stores tokens only, rows stay in the base table
+        cursor.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5(
+                {column_list},
+                content='{table}',
+                content_rowid='id',
+                prefix='2 3'
+            )
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts_table}(rowid, {column_list}) VALUES (new.id, {new_values});
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts_table}({fts_table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF {column_list} ON {table} BEGIN
+                INSERT INTO {fts_table}({fts_table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+                INSERT INTO {fts_table}(rowid, {column_list}) VALUES (new.id, {new_values});
+            END
+        ''')
+        
+        if not exists:
+            # Index rows that were written before search existed
+            cursor.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
+
+def build_fts_query(text, max_terms=None):
+    """Turn free-form admin input into an FTS5 prefix query (every term must match); None if too many terms"""
+    terms = ''.join(ch if ch.isalnum() else ' ' for ch in text).split()
+    if max_terms is not None and len(terms) > max_terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+def query_context():
+    """Who ran a statement: 'METHOD /route' inside a request, else the thread name"""
+    if has_request_context() and request.url_rule is not None:
+        return f'{request.method} {request.url_rule.rule}'
+    return threading.current_thread().name
+
+query_log = QueryLog(SLOW_QUERY_MS, context=query_context) if SLOW_QUERY_MS >= 0 else None
+
+class ReadOnlyConnection(TimedConnection):
+    """Read-lane connection; close() hands it back to its lane instead of closing it"""
+    
+    def close(self):
+        self.lane.release(self)
+
+class ReadLane:
+    """Pool of mode=ro connections, each holding a WAL snapshot for at most max_staleness_ms"""
+    
+    def __init__(self, db_path, max_staleness_ms=0, pool_size=8):
+        self.db_path = db_path
+        self.max_staleness = max_staleness_ms / 1000.0
+        self.pool_size = pool_size
+        self.idle = []
+        self.lock = threading.Lock()
+        self.active = 0
+        self.expiring = False
+    
+    def _connect(self):
+        uri = Path(self.db_path).resolve().as_uri() + '?mode=ro'
+        # Transactions are managed here: one BEGIN per snapshot
+        conn = sqlite3.connect(uri, uri=True, isolation_level=None, check_same_thread=False,
+                               factory=ReadOnlyConnection, cached_statements=queries.STATEMENT_CACHE_SIZE)
+        conn.row_factory = sqlite3.Row
+        conn.query_log = query_log
+        conn.lane = self
+        conn.snapshot_at = None
+        conn.in_use = False
+        return conn
+    
+    def _end_snapshot(self, conn):
+        if conn.in_transaction:
+            conn.execute('COMMIT')
+        conn.snapshot_at = None
+    
+    def _begin_snapshot(self, conn, now):
+        # Attach before BEGIN: the archive may have been created since this connection opened
+        attach_archive(conn, readonly=True)
+        conn.execute('BEGIN')
+        # The first read pins the snapshot for every query until COMMIT
+        conn.execute('SELECT 1 FROM sqlite_master LIMIT 1').fetchone()
+        conn.snapshot_at = now
+    
+    def renew_snapshot(self, conn):
+        """Move a checked-out connection to a fresh snapshot (lets it ATTACH in between)"""
+        self._end_snapshot(conn)
+        self._begin_snapshot(conn, time.monotonic())
+    
+    def acquire(self):
+        """Check out a connection positioned on a snapshot no older than the staleness bound"""
+        with self.lock:
+            conn = self.idle.pop() if self.idle else None
+            self.active += 1
+        try:
+            if conn is None:
+                conn = self._connect()
+            now = time.monotonic()
+            if conn.snapshot_at is None or now - conn.snapshot_at > self.max_staleness:
+                self._end_snapshot(conn)
+                self._begin_snapshot(conn, now)
+        except Exception:
+            with self.lock:
+                self.active -= 1
+            raise
+        conn.in_use = True
+        return conn
+    
+    def release(self, conn):
+        """Return a connection to the pool (safe to call more than once)"""
+        if not conn.in_use:
+            return
+        conn.in_use = False
+        with self.lock:
+            self.active -= 1
+        try:
+            # Don't pin WAL frames longer than the bound allows
+            if self.max_staleness <= 0 or time.monotonic() - conn.snapshot_at > self.max_staleness:
+                self._end_snapshot(conn)
+            with self.lock:
+                if len(self.idle) < self.pool_size:
+                    self.idle.append(conn)
+                    if conn.snapshot_at is not None and not self.expiring:
+                        self.expiring = True
+                        threading.Thread(target=self._expire_idle, name='read-lane-expiry', daemon=True).start()
+                    return
+        except sqlite3.Error:
+            pass
+        sqlite3.Connection.close(conn)
+    
+    def _expire_idle(self):
+        """End idle snapshots once they pass the bound, so a quiet server doesn't block WAL checkpoints"""
+        while True:
+            time.sleep(self.max_staleness)
+            now = time.monotonic()
+            with self.lock:
+                stale = [conn for conn in self.idle
+                         if conn.snapshot_at is not None and now - conn.snapshot_at > self.max_staleness]
+                self.idle = [conn for conn in self.idle if conn not in stale]
+            for conn in stale:
+                try:
+                    self._end_snapshot(conn)
+                except sqlite3.Error:
+                    sqlite3.Connection.close(conn)
+                    continue
+                with self.lock:
+                    if len(self.idle) < self.pool_size:
+                        self.idle.append(conn)
+                        continue
+                sqlite3.Connection.close(conn)
+
+def attach_archive(conn, readonly=False):
+    """ATTACH the archive database as 'archive' if it exists; returns whether it is attached"""
+    attached = [row[1] for row in conn.execute('PRAGMA database_list').fetchall()]
+    if 'archive' in attached:
+        return True
+    if not os.path.exists(ARCHIVE_DB_PATH):
+        return False
+    if conn.in_transaction:
+        if not getattr(conn, 'in_use', False):
+            return False
+        # A read-lane connection sits on its snapshot: ATTACH between two snapshots
+        conn.lane.renew_snapshot(conn)
+        return 'archive' in [row[1] for row in conn.execute('PRAGMA database_list').fetchall()]
+    if readonly:
+        conn.execute('ATTACH DATABASE ? AS archive', (Path(ARCHIVE_DB_PATH).resolve().as_uri() + '?mode=ro',))
+    else:
+        conn.execute('ATTACH DATABASE ? AS archive', (ARCHIVE_DB_PATH,))
+    return True
+
+read_lane = ReadLane(DB_PATH, READ_SNAPSHOT_MAX_STALENESS_MS, READ_LANE_POOL_SIZE)
+
+def get_db_connection(readonly=None):
+    """
+    Get database connection
+    Requests made with GET/HEAD get a read-lane connection unless readonly=False
+    """
+    if readonly is None:
+        readonly = READ_LANE_ENABLED and has_request_context() and request.method in READ_METHODS
+    if readonly:
+        try:
+            conn = read_lane.acquire()
+            if has_request_context():
+                g.setdefault('read_lane_conns', []).append(conn)
+            return conn
+        except sqlite3.OperationalError as e:
+            # e.g. database file not created yet - fall back to a normal connection
+            print(f"Read lane unavailable, using writer connection: {str(e)}")
+    conn = sqlite3.connect(DB_PATH, factory=TimedConnection, cached_statements=queries.STATEMENT_CACHE_SIZE)
     conn.row_factory = sqlite3.Row  # This allows column access by name
+    conn.query_log = query_log
     return conn
 
+class LatencyStats:
+    """Rolling latency samples (ms) per key, summarised as percentiles"""
+    
+    def __init__(self, window=2048):
+        self.window = window
+        self.samples = {}
+        self.counts = {}
+        self.lock = threading.Lock()
+    
+    def record(self, key, millis):
+        with self.lock:
+            if key not in self.samples:
+                self.samples[key] = deque(maxlen=self.window)
+                self.counts[key] = 0
+            self.samples[key].append(millis)
+            self.counts[key] += 1
+    
+    def summary(self):
+        with self.lock:
+            snapshot = {key: sorted(values) for key, values in self.samples.items()}
+            counts = dict(self.counts)
+        result = {}
+        for key, values in snapshot.items():
+            if not values:
+                continue
+            pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+            result[key] = {
+                'count': counts[key],
+                'p50_ms': round(pick(0.50), 3),
+                'p95_ms': round(pick(0.95), 3),
+                'p99_ms': round(pick(0.99), 3),
+                'max_ms': round(values[-1], 3)
+            }
+        return result
+
+# Writer latency, split by whether a GET request was in flight at the time
+writer_latency = LatencyStats()
+reads_in_flight = 0
+reads_in_flight_lock = threading.Lock()
+
+# Write transactions (BEGIN IMMEDIATE + retry); lock waits are recorded per route
+write_transactions = WriteTransactions(
+    lambda: get_db_connection(readonly=False),
+    policy=RetryPolicy(
+        busy_timeout_ms=WRITE_BUSY_TIMEOUT_MS,
+        deadline_ms=WRITE_DEADLINE_MS,
+        backoff_cap_ms=WRITE_BACKOFF_CAP_MS
+    ),
+    lock_wait=LatencyStats(),
+    context=query_context
+)
+
+def write_busy_response(error):
+    """503 for a write that couldn't get the database lock in time (clients may retry)"""
+    print(f"Write lock contention: {str(error)}")
+    return jsonify({'error': 'Server busy, please retry'}), 503, {'Retry-After': '1'}
+
+# ===== STRIPE GATEWAY =====
+
+# Per-operation timeouts, e.g. STRIPE_TIMEOUTS="customer.list=2,checkout.session.create=6"
+STRIPE_TIMEOUTS = parse_timeouts(os.environ.get('STRIPE_TIMEOUTS', ''))
+STRIPE_HEDGE_AFTER_MS = os.environ.get('STRIPE_HEDGE_AFTER_MS')
+
+stripe_gateway = StripeGateway(
+    get_stripe,
+    timeouts=STRIPE_TIMEOUTS,
+    max_retries=int(os.environ.get('STRIPE_MAX_RETRIES', '2')),
+    hedge_after=float(STRIPE_HEDGE_AFTER_MS) / 1000 if STRIPE_HEDGE_AFTER_MS else None,
+    max_concurrency=int(os.environ.get('STRIPE_MAX_CONCURRENCY', '16')),
+    breaker=CircuitBreaker(
+        error_rate=float(os.environ.get('STRIPE_BREAKER_ERROR_RATE', '0.5')),
+        cooldown=float(os.environ.get('STRIPE_BREAKER_COOLDOWN', '30'))
+    ),
+    latency=LatencyStats()
+)
+
+# ===== PROFILING =====
+
+# Shared secret for the admin endpoints (sent as X-Admin-Token); unset disables them
+ADMIN_API_TOKEN = os.environ.get('ADMIN_API_TOKEN', '')
+PROFILE_MAX_SECONDS = float(os.environ.get('PROFILE_MAX_SECONDS', '300'))
+
+profiler = SamplingProfiler()
+
+def admin_token_matches(token):
+    return bool(ADMIN_API_TOKEN) and hmac.compare_digest(token or '', ADMIN_API_TOKEN)
+
+def require_admin_token(view):
+    """Reject requests without a matching X-Admin-Token header"""
+    @wraps(view)
+    def guarded(*args, **kwargs):
+        if not ADMIN_API_TOKEN:
+            return jsonify({'error': 'Admin token not configured'}), 403
+        if not admin_token_matches(request.headers.get('X-Admin-Token', '')):
+            return jsonify({'error': 'Unauthorized'}), 401
+        return view(*args, **kwargs)
+    return guarded
+
+# ===== ADMIN EVENTS =====
+
+# Signups, syncs and subscription changes: writers log them to event_log in the same
+# transaction as the change, the bus fans them out to SSE clients after commit
+event_bus = EventBus(
+    write_transactions.run,
+    lambda: get_db_connection(readonly=False),
+    max_buffer=EVENT_STREAM_BUFFER,
+    retention=EVENT_LOG_RETENTION,
+    poll_interval=EVENT_STREAM_POLL_MS / 1000
+)
+event_stream_server = None
+threaded_event_streams = 0
+threaded_event_streams_lock = threading.Lock()
+# Stream tickets live in this process, which also runs the event stream server
+event_stream_tickets = {}  # ticket -> monotonic expiry
+event_stream_tickets_lock = threading.Lock()
+
+def issue_event_stream_ticket():
+    """Short-lived, single-use stand-in for the admin token in an EventSource URL"""
+    ticket = secrets.token_urlsafe(24)
+    now = time.monotonic()
+    with event_stream_tickets_lock:
+        for expired in [t for t, expires in event_stream_tickets.items() if expires <= now]:
+            del event_stream_tickets[expired]
+        event_stream_tickets[ticket] = now + EVENT_STREAM_TICKET_TTL
+    return ticket
+
+def redeem_event_stream_ticket(ticket):
+    if not ticket:
+        return False
+    with event_stream_tickets_lock:
+        expires = event_stream_tickets.pop(ticket, None)
+    return expires is not None and expires > time.monotonic()
+
+def event_stream_authorized(headers, query):
+    """X-Admin-Token header, or a ?ticket= from POST /api/admin/events/ticket for EventSource"""
+    if headers.get('x-admin-token'):
+        return admin_token_matches(headers['x-admin-token'])
+    return bool(ADMIN_API_TOKEN) and redeem_event_stream_ticket(query.get('ticket'))
+
+def parse_last_event_id(value):
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+# ===== WAITLIST SPOOL =====
+
+_waitlist_spool = None
+_waitlist_spool_lock = threading.Lock()
+spool_drainer_wake = threading.Event()
+spool_drainer_running = False
+
+def waitlist_spool_active():
+    """Spool only in a process whose drainer is running; otherwise submissions would sit on disk forever"""
+    return WAITLIST_SPOOL_ENABLED and spool_drainer_running
+
+def get_waitlist_spool():
+    """Open the spool on first use (recovering whatever a previous process left behind)"""
+    global _waitlist_spool
+    if _waitlist_spool is None:
+        with _waitlist_spool_lock:
+            if _waitlist_spool is None:
+                _waitlist_spool = Spool(WAITLIST_SPOOL_PATH, WAITLIST_SPOOL_FSYNC_WINDOW_MS, WAITLIST_SPOOL_MAX_BYTES)
+    return _waitlist_spool
+
+def spool_waitlist_submission(name, email, product, user_id, cognito_user_id):
+    """Durably queue a submission for the drainer; 202 once it is on disk, 503 if even that fails"""
+    # The drainer skips duplicates silently, so reject them while we can still answer 409
+    try:
+        if waitlist_email_registered(email):
+            return jsonify({
+                'success': False,
+                'error': 'Email already registered'
+            }), 409
+    except sqlite3.OperationalError as e:
+        print(f"Duplicate check before spooling skipped: {str(e)}")
+    
+    try:
+        get_waitlist_spool().append({
+            'name': name,
+            'email': email,
+            'product': product,
+            'user_id': user_id,
+            'cognito_user_id': cognito_user_id,
+            'received_at': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        })
+    except Exception as e:
+        print(f"Error spooling waitlist submission: {str(e)}")
+        return jsonify({'error': 'Server busy, please retry'}), 503, {'Retry-After': '1'}
+    spool_drainer_wake.set()
+    return jsonify({
+        'success': True,
+        'queued': True,
+        'message': 'Submission received and will be added to the waitlist shortly'
+    }), 202
+
+def drain_waitlist_spool(batch_size=None):
+    """
+    Insert spooled submissions into waitlist until the spool is empty; returns rows inserted
+    Returns 0 right away while another process (or thread) is draining the shared spool
+    """
+    spool = get_waitlist_spool()
+    batch_size = batch_size or WAITLIST_SPOOL_BATCH_SIZE
+    inserted_total = 0
+    with spool.draining() as draining:
+        while draining and spool.has_pending():
+            records, offset = spool.read_batch(batch_size)
+            # ON CONFLICT (email) only sees the hot table; archived entries are checked here
+            archived = waitlist_emails_archived([record['email'] for record in records])
+            
+            def insert(conn):
+                inserted = []
+                for record in records:
+                    if record['email'] in archived:
+                        continue
+                    user_id = record.get('user_id')
+                    if user_id is None and record.get('cognito_user_id'):
+                        row = conn.execute(queries.USER_ID_BY_COGNITO_ID, (record['cognito_user_id'],)).fetchone()
+                        user_id = row[0] if row else None
+                    cursor = conn.execute(queries.WAITLIST_INSERT_SPOOLED, (
+                        user_id, record['name'], record['email'], record['product'], record['received_at']
+                    ))
+                    if cursor.rowcount:
+                        inserted.append(cursor.lastrowid)
+                        event_bus.log(conn, 'waitlist.signup', {
+                            'id': cursor.lastrowid, 'name': record['name'], 'email': record['email'],
+                            'product': record['product'], 'user_id': user_id, 'spooled': True
+                        })
+                return inserted
+            
+            inserted = write_transactions.run(insert) if records else []
+            spool.commit(offset, len(records))
+            inserted_total += len(inserted)
+            if inserted:
+                publish_local_changes()
+    return inserted_total
+
+# ===== CACHES =====
+
+# Per-worker caches, invalidated by the change feed when any worker (or script) commits
+CHANGE_FEED_POLL_MS = float(os.environ.get('CHANGE_FEED_POLL_MS', '5'))
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '10000'))
+
+change_feed = ChangeFeed(
+    DB_PATH,
+    poll_interval=CHANGE_FEED_POLL_MS / 1000,
+    retention=int(os.environ.get('CHANGE_LOG_RETENTION', '10000'))
+)
+
+# Entries are tagged with user emails; CHANGE_LOG_KEYS logs the same key for every table
+subscription_status_cache = KeyedCache('subscription_status', CACHE_MAX_ENTRIES)
+user_profile_cache = KeyedCache('user_profile', CACHE_MAX_ENTRIES)
+permission_cache = KeyedCache('permission', CACHE_MAX_ENTRIES)
+for cache in (subscription_status_cache, user_profile_cache, permission_cache):
+    change_feed.register('users', cache)
+    change_feed.register('subscriptions', cache)
+
+def cached(cache, key, loader):
+    """cache.get_or_load, but only while the change feed runs (nothing would invalidate entries otherwise)"""
+    if not change_feed.running:
+        return loader()[0]
+    return cache.get_or_load(key, loader)
+
+def publish_local_changes():
+    """Apply our own commit to this worker's caches (and send its admin events) now instead of on the next poll"""
+    event_bus.wake()
+    if change_feed.running:
+        try:
+            change_feed.poll()
+        except sqlite3.Error as e:
+            print(f"Change feed poll failed: {str(e)}")
+
+@app.before_request
+def start_request_timer():
+    global reads_in_flight
+    if STARTUP_TIMINGS['first_request_ms'] is None:
+        STARTUP_TIMINGS['first_request_ms'] = round((time.perf_counter() - IMPORT_STARTED) * 1000, 1)
+        print(f"[STARTUP] {format_startup_report()}")
+    session = profiler.session
+    if session is not None and request.url_rule is not None and session.enter(request.url_rule.rule):
+        g.profile_session = session
+    if request.method in READ_METHODS:
+        with reads_in_flight_lock:
+            reads_in_flight += 1
+        g.counted_read = True
+    else:
+        g.write_started = time.perf_counter()
+        g.write_during_reads = reads_in_flight > 0
+
+@app.after_request
+def record_writer_latency(response):
+    started = g.pop('write_started', None)
+    if started is not None:
+        during_reads = g.pop('write_during_reads', False) or reads_in_flight > 0
+        lane = 'during_reads' if during_reads else 'no_reads'
+        millis = (time.perf_counter() - started) * 1000
+        writer_latency.record(f'{request.endpoint}:{lane}', millis)
+        if backup_write_samples is not None:
+            backup_write_samples.append(millis)
+    return response
+
+@app.teardown_request
+def release_read_lane(exc):
+    global reads_in_flight
+    session = g.pop('profile_session', None)
+    if session is not None:
+        session.exit()
+    if g.pop('counted_read', False):
+        with reads_in_flight_lock:
+            reads_in_flight -= 1
+    # Routes that raise before conn.close() must not leak read snapshots
+    for conn in g.pop('read_lane_conns', []):
+        read_lane.release(conn)
+
 @app.route('/api/waitlist', methods=['POST'])
 @app.route('/api/waitlist/', methods=['POST'])
 def submit_waitlist():
@@ -161,29 +1225,44 @@ def submit_waitlist():
         if '@' not in email or '.' not in email.split('@')[1]:
             return jsonify({'error': 'Invalid email format'}), 400
         
+        # While earlier submissions are still spooled, queue behind them (keeps signup order)
+        if waitlist_spool_active() and get_waitlist_spool().has_pending():
+            return spool_waitlist_submission(name, email, product, None, cognito_user_id)
+        
         # Get user_id if cognito_user_id is provided
         user_id = None
         if cognito_user_id:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute('SELECT id FROM users WHERE cognito_user_id = ?', (cognito_user_id,))
-            user_row = cursor.fetchone()
-            if user_row:
-                user_id = user_row[0]
-            conn.close()
+            try:
+                conn = get_db_connection()
+                cursor = conn.cursor()
+                cursor.execute(queries.USER_ID_BY_COGNITO_ID, (cognito_user_id,))
+                user_row = cursor.fetchone()
+                if user_row:
+                    user_id = user_row[0]
+                conn.close()
+            except sqlite3.OperationalError:
+                if not waitlist_spool_active():
+                    raise
+                # The drainer links the user when it inserts the entry
         
-        # Insert into database
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        # Archived entries left the hot table's UNIQUE(email), so check them here
+        if waitlist_email_registered(email, archived_only=True):
+            return jsonify({
+                'success': False,
+                'error': 'Email already registered'
+            }), 409
         
+        # Insert into database
         try:
-            cursor.execute('''
-                INSERT INTO waitlist (user_id, name, email, product)
-                VALUES (?, ?, ?, ?)
-            ''', (user_id, name, email, product))
-            conn.commit()
-            waitlist_id = cursor.lastrowid
-            conn.close()
+            def insert(conn):
+                waitlist_id = conn.execute(queries.WAITLIST_INSERT, (user_id, name, email, product)).lastrowid
+                event_bus.log(conn, 'waitlist.signup', {
+                    'id': waitlist_id, 'name': name, 'email': email, 'product': product, 'user_id': user_id
+                })
+                return waitlist_id
+            
+            waitlist_id = write_transactions.run(insert)
+            event_bus.wake()
             
             return jsonify({
                 'success': True,
@@ -193,45 +1272,69 @@ def submit_waitlist():
             }), 201
             
         except sqlite3.IntegrityError:
-            conn.close()
             return jsonify({
                 'success': False,
                 'error': 'Email already registered'
             }), 409
+        except (WriteBusyError, sqlite3.OperationalError) as e:
+            # Locked too long, mid-migration, disk full...: keep the signup on disk instead
+            if not waitlist_spool_active():
+                raise
+            print(f"Waitlist insert failed, spooling submission: {str(e)}")
+            return spool_waitlist_submission(name, email, product, user_id, cognito_user_id)
             
+    except WriteBusyError as e:
+        return write_busy_response(e)
     except Exception as e:
         print(f"Error processing waitlist submission: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
+def waitlist_email_registered(email, archived_only=False):
+    """Whether email is on the waitlist (archived_only: in an entry moved to the archive database)"""
+    conn = get_db_connection(readonly=True)
+    try:
+        if not archived_only and conn.execute(queries.WAITLIST_EMAIL_EXISTS, (email,)).fetchone():
+            return True
+        if not attach_archive(conn, readonly=True):
+            return False
+        return conn.execute(queries.WAITLIST_EMAIL_ARCHIVED, (email,)).fetchone() is not None
+    finally:
+        conn.close()
+
+def waitlist_emails_archived(emails):
+    """The subset of emails that belong to entries moved to the archive database"""
+    if not emails:
+        return set()
+    conn = get_db_connection(readonly=True)
+    try:
+        if not attach_archive(conn, readonly=True):
+            return set()
+        return {row[0] for row in conn.execute(queries.WAITLIST_EMAILS_ARCHIVED, (json.dumps(emails),))}
+    finally:
+        conn.close()
+
 @app.route('/api/waitlist', methods=['GET'])
 @app.route('/api/waitlist/', methods=['GET'])
 def get_waitlist():
-    """Get all waitlist entries (for admin purposes)"""
+    """Get all waitlist entries (for admin purposes); ?include_archived=1 adds archived entries"""
     try:
+        include_archived = request.args.get('include_archived') in ('1', 'true')
+        
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT id, name, email, product, created_at
-            FROM waitlist
-            ORDER BY created_at DESC
-        ''')
+        if include_archived and not attach_archive(conn):
+            conn.close()
+            return jsonify({'error': 'Archive is not available'}), 503
         
-        entries = []
-        for row in cursor.fetchall():
-            entries.append({
-                'id': row['id'],
-                'name': row['name'],
-                'email': row['email'],
-                'product': row['product'],
-                'created_at': row['created_at']
-            })
+        select_sql = queries.WAITLIST_LIST_WITH_ARCHIVE if include_archived else queries.WAITLIST_LIST
+        count, entries = query_json_rows(cursor, select_sql, (), queries.WAITLIST_LIST_COLUMNS)
         
         conn.close()
         
         return jsonify({
             'success': True,
-            'count': len(entries),
+            'count': count,
             'entries': entries
         }), 200
         
@@ -239,6 +1342,68 @@ def get_waitlist():
         print(f"Error fetching waitlist: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/api/waitlist/position', methods=['GET'])
+def get_waitlist_position():
+    """
+    Rank of one waitlist entry (1 = first in line) and the total, by signup order.
+    Across all products by default; ?product= ranks within the entry's product.
+    """
+    try:
+        email = request.args.get('email', '').strip().lower()
+        product = request.args.get('product')
+
+        if not email:
+            return jsonify({'error': 'Email is required'}), 400
+
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        # Archived entries are the front of the line: the counters keep them, so look there too
+        archived = attach_archive(conn, readonly=True)
+        cursor.execute(queries.WAITLIST_ENTRY_BY_EMAIL, (email,))
+        entry = cursor.fetchone()
+        if not entry and archived:
+            cursor.execute(queries.ARCHIVED_WAITLIST_ENTRY_BY_EMAIL, (email,))
+            entry = cursor.fetchone()
+        if not entry or (product is not None and product != entry['product']):
+            conn.close()
+            return jsonify({'error': 'Not on the waitlist'}), 404
+
+        # Earlier hours in one counter lookup, then bounded index counts within the entry's hour
+        hour = entry['created_at'][:13]
+        key = WAITLIST_ALL_PRODUCTS if product is None else (product or '')
+        cursor.execute(queries.WAITLIST_ENTRIES_BEFORE_HOUR, (key, hour))
+        row = cursor.fetchone()
+        ahead = row[0] if row else 0
+        if product is None:
+            in_hour = [(queries.WAITLIST_AHEAD_IN_HOUR_ALL_PRODUCTS, (hour, entry['created_at'], entry['id']))]
+            if archived:
+                in_hour.append((queries.ARCHIVED_WAITLIST_AHEAD_IN_HOUR_ALL_PRODUCTS, (hour, entry['created_at'], entry['id'])))
+        else:
+            in_hour = [(queries.WAITLIST_AHEAD_IN_HOUR, (product, hour, entry['created_at'], entry['id']))]
+            if archived:
+                in_hour.append((queries.ARCHIVED_WAITLIST_AHEAD_IN_HOUR, (product, hour, entry['created_at'], entry['id'])))
+        for sql, params in in_hour:
+            cursor.execute(sql, params)
+            ahead += cursor.fetchone()[0]
+
+        cursor.execute(queries.WAITLIST_TOTAL, (key,))
+        total = cursor.fetchone()
+
+        conn.close()
+
+        return jsonify({
+            'success': True,
+            'product': product,
+            'position': ahead + 1,
+            'ahead': ahead,
+            'total': total['entries'] if total else ahead + 1
+        }), 200
+
+    except Exception as e:
+        print(f"Error fetching waitlist position: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 @app.route('/api/subscription/create-checkout-session', methods=['POST'])
 def create_checkout_session():
     """Create a Stripe checkout session for subscription"""
@@ -270,13 +1435,17 @@ def create_checkout_session():
         if not plan['stripe_price_id']:
             return jsonify({'error': 'Plan not configured for payments'}), 400
         
-        # Create or retrieve Stripe customer
+        # Customer pre-provisioned at user sync: checkout is a single Stripe call
+        customer_id = lookup_stripe_customer_id(email)
+        provision_stats['checkout_preprovisioned' if customer_id else 'checkout_fallback'] += 1
+        
+        # Otherwise create or retrieve the Stripe customer now
         try:
-            customers = stripe.Customer.list(email=email, limit=1)
-            if customers.data:
-                customer = customers.data[0]
-            else:
-                customer = stripe.Customer.create(email=email)
+            if not customer_id:
+                customer_id = find_or_create_stripe_customer(email)
+        except StripeUnavailableError as e:
+            print(f"Stripe unavailable creating/retrieving customer: {str(e)}")
+            return jsonify({'error': 'Payment provider unavailable, please try again shortly'}), 503
         except Exception as e:
             print(f"Error creating/retrieving customer: {str(e)}")
             return jsonify({'error': 'Failed to create customer'}), 500
@@ -287,8 +1456,7 @@ def create_checkout_session():
             if origin.endswith('/'):
                 origin = origin[:-1]
             
-            checkout_session = stripe.checkout.Session.create(
-                customer=customer.id,
+            session_params = dict(
                 payment_method_types=['card'],
                 line_items=[{
                     'price': plan['stripe_price_id'],
@@ -302,6 +1470,16 @@ def create_checkout_session():
                     'plan_name': plan_name
                 }
             )
+            try:
+                checkout_session = stripe_gateway.checkout_session_create(customer=customer_id, **session_params)
+            except Exception as e:
+                if not is_missing_customer_error(e):
+                    raise
+                # Stored customer was deleted in Stripe: forget it and take the slow path once
+                print(f"Stripe customer {customer_id} for {email} no longer exists, recreating")
+                forget_stripe_customer_id(email, customer_id)
+                customer_id = find_or_create_stripe_customer(email)
+                checkout_session = stripe_gateway.checkout_session_create(customer=customer_id, **session_params)
             
             return jsonify({
                 'success': True,
@@ -309,6 +1487,9 @@ def create_checkout_session():
                 'url': checkout_session.url
             }), 200
             
+        except StripeUnavailableError as e:
+            print(f"Stripe unavailable creating checkout session: {str(e)}")
+            return jsonify({'error': 'Payment provider unavailable, please try again shortly'}), 503
         except Exception as e:
             print(f"Error creating checkout session: {str(e)}")
             return jsonify({'error': 'Failed to create checkout session'}), 500
@@ -468,7 +1649,8 @@ def stripe_webhook():
     payload = request.data
     sig_header = request.headers.get('Stripe-Signature')
     
-    if not STRIPE_WEBHOOK_SECRET:
+    stripe = get_stripe()
+    if not stripe or not STRIPE_WEBHOOK_SECRET:
         return jsonify({'error': 'Webhook secret not configured'}), 500
     
     try:
@@ -482,7 +1664,24 @@ def stripe_webhook():
         print(f"Invalid signature: {str(e)}")
         return jsonify({'error': 'Invalid signature'}), 400
     
-    # Handle the event
+    try:
+        handle_stripe_event(event)
+    except WriteBusyError as e:
+        # Not committed: a non-2xx makes Stripe redeliver the event
+        return write_busy_response(e)
+    
+    return jsonify({'success': True}), 200
+
+# Webhook events that change local subscriptions (replay_webhooks.py applies the same set)
+SUBSCRIPTION_EVENT_TYPES = (
+    'checkout.session.completed',
+    'customer.subscription.created',
+    'customer.subscription.updated',
+    'customer.subscription.deleted'
+)
+
+def handle_stripe_event(event):
+    """Apply one verified Stripe event"""
     if event['type'] == 'checkout.session.completed':
         session = event['data']['object']
         handle_checkout_completed(session)
@@ -495,133 +1694,177 @@ def stripe_webhook():
     elif event['type'] == 'customer.subscription.deleted':
         subscription = event['data']['object']
         handle_subscription_deleted(subscription)
+
+def resolve_subscription_event(event, customers=None):
+    """
+    Turn a subscription event into a write: ('save', email, customer_id, subscription),
+    ('cancel', stripe_subscription_id) or None. Stripe is only called for objects the
+    payload doesn't already expand; customers memoizes customer id -> email across calls.
+    """
+    event_type = event['type']
+    obj = event['data']['object']
     
-    return jsonify({'success': True}), 200
+    if event_type == 'customer.subscription.deleted':
+        return ('cancel', obj.id)
+    
+    if event_type == 'checkout.session.completed':
+        subscription = obj.get('subscription')
+        if not subscription:
+            return None
+        if isinstance(subscription, str):
+            subscription = stripe_gateway.subscription_retrieve(subscription)
+        customer = obj.get('customer')
+        customer_id = customer if isinstance(customer, str) or customer is None else customer.id
+        return ('save', obj.get('metadata', {}).get('user_email'), customer_id, subscription)
+    
+    if event_type in ('customer.subscription.created', 'customer.subscription.updated'):
+        customer = obj.customer
+        if not isinstance(customer, str):
+            return ('save', customer.email, customer.id, obj)
+        if customers is not None and customer in customers:
+            return ('save', customers[customer], customer, obj)
+        email = stripe_gateway.customer_retrieve(customer).email
+        if customers is not None:
+            customers[customer] = email
+        return ('save', email, customer, obj)
+    
+    return None
 
 def handle_checkout_completed(session):
     """Handle successful checkout"""
     try:
-        customer_id = session.get('customer')
-        subscription_id = session.get('subscription')
-        email = session.get('metadata', {}).get('user_email')
-        
-        if subscription_id:
-            subscription = stripe.Subscription.retrieve(subscription_id)
-            save_subscription(email, customer_id, subscription)
+        write = resolve_subscription_event({'type': 'checkout.session.completed', 'data': {'object': session}})
+        if write:
+            save_subscription(*write[1:])
+    except WriteBusyError:
+        raise
     except Exception as e:
         print(f"Error handling checkout completed: {str(e)}")
 
 def handle_subscription_created(subscription):
     """Handle subscription creation"""
     try:
-        customer = stripe.Customer.retrieve(subscription.customer)
-        email = customer.email
-        save_subscription(email, subscription.customer, subscription)
+        _, email, customer_id, subscription = resolve_subscription_event(
+            {'type': 'customer.subscription.created', 'data': {'object': subscription}}
+        )
+        save_subscription(email, customer_id, subscription)
+    except WriteBusyError:
+        raise
     except Exception as e:
         print(f"Error handling subscription created: {str(e)}")
 
 def handle_subscription_updated(subscription):
     """Handle subscription updates"""
     try:
-        customer = stripe.Customer.retrieve(subscription.customer)
-        email = customer.email
-        save_subscription(email, subscription.customer, subscription)
+        _, email, customer_id, subscription = resolve_subscription_event(
+            {'type': 'customer.subscription.updated', 'data': {'object': subscription}}
+        )
+        save_subscription(email, customer_id, subscription)
+    except WriteBusyError:
+        raise
     except Exception as e:
         print(f"Error handling subscription updated: {str(e)}")
 
-def handle_subscription_deleted(subscription):
-    """Handle subscription cancellation"""
-    try:
-        customer = stripe.Customer.retrieve(subscription.customer)
-        email = customer.email
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            UPDATE subscriptions
-            SET status = 'canceled',
-                updated_at = CURRENT_TIMESTAMP
-            WHERE stripe_subscription_id = ?
-        ''', (subscription.id,))
-        
-        conn.commit()
-        conn.close()
+def handle_subscription_deleted(subscription):
+    """Handle subscription cancellation"""
+    try:
+        write_transactions.run(lambda conn: write_subscription_canceled(conn.cursor(), subscription.id))
+        publish_local_changes()
+    except WriteBusyError:
+        raise
     except Exception as e:
         print(f"Error handling subscription deleted: {str(e)}")
 
+def write_subscription_canceled(cursor, stripe_subscription_id):
+    """Mark a Stripe subscription canceled and log it for the admin stream (caller commits)"""
+    cursor.execute(queries.SUBSCRIPTION_CANCEL_BY_STRIPE_ID, (stripe_subscription_id,))
+    event_bus.log(cursor.connection, 'subscription.canceled', {'stripe_subscription_id': stripe_subscription_id})
+
 def save_subscription(email, customer_id, subscription):
     """Save or update subscription in database (linked to users table)"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get user_id from email (link to users table)
-        user_id = None
-        cursor.execute('SELECT id FROM users WHERE email = ?', (email,))
-        user_row = cursor.fetchone()
-        if user_row:
-            user_id = user_row[0]
-        
-        # Get plan name from price ID
-        price_id = subscription['items']['data'][0]['price']['id']
-        plan_name = 'pro'  # Default, should be determined from price_id
-        
-        for key, plan in PLANS.items():
-            if plan.get('stripe_price_id') == price_id:
-                plan_name = key
-                break
-        
-        # Check if subscription exists
-        cursor.execute('''
-            SELECT id FROM subscriptions
-            WHERE stripe_subscription_id = ?
-        ''', (subscription.id,))
-        
-        existing = cursor.fetchone()
-        
-        if existing:
-            # Update existing (also update user_id if it changed)
-            cursor.execute('''
-                UPDATE subscriptions
-                SET user_id = ?,
-                    status = ?,
-                    current_period_start = ?,
-                    current_period_end = ?,
-                    cancel_at_period_end = ?,
-                    updated_at = CURRENT_TIMESTAMP
-                WHERE stripe_subscription_id = ?
-            ''', (
-                user_id,
-                subscription.status,
-                datetime.fromtimestamp(subscription.current_period_start).isoformat(),
-                datetime.fromtimestamp(subscription.current_period_end).isoformat(),
-                1 if subscription.cancel_at_period_end else 0,
-                subscription.id
-            ))
-        else:
-            # Insert new
-            cursor.execute('''
-                INSERT INTO subscriptions 
-                (user_id, user_email, stripe_customer_id, stripe_subscription_id, stripe_price_id, plan_name, status, current_period_start, current_period_end)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                user_id,
-                email,
-                customer_id,
-                subscription.id,
-                price_id,
-                plan_name,
-                subscription.status,
-                datetime.fromtimestamp(subscription.current_period_start).isoformat(),
-                datetime.fromtimestamp(subscription.current_period_end).isoformat()
-            ))
-        
-        conn.commit()
-        conn.close()
+        write_transactions.run(lambda conn: write_subscription(conn.cursor(), email, customer_id, subscription))
+        publish_local_changes()
+    except WriteBusyError:
+        raise
     except Exception as e:
         print(f"Error saving subscription: {str(e)}")
 
+def write_subscription(cursor, email, customer_id, subscription):
+    """Upsert a Stripe subscription on cursor's connection and log it for the admin stream (caller commits)"""
+    # Get user_id from email (link to users table)
+    user_id = None
+    cursor.execute(queries.USER_ID_BY_EMAIL, (email,))
+    user_row = cursor.fetchone()
+    if user_row:
+        user_id = user_row['id']
+    
+    # Get plan name from price ID
+    price_id = subscription['items']['data'][0]['price']['id']
+    plan_name = plan_for_price_id(price_id)
+    
+    # Check if subscription exists
+    cursor.execute(queries.SUBSCRIPTION_ID_BY_STRIPE_ID, (subscription.id,))
+    existing = cursor.fetchone()
+    
+    if existing:
+        # Update existing (also update user_id if it changed)
+        cursor.execute(queries.SUBSCRIPTION_UPDATE_FROM_STRIPE, (
+            user_id,
+            subscription.status,
+            datetime.fromtimestamp(subscription.current_period_start).isoformat(),
+            datetime.fromtimestamp(subscription.current_period_end).isoformat(),
+            1 if subscription.cancel_at_period_end else 0,
+            subscription.id
+        ))
+    else:
+        # Insert new
+        cursor.execute(queries.SUBSCRIPTION_INSERT_FROM_STRIPE, (
+            user_id,
+            email,
+            customer_id,
+            subscription.id,
+            price_id,
+            plan_name,
+            subscription.status,
+            datetime.fromtimestamp(subscription.current_period_start).isoformat(),
+            datetime.fromtimestamp(subscription.current_period_end).isoformat()
+        ))
+    
+    event_bus.log(cursor.connection, 'subscription.updated', {
+        'email': email,
+        'stripe_customer_id': customer_id,
+        'stripe_subscription_id': subscription.id,
+        'plan': plan_name,
+        'status': subscription.status,
+        'cancel_at_period_end': bool(subscription.cancel_at_period_end)
+    })
+
+def load_subscription_status(column, value):
+    """Current subscription for a user; returns (subscription dict, cache tags)"""
+    # Writer connection: a read-lane snapshot may predate changes the cache was already told about
+    conn = get_db_connection(readonly=False)
+    cursor = conn.cursor()
+    
+    cursor.execute(queries.CURRENT_SUBSCRIPTION_BY[column], (value,))
+    row = cursor.fetchone()
+    tags = (row['email'],) if row else None
+    
+    if not row and column == 'email':
+        cursor.execute(queries.LATEST_SUBSCRIPTION_BY_EMAIL, (value,))
+        row = cursor.fetchone()
+        tags = (value,)
+    
+    conn.close()
+    
+    if row:
+        return queries.SUBSCRIPTION_STATUS(row), tags
+    # Unknown cognito ids have no email to tag with, so that miss is not cached (tags None)
+    return {
+        'plan': 'free',
+        'status': 'none'
+    }, tags
+
 @app.route('/api/subscription/status', methods=['GET'])
 def get_subscription_status():
     """Get subscription status for a user (by email or cognito_user_id)"""
@@ -632,61 +1875,16 @@ def get_subscription_status():
         if not email and not cognito_user_id:
             return jsonify({'error': 'Email or cognito_user_id is required'}), 400
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # If cognito_user_id provided, get user_id first
-        if cognito_user_id:
-            cursor.execute('SELECT id FROM users WHERE cognito_user_id = ?', (cognito_user_id,))
-            user_row = cursor.fetchone()
-            if user_row:
-                user_id = user_row[0]
-                cursor.execute('''
-                    SELECT * FROM subscriptions
-                    WHERE user_id = ?
-                    ORDER BY created_at DESC
-                    LIMIT 1
-                ''', (user_id,))
-            else:
-                # User not found in database, return no subscription
-                conn.close()
-                return jsonify({
-                    'success': True,
-                    'subscription': {
-                        'plan': 'free',
-                        'status': 'none'
-                    }
-                }), 200
-        else:
-            # Use email to find subscription
-            cursor.execute('''
-                SELECT * FROM subscriptions
-                WHERE user_email = ?
-                ORDER BY created_at DESC
-                LIMIT 1
-            ''', (email,))
-        
-        row = cursor.fetchone()
-        conn.close()
+        column, value = ('cognito_user_id', cognito_user_id) if cognito_user_id else ('email', email)
+        subscription = cached(
+            subscription_status_cache, (column, value),
+            lambda: load_subscription_status(column, value)
+        )
         
-        if row:
-            return jsonify({
-                'success': True,
-                'subscription': {
-                    'plan': row['plan_name'],
-                    'status': row['status'],
-                    'current_period_end': row['current_period_end'],
-                    'cancel_at_period_end': bool(row['cancel_at_period_end'])
-                }
-            }), 200
-        else:
-            return jsonify({
-                'success': True,
-                'subscription': {
-                    'plan': 'free',
-                    'status': 'none'
-                }
-            }), 200
+        return jsonify({
+            'success': True,
+            'subscription': subscription
+        }), 200
             
     except Exception as e:
         print(f"Error fetching subscription status: {str(e)}")
@@ -703,76 +1901,61 @@ def sync_cognito_user(cognito_user_id, email, name=None, auth_provider=None):
     This can be called from your frontend after successful authentication
     Automatically upgrades to dev account if email matches dev account
     """
-    try:
-        conn = get_db_connection()
+    def sync(conn):
         cursor = conn.cursor()
         
         # Check if user already exists
-        cursor.execute('SELECT id, is_dev_account FROM users WHERE cognito_user_id = ?', (cognito_user_id,))
+        cursor.execute(queries.USER_DEV_FLAG_BY_COGNITO_ID, (cognito_user_id,))
         existing = cursor.fetchone()
         
         # Check if this email should be a dev account
-        cursor.execute('SELECT id, is_dev_account FROM users WHERE email = ?', (email,))
+        cursor.execute(queries.USER_DEV_FLAG_BY_EMAIL, (email,))
         email_match = cursor.fetchone()
         
         is_dev = False
-        if email_match and email_match[1] == 1:
+        if email_match and email_match['is_dev_account'] == 1:
             is_dev = True
         
         if existing:
-            user_id = existing[0]
+            user_id = existing['id']
+            action = 'login'
             # Update last login and sync dev status
-            cursor.execute('''
-                UPDATE users 
-                SET last_login = CURRENT_TIMESTAMP, 
-                    updated_at = CURRENT_TIMESTAMP,
-                    email = ?,
-                    name = COALESCE(?, name),
-                    is_dev_account = ?,
-                    role = CASE WHEN ? = 1 THEN 'admin' ELSE role END
-                WHERE cognito_user_id = ?
-            ''', (email, name, is_dev, is_dev, cognito_user_id))
+            cursor.execute(queries.USER_SYNC_LOGIN, (email, name, is_dev, is_dev, cognito_user_id))
         elif email_match:
             # User exists with this email but different cognito_user_id - update it
-            user_id = email_match[0]
-            cursor.execute('''
-                UPDATE users 
-                SET cognito_user_id = ?,
-                    last_login = CURRENT_TIMESTAMP,
-                    updated_at = CURRENT_TIMESTAMP,
-                    name = COALESCE(?, name),
-                    auth_provider = ?
-                WHERE id = ?
-            ''', (cognito_user_id, name, auth_provider, user_id))
+            user_id = email_match['id']
+            action = 'linked'
+            cursor.execute(queries.USER_LINK_COGNITO_ID, (cognito_user_id, name, auth_provider, user_id))
         else:
             # Insert new user
-            cursor.execute('''
-                INSERT INTO users (cognito_user_id, email, name, auth_provider, last_login, is_dev_account, role)
-                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP, ?, CASE WHEN ? = 1 THEN 'admin' ELSE 'user' END)
-            ''', (cognito_user_id, email, name, auth_provider, is_dev, is_dev))
+            cursor.execute(queries.USER_INSERT, (cognito_user_id, email, name, auth_provider, is_dev, is_dev))
             user_id = cursor.lastrowid
+            action = 'created'
         
         # If dev account, ensure permissions are set
         if is_dev:
-            permissions = [
-                ('admin', 'all'),
-                ('read', 'all'),
-                ('write', 'all'),
-                ('delete', 'all'),
-                ('manage_subscriptions', 'all'),
-                ('manage_users', 'all'),
-                ('toggle_tiers', 'all'),
-                ('access_rls', 'all')
-            ]
-            for permission, resource in permissions:
-                cursor.execute('''
-                    INSERT OR IGNORE INTO user_permissions (user_id, permission, resource)
-                    VALUES (?, ?, ?)
-                ''', (user_id, permission, resource))
-        
-        conn.commit()
-        conn.close()
+            cursor.executemany(queries.PERMISSION_GRANT, [
+                (user_id, permission, resource) for permission, resource in DEV_ACCOUNT_PERMISSIONS
+            ])
+        
+        event_bus.log(conn, 'user.synced', {
+            'user_id': user_id, 'cognito_user_id': cognito_user_id, 'email': email, 'name': name,
+            'auth_provider': auth_provider, 'action': action, 'is_dev_account': is_dev
+        })
+        
+        cursor.execute(queries.USER_STRIPE_CUSTOMER_BY_EMAIL, (email,))
+        return not cursor.fetchone()['stripe_customer_id']
+    
+    try:
+        # Reads and writes share one IMMEDIATE transaction, so the user can't change in between
+        needs_customer = write_transactions.run(sync)
+        publish_local_changes()
+        
+        if needs_customer:
+            enqueue_customer_provisioning(email)
         return True
+    except WriteBusyError:
+        raise
     except Exception as e:
         print(f"Error syncing Cognito user: {str(e)}")
         return False
@@ -809,6 +1992,8 @@ def sync_user():
         else:
             return jsonify({'error': 'Failed to sync user'}), 500
             
+    except WriteBusyError as e:
+        return write_busy_response(e)
     except Exception as e:
         print(f"Error in sync_user endpoint: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
@@ -828,24 +2013,7 @@ def get_users():
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT id, cognito_user_id, email, name, auth_provider, 
-                   created_at, last_login
-            FROM users
-            ORDER BY created_at DESC
-        ''')
-        
-        users = []
-        for row in cursor.fetchall():
-            users.append({
-                'id': row[0],
-                'cognito_user_id': row[1],
-                'email': row[2],
-                'name': row[3],
-                'auth_provider': row[4],
-                'created_at': row[5],
-                'last_login': row[6]
-            })
+        count, users = query_json_rows(cursor, queries.USERS_LIST, (), queries.USERS_LIST_COLUMNS)
         
         conn.close()
         return jsonify({'users': users}), 200
@@ -856,63 +2024,48 @@ def get_users():
 
 # ===== DEV ACCOUNT & ADMIN FUNCTIONS =====
 
+# Granted to dev accounts by create_dev_account and sync_cognito_user
+DEV_ACCOUNT_PERMISSIONS = [
+    ('admin', 'all'),
+    ('read', 'all'),
+    ('write', 'all'),
+    ('delete', 'all'),
+    ('manage_subscriptions', 'all'),
+    ('manage_users', 'all'),
+    ('toggle_tiers', 'all'),
+    ('access_rls', 'all')
+]
+
 def create_dev_account(email, name, cognito_user_id=None):
     """Create a dev account with admin privileges"""
-    try:
-        conn = get_db_connection()
+    def promote(conn):
         cursor = conn.cursor()
         
         # Check if user already exists
         if cognito_user_id:
-            cursor.execute('SELECT id FROM users WHERE cognito_user_id = ?', (cognito_user_id,))
+            cursor.execute(queries.USER_ID_BY_COGNITO_ID, (cognito_user_id,))
         else:
-            cursor.execute('SELECT id FROM users WHERE email = ?', (email,))
+            cursor.execute(queries.USER_ID_BY_EMAIL, (email,))
         
         existing = cursor.fetchone()
         
         if existing:
             # Update existing user to dev account
-            user_id = existing[0]
-            cursor.execute('''
-                UPDATE users 
-                SET role = 'admin',
-                    is_dev_account = 1,
-                    subscription_tier = 'enterprise',
-                    subscription_override = 1,
-                    updated_at = CURRENT_TIMESTAMP
-                WHERE id = ?
-            ''', (user_id,))
+            user_id = existing['id']
+            cursor.execute(queries.USER_PROMOTE_TO_DEV, (user_id,))
         else:
             # Create new dev account
-            cursor.execute('''
-                INSERT INTO users (
-                    cognito_user_id, email, name, role, is_dev_account, 
-                    subscription_tier, subscription_override
-                )
-                VALUES (?, ?, ?, 'admin', 1, 'enterprise', 1)
-            ''', (cognito_user_id or f'dev_{email}', email, name))
+            cursor.execute(queries.USER_INSERT_DEV, (cognito_user_id or f'dev_{email}', email, name))
             user_id = cursor.lastrowid
         
         # Grant all permissions
-        permissions = [
-            ('admin', 'all'),
-            ('read', 'all'),
-            ('write', 'all'),
-            ('delete', 'all'),
-            ('manage_subscriptions', 'all'),
-            ('manage_users', 'all'),
-            ('toggle_tiers', 'all'),
-            ('access_rls', 'all')
-        ]
-        
-        for permission, resource in permissions:
-            cursor.execute('''
-                INSERT OR IGNORE INTO user_permissions (user_id, permission, resource)
-                VALUES (?, ?, ?)
-            ''', (user_id, permission, resource))
-        
-        conn.commit()
-        conn.close()
+        cursor.executemany(queries.PERMISSION_GRANT, [
+            (user_id, permission, resource) for permission, resource in DEV_ACCOUNT_PERMISSIONS
+        ])
+        return user_id
+    
+    try:
+        user_id = write_transactions.run(promote)
         
         return {
             'success': True,
@@ -966,63 +2119,46 @@ def toggle_subscription_tier():
         if tier not in ['free', 'pro', 'business', 'enterprise']:
             return jsonify({'error': 'Invalid tier. Must be: free, pro, business, enterprise'}), 400
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Find user
-        if cognito_user_id:
-            cursor.execute('SELECT id, is_dev_account FROM users WHERE cognito_user_id = ?', (cognito_user_id,))
-        else:
-            cursor.execute('SELECT id, is_dev_account FROM users WHERE email = ?', (email,))
-        
-        user = cursor.fetchone()
+        def toggle(conn):
+            cursor = conn.cursor()
+            
+            # Find user
+            if cognito_user_id:
+                cursor.execute(queries.USER_DEV_FLAG_BY_COGNITO_ID, (cognito_user_id,))
+            else:
+                cursor.execute(queries.USER_DEV_FLAG_BY_EMAIL, (email,))
+            
+            user = cursor.fetchone()
+            
+            if not user:
+                return 'not_found'
+            
+            user_id = user['id']
+            is_dev = user['is_dev_account']
+            
+            # Only allow for dev accounts or if explicitly allowed
+            if not is_dev:
+                return 'not_dev'
+            
+            # Update subscription tier
+            cursor.execute(queries.USER_OVERRIDE_TIER, (tier, user_id))
+            
+            # Also update or create subscription record
+            cursor.execute(queries.SUBSCRIPTION_ID_BY_USER_ID, (user_id,))
+            sub = cursor.fetchone()
+            
+            if sub:
+                cursor.execute(queries.SUBSCRIPTION_OVERRIDE_PLAN, (tier, user_id))
+            else:
+                cursor.execute(queries.SUBSCRIPTION_INSERT_OVERRIDE, (tier, user_id))
+            return 'updated'
         
-        if not user:
-            conn.close()
+        outcome = write_transactions.run(toggle)
+        if outcome == 'not_found':
             return jsonify({'error': 'User not found'}), 404
-        
-        user_id = user[0]
-        is_dev = user[1]
-        
-        # Only allow for dev accounts or if explicitly allowed
-        if not is_dev:
-            conn.close()
+        if outcome == 'not_dev':
             return jsonify({'error': 'Only dev accounts can toggle subscription tiers'}), 403
-        
-        # Update subscription tier
-        cursor.execute('''
-            UPDATE users 
-            SET subscription_tier = ?,
-                subscription_override = 1,
-                updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        ''', (tier, user_id))
-        
-        # Also update or create subscription record
-        cursor.execute('''
-            SELECT id FROM subscriptions WHERE user_id = ?
-        ''', (user_id,))
-        sub = cursor.fetchone()
-        
-        if sub:
-            cursor.execute('''
-                UPDATE subscriptions
-                SET plan_name = ?,
-                    status = 'active',
-                    updated_at = CURRENT_TIMESTAMP
-                WHERE user_id = ?
-            ''', (tier, user_id))
-        else:
-            cursor.execute('''
-                INSERT INTO subscriptions (
-                    user_id, user_email, plan_name, status
-                )
-                SELECT id, email, ?, 'active'
-                FROM users WHERE id = ?
-            ''', (tier, user_id))
-        
-        conn.commit()
-        conn.close()
+        publish_local_changes()
         
         return jsonify({
             'success': True,
@@ -1030,130 +2166,871 @@ def toggle_subscription_tier():
             'tier': tier
         }), 200
         
+    except WriteBusyError as e:
+        return write_busy_response(e)
     except Exception as e:
         print(f"Error toggling subscription: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
+# Upper bound for ?ids= / ?emails= batch lookups
+MAX_PROFILE_BATCH = 100
+
+def load_user_profiles(cursor, column, values):
+    """Load profiles for many users in one query; returns {lookup value: profile}"""
+    if column not in ('cognito_user_id', 'email'):
+        raise ValueError(f'Unsupported profile lookup column: {column}')
+    if not values:
+        return {}
+    
+    cursor.execute(queries.USER_PROFILES_BY[column], (json.dumps(list(values)),))
+    profiles = {}
+    for row in cursor.fetchall():
+        # email is not unique; as with the old fetchone(), the lowest id wins
+        if row[column] not in profiles:
+            profiles[row[column]] = queries.user_profile(row)
+    return profiles
+
+def load_user_profile(column, value):
+    """One profile for the profile cache; returns (profile or None, cache tags)"""
+    conn = get_db_connection(readonly=False)
+    profile = load_user_profiles(conn.cursor(), column, [value]).get(value)
+    conn.close()
+    if profile:
+        return profile, (profile['email'],)
+    return None, (value,) if column == 'email' else None
+
 @app.route('/api/admin/user-info', methods=['GET'])
 def get_user_info():
-    """Get user information including roles and permissions"""
+    """
+    Get user information including roles and permissions
+    Single user: ?cognito_user_id= or ?email= (add &include_archived=1 for archived subscriptions)
+    Batch (dashboards): ?ids=a,b,c (cognito user ids) or ?emails=a,b,c
+    """
     try:
         email = request.args.get('email', '').strip().lower()
         cognito_user_id = request.args.get('cognito_user_id')
+        ids = request.args.get('ids')
+        emails = request.args.get('emails')
+        
+        if ids or emails:
+            column = 'cognito_user_id' if ids else 'email'
+            values = [value.strip() for value in (ids or emails).split(',') if value.strip()]
+            if column == 'email':
+                values = [value.lower() for value in values]
+            values = list(dict.fromkeys(values))
+            
+            if len(values) > MAX_PROFILE_BATCH:
+                return jsonify({'error': f'At most {MAX_PROFILE_BATCH} users per request'}), 400
+            
+            conn = get_db_connection()
+            profiles = load_user_profiles(conn.cursor(), column, values)
+            conn.close()
+            
+            return jsonify({
+                'success': True,
+                'users': [profiles[value] for value in values if value in profiles],
+                'missing': [value for value in values if value not in profiles]
+            }), 200
         
         if not email and not cognito_user_id:
             return jsonify({'error': 'Email or cognito_user_id is required'}), 400
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get user info
-        if cognito_user_id:
-            cursor.execute('''
-                SELECT id, cognito_user_id, email, name, role, is_dev_account, 
-                       subscription_tier, subscription_override, created_at, last_login
-                FROM users WHERE cognito_user_id = ?
-            ''', (cognito_user_id,))
-        else:
-            cursor.execute('''
-                SELECT id, cognito_user_id, email, name, role, is_dev_account, 
-                       subscription_tier, subscription_override, created_at, last_login
-                FROM users WHERE email = ?
-            ''', (email,))
+        column, value = ('cognito_user_id', cognito_user_id) if cognito_user_id else ('email', email)
         
-        user = cursor.fetchone()
-        
-        if not user:
-            conn.close()
-            return jsonify({'error': 'User not found'}), 404
+        if request.args.get('include_archived') not in ('1', 'true'):
+            profile = cached(user_profile_cache, (column, value), lambda: load_user_profile(column, value))
+            if not profile:
+                return jsonify({'error': 'User not found'}), 404
+            return jsonify({
+                'success': True,
+                'user': profile
+            }), 200
         
-        # Get permissions
-        cursor.execute('''
-            SELECT permission, resource FROM user_permissions
-            WHERE user_id = ?
-        ''', (user[0],))
-        
-        permissions = [{'permission': row[0], 'resource': row[1]} for row in cursor.fetchall()]
-        
-        # Get subscription info
-        cursor.execute('''
-            SELECT plan_name, status, current_period_start, current_period_end
-            FROM subscriptions WHERE user_id = ?
-            ORDER BY created_at DESC LIMIT 1
-        ''', (user[0],))
-        
-        sub = cursor.fetchone()
-        subscription = None
-        if sub:
-            subscription = {
-                'plan': sub[0],
-                'status': sub[1],
-                'current_period_start': sub[2],
-                'current_period_end': sub[3]
-            }
+        conn = get_db_connection()
+        profile = load_user_profiles(conn.cursor(), column, [value]).get(value)
         
+        if profile:
+            if not attach_archive(conn):
+                conn.close()
+                return jsonify({'error': 'Archive is not available'}), 503
+            rows = conn.execute(queries.ARCHIVED_SUBSCRIPTIONS_BY_USER_ID, (profile['id'],)).fetchall()
+            profile['archived_subscriptions'] = queries.ARCHIVED_SUBSCRIPTION.many(rows)
         conn.close()
         
+        if not profile:
+            return jsonify({'error': 'User not found'}), 404
+        
         return jsonify({
             'success': True,
-            'user': {
-                'id': user[0],
-                'cognito_user_id': user[1],
-                'email': user[2],
-                'name': user[3],
-                'role': user[4],
-                'is_dev_account': bool(user[5]),
-                'subscription_tier': user[6],
-                'subscription_override': bool(user[7]),
-                'created_at': user[8],
-                'last_login': user[9],
-                'permissions': permissions,
-                'subscription': subscription
-            }
+            'user': profile
         }), 200
         
     except Exception as e:
         print(f"Error getting user info: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
-def check_user_permission(user_id, permission, resource='all'):
-    """Check if user has a specific permission (RLS helper)"""
+@app.route('/api/admin/search', methods=['GET'])
+@require_admin_token
+def admin_search():
+    """Ranked prefix search over users and waitlist entries (by name, email or product)"""
     try:
+        text = request.args.get('q', '')
+        if len(text) > SEARCH_MAX_QUERY_LENGTH:
+            return jsonify({'error': f'Search query (q) is limited to {SEARCH_MAX_QUERY_LENGTH} characters'}), 400
+        query = build_fts_query(text, SEARCH_MAX_TERMS)
+        if query is None:
+            return jsonify({'error': f'Search query (q) is limited to {SEARCH_MAX_TERMS} terms'}), 400
+        scope = request.args.get('scope', 'all')
+        
+        if not query:
+            return jsonify({'error': 'Search query (q) is required'}), 400
+        
+        if scope not in ['all', 'users', 'waitlist']:
+            return jsonify({'error': 'Invalid scope. Must be: all, users, waitlist'}), 400
+        
+        try:
+            limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+            offset = max(int(request.args.get('offset', 0)), 0)
+        except ValueError:
+            return jsonify({'error': 'limit and offset must be integers'}), 400
+        
         conn = get_db_connection()
         cursor = conn.cursor()
+        result = {'success': True, 'query': query, 'limit': limit, 'offset': offset}
         
-        # Check if user is admin/dev account
-        cursor.execute('SELECT role, is_dev_account FROM users WHERE id = ?', (user_id,))
-        user = cursor.fetchone()
-        
-        if user and (user[0] == 'admin' or user[1] == 1):
-            conn.close()
-            return True  # Dev accounts have all permissions
+        # Fetch one extra row to report has_more without counting every match
+        if scope in ['all', 'users']:
+            cursor.execute(queries.USER_SEARCH, (query, limit + 1, offset))
+            rows = cursor.fetchall()
+            result['users'] = queries.USER_SEARCH_HIT.many(rows[:limit])
+            result['users_has_more'] = len(rows) > limit
         
-        # Check specific permission
-        cursor.execute('''
-            SELECT id FROM user_permissions
-            WHERE user_id = ? AND permission = ? 
-            AND (resource = ? OR resource = 'all')
-        ''', (user_id, permission, resource))
+        if scope in ['all', 'waitlist']:
+            cursor.execute(queries.WAITLIST_SEARCH, (query, limit + 1, offset))
+            rows = cursor.fetchall()
+            result['waitlist'] = queries.WAITLIST_SEARCH_HIT.many(rows[:limit])
+            result['waitlist_has_more'] = len(rows) > limit
         
-        has_permission = cursor.fetchone() is not None
         conn.close()
+        return jsonify(result), 200
         
-        return has_permission
+    except sqlite3.OperationalError as e:
+        print(f"Search index unavailable: {str(e)}")
+        return jsonify({'error': 'Search is not available'}), 503
+    except Exception as e:
+        print(f"Error searching: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/api/admin/db-lanes', methods=['GET'])
+@require_admin_token
+def get_db_lane_stats():
+    """Read-lane state and writer latency with/without concurrent reads"""
+    return jsonify({
+        'success': True,
+        'read_lane': {
+            'enabled': READ_LANE_ENABLED,
+            'max_staleness_ms': READ_SNAPSHOT_MAX_STALENESS_MS,
+            'active': read_lane.active,
+            'idle': len(read_lane.idle),
+            'reads_in_flight': reads_in_flight
+        },
+        'writer_latency': writer_latency.summary(),
+        'write_transactions': write_transactions.stats()
+    }), 200
+
+@app.route('/api/admin/stripe-gateway', methods=['GET'])
+@require_admin_token
+def get_stripe_gateway_stats():
+    """Circuit breaker state, per-operation outcomes and latency for Stripe calls"""
+    return jsonify({
+        'success': True,
+        'gateway': stripe_gateway.stats(),
+        'customer_provisioning': dict(provision_stats, queued=customer_provision_queue.qsize())
+    }), 200
+
+@app.route('/api/admin/events', methods=['GET'])
+def stream_admin_events():
+    """
+    Server-Sent Events stream of admin events (resumes after Last-Event-ID or ?last_event_id=)
+    Each client here holds a worker thread, so only a few are allowed; dashboards should use
+    the event stream server on EVENT_STREAM_PORT, which serves this path from one thread
+    """
+    global threaded_event_streams
+    if not ADMIN_API_TOKEN:
+        return jsonify({'error': 'Admin token not configured'}), 403
+    if not event_stream_authorized({'x-admin-token': request.headers.get('X-Admin-Token')}, request.args):
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    with threaded_event_streams_lock:
+        if threaded_event_streams >= EVENT_STREAM_MAX_THREADED:
+            return jsonify({
+                'error': 'Too many event streams on this server',
+                'event_stream_port': EVENT_STREAM_PORT or None
+            }), 503, {'Retry-After': '5'}
+        threaded_event_streams += 1
+    
+    try:
+        last_event_id = parse_last_event_id(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+        wake = threading.Event()
+        subscriber, initial = event_bus.subscribe(lambda _: wake.set(), last_event_id)
+    except Exception:
+        with threaded_event_streams_lock:
+            threaded_event_streams -= 1
+        raise
+    
+    def stream():
+        yield initial + subscriber.drain()
+        # A client that overflowed its buffer is cut off and resumes from event_log on reconnect
+        while not subscriber.overflowed:
+            if not wake.wait(EVENT_STREAM_HEARTBEAT):
+                yield b': ping\n\n'
+                continue
+            wake.clear()
+            frames = subscriber.drain()
+            if frames:
+                yield frames
+    
+    def close():
+        global threaded_event_streams
+        event_bus.unsubscribe(subscriber)
+        with threaded_event_streams_lock:
+            threaded_event_streams -= 1
+    
+    response = Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    response.call_on_close(close)
+    return response
+
+@app.route('/api/admin/events/ticket', methods=['POST'])
+@require_admin_token
+def create_event_stream_ticket():
+    """Single-use ticket for connecting an EventSource to /api/admin/events?ticket=..."""
+    return jsonify({
+        'success': True,
+        'ticket': issue_event_stream_ticket(),
+        'expires_in': EVENT_STREAM_TICKET_TTL
+    }), 201
+
+@app.route('/api/admin/waitlist-spool', methods=['GET'])
+@require_admin_token
+def get_waitlist_spool_stats():
+    """Spool depth, fsync batching and drain rate for waitlist submissions queued on disk"""
+    return jsonify({
+        'success': True,
+        'enabled': WAITLIST_SPOOL_ENABLED,
+        'drainer_running': spool_drainer_running,
+        'spool': get_waitlist_spool().stats()
+    }), 200
+
+@app.route('/api/admin/events/stats', methods=['GET'])
+@require_admin_token
+def get_event_stream_stats():
+    """Subscribers, published events and slow-client drops for the admin event stream"""
+    with threaded_event_streams_lock:
+        threaded = threaded_event_streams
+    return jsonify({
+        'success': True,
+        'bus': event_bus.stats(),
+        'server': event_stream_server.stats() if event_stream_server else None,
+        'threaded_streams': threaded
+    }), 200
+
+@app.route('/api/admin/profile', methods=['POST'])
+@require_admin_token
+def start_profile():
+    """
+    Start a sampling session
+    JSON: route (URL rule, e.g. /api/subscription/status; omit for all), fraction (0-1],
+    seconds, interval_ms
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        route = data.get('route')
+        fraction = float(data.get('fraction', 1.0))
+        seconds = float(data.get('seconds', 30))
+        interval_ms = float(data.get('interval_ms', 5))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'fraction, seconds and interval_ms must be numbers'}), 400
+    
+    if route is not None and route not in {rule.rule for rule in app.url_map.iter_rules()}:
+        return jsonify({'error': f'Unknown route: {route}'}), 400
+    if not 0 < fraction <= 1 or not 0 < seconds <= PROFILE_MAX_SECONDS or not 1 <= interval_ms <= 1000:
+        return jsonify({'error': f'Need 0 < fraction <= 1, 0 < seconds <= {PROFILE_MAX_SECONDS:g}, 1 <= interval_ms <= 1000'}), 400
+    
+    try:
+        session = profiler.start(route, fraction, seconds, interval_ms)
+    except ProfilerBusyError as e:
+        # Read once: the running session may finish (and clear) right after the busy check
+        running = profiler.session
+        return jsonify({'error': str(e), 'session': running.summary() if running else None}), 409
+    print(f"[PROFILE] sampling {fraction:.0%} of {route or 'all routes'} for {seconds:g}s every {interval_ms:g}ms")
+    return jsonify({'success': True, 'session': session.summary()}), 202
+
+@app.route('/api/admin/profile', methods=['GET'])
+@require_admin_token
+def get_profile():
+    """
+    Current or last session: JSON summary by default,
+    ?format=collapsed for collapsed stacks, ?format=svg for a flamegraph
+    """
+    session = profiler.last
+    if session is None:
+        return jsonify({'error': 'No profiling session has run'}), 404
+    
+    output = request.args.get('format', 'json')
+    if output == 'collapsed':
+        return app.response_class(session.collapsed(), mimetype='text/plain')
+    if output == 'svg':
+        title = f"{session.route or 'all routes'}: {session.samples} samples from {session.requests_sampled} requests"
+        return app.response_class(render_flamegraph(session.collapsed(), title), mimetype='image/svg+xml')
+    return jsonify({'success': True, 'session': session.summary()}), 200
+
+@app.route('/api/admin/profile', methods=['DELETE'])
+@require_admin_token
+def stop_profile():
+    """Stop the running session early (its results stay available)"""
+    session = profiler.stop()
+    if session is None:
+        return jsonify({'error': 'No profiling session is running'}), 404
+    return jsonify({'success': True, 'session': session.summary()}), 200
+
+@app.route('/api/admin/slow-queries', methods=['GET'])
+@require_admin_token
+def get_slow_queries():
+    """
+    Statements ranked by total time (?order=max_ms|count|slow_ms|slow_count, ?limit=N),
+    with the plan and routes of their slow executions
+    """
+    if query_log is None:
+        return jsonify({'error': 'Query timing is disabled (SLOW_QUERY_MS < 0)'}), 404
+    
+    order = request.args.get('order', 'total_ms')
+    if order not in ('total_ms', 'max_ms', 'count', 'slow_ms', 'slow_count'):
+        return jsonify({'error': 'order must be one of total_ms, max_ms, count, slow_ms, slow_count'}), 400
+    try:
+        limit = min(int(request.args.get('limit', 20)), 200)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    
+    result = {
+        'success': True,
+        'threshold_ms': query_log.threshold_ms,
+        'since': query_log.started_at,
+        'statements': query_log.top(limit, order),
+        'recent_slow': list(query_log.recent)[-limit:]
+    }
+    return jsonify(result), 200
+
+@app.route('/api/admin/slow-queries', methods=['DELETE'])
+@require_admin_token
+def reset_slow_queries():
+    """Clear the statement counters and recent slow executions"""
+    if query_log is None:
+        return jsonify({'error': 'Query timing is disabled (SLOW_QUERY_MS < 0)'}), 404
+    query_log.reset()
+    return jsonify({'success': True, 'since': query_log.started_at}), 200
+
+@app.route('/api/admin/cache', methods=['GET'])
+@require_admin_token
+def get_cache_stats():
+    """Change feed position and per-cache hit/invalidation counters for this worker"""
+    return jsonify({'success': True, **change_feed.stats()}), 200
+
+@app.route('/api/admin/archive', methods=['POST'])
+@require_admin_token
+def run_archive():
+    """Run the hot/cold archival job now"""
+    try:
+        return jsonify({'success': True, **archive_old_rows()}), 200
+    except Exception as e:
+        print(f"Error archiving rows: {str(e)}")
+        return jsonify({'error': 'Archival failed'}), 500
+
+@app.route('/api/admin/backups', methods=['GET'])
+@require_admin_token
+def get_backups():
+    """Recent snapshot reports (duration, size, write-latency impact) and retained files"""
+    return jsonify({
+        'success': True,
+        'interval_seconds': BACKUP_INTERVAL,
+        'retention': BACKUP_RETENTION,
+        'recent': list(backup_history),
+        'snapshots': [path.name for path in list_snapshots(BACKUP_DIR)]
+    }), 200
+
+@app.route('/api/admin/backups', methods=['POST'])
+@require_admin_token
+def create_backup():
+    """Take a snapshot now"""
+    try:
+        return jsonify({'success': True, 'backup': run_backup()}), 201
+    except Exception as e:
+        print(f"Error backing up database: {str(e)}")
+        return jsonify({'error': 'Backup failed'}), 500
+
+@app.route('/api/admin/startup', methods=['GET'])
+@require_admin_token
+def get_startup_report():
+    """Import, initialization and time-to-first-request for this worker"""
+    return jsonify({'success': True, 'startup': STARTUP_TIMINGS}), 200
+
+def check_user_permission(user_id, permission, resource='all'):
+    """Check if user has a specific permission (RLS helper)"""
+    try:
+        return cached(
+            permission_cache, (user_id, permission, resource),
+            lambda: load_user_permission(user_id, permission, resource)
+        )
     except Exception as e:
         print(f"Error checking permission: {str(e)}")
         return False
 
-if __name__ == '__main__':
-    # Initialize database
-    init_db()
+def load_user_permission(user_id, permission, resource):
+    """Uncached permission check; returns (allowed, cache tags)"""
+    conn = get_db_connection(readonly=False)
+    cursor = conn.cursor()
+    
+    # Check if user is admin/dev account
+    cursor.execute(queries.USER_ROLE_BY_ID, (user_id,))
+    user = cursor.fetchone()
+    
+    if not user:
+        conn.close()
+        return False, None
+    
+    if user['role'] == 'admin' or user['is_dev_account'] == 1:
+        conn.close()
+        return True, (user['email'],)  # Dev accounts have all permissions
+    
+    # Check specific permission
+    cursor.execute(queries.PERMISSION_CHECK, (user_id, permission, resource))
+    
+    has_permission = cursor.fetchone() is not None
+    conn.close()
+    
+    return has_permission, (user['email'],)
+
+# ===== BACKGROUND JOBS =====
+
+def _expire_due_subscriptions(due_sql, cutoff, new_status, batch_size):
+    """Transition due subscriptions, one write transaction per batch; returns number of rows moved"""
+    def transition(conn):
+        ids = [row[0] for row in conn.execute(due_sql, (cutoff, batch_size)).fetchall()]
+        # The subscriptions_current_update trigger drops users.subscription_tier back to
+        # 'free' (unless an admin override is in place) as the status changes
+        conn.executemany(queries.SUBSCRIPTION_SET_STATUS, [(new_status, subscription_id) for subscription_id in ids])
+        return len(ids)
+    
+    moved = 0
+    while True:
+        count = write_transactions.run(transition)
+        moved += count
+        if count:
+            publish_local_changes()
+        if count < batch_size:
+            return moved
+
+def sweep_expired_subscriptions(batch_size=None, now=None):
+    """Apply period-end transitions that Stripe webhooks haven't delivered"""
+    batch_size = batch_size or SUBSCRIPTION_SWEEP_BATCH_SIZE
+    now = now or datetime.now()
+    # Scheduled cancellations take effect exactly at period end
+    canceled = _expire_due_subscriptions(queries.SUBSCRIPTIONS_DUE_TO_CANCEL, now.isoformat(), 'canceled', batch_size)
+    # Renewals that never arrived within the grace window
+    lapsed = _expire_due_subscriptions(
+        queries.SUBSCRIPTIONS_DUE_TO_LAPSE, (now - timedelta(seconds=SUBSCRIPTION_RENEWAL_GRACE)).isoformat(),
+        'past_due', batch_size
+    )
+    return {'canceled': canceled, 'past_due': lapsed}
+
+def start_subscription_sweeper(interval=None):
+    """Run sweep_expired_subscriptions on a daemon thread every `interval` seconds"""
+    interval = SUBSCRIPTION_SWEEP_INTERVAL if interval is None else interval
+    if interval <= 0:
+        return None
+    
+    def run():
+        while True:
+            try:
+                started = time.perf_counter()
+                result = sweep_expired_subscriptions()
+                if result['canceled'] or result['past_due']:
+                    print(f"[SWEEPER] {result['canceled']} canceled, {result['past_due']} past_due "
+                          f"in {(time.perf_counter() - started) * 1000:.1f}ms")
+            except Exception as e:
+                print(f"Error sweeping subscriptions: {str(e)}")
+            time.sleep(interval)
     
+    thread = threading.Thread(target=run, name='subscription-sweeper', daemon=True)
+    thread.start()
+    return thread
+
+def format_startup_report():
+    """One-line summary of STARTUP_TIMINGS"""
+    t = STARTUP_TIMINGS
+    return (f"import {t['import_ms']}ms, init {t['init_ms']}ms "
+            f"(init_db {'ran' if t['init_db_ran'] else 'skipped'}), "
+            f"first request at {t['first_request_ms']}ms, "
+            f"stripe {'loaded in ' + str(t['stripe_import_ms']) + 'ms' if t['stripe_import_ms'] is not None else 'not loaded'}")
+
+def deferred_startup(default_dev_email):
+    """Work that doesn't need to finish before the server accepts requests"""
     # Create default dev account if it doesn't exist
-    # You can customize this email
-    default_dev_email = 'dev@n8tive.io'
     print(f"Creating default dev account: {default_dev_email}")
     create_dev_account(default_dev_email, 'Dev Account')
+
+STARTUP_TIMINGS['import_ms'] = round((time.perf_counter() - IMPORT_STARTED) * 1000, 1)
+
+def _archive_batches(conn, table, columns, candidates_sql, cutoff, batch_size):
+    """Move rows chosen by candidates_sql to archive.<table> in batched transactions"""
+    column_list = ', '.join(columns)
+    moved = 0
+    last_key = ('', 0)
+    while True:
+        # Keyset pagination on (timestamp, id): rows we skip are never re-read
+        rows = conn.execute(candidates_sql, (cutoff, *last_key, batch_size)).fetchall()
+        if not rows:
+            return moved
+        ids = json.dumps([row[1] for row in rows])
+        last_key = (rows[-1][0], rows[-1][1])
+        
+        # SQLite can't commit across an ATTACHed database atomically in WAL mode, so each
+        # step is its own single-database transaction and a crash between them loses nothing:
+        # 1. copy into the archive (a rerun simply replaces the copy)
+        conn.execute('BEGIN')
+        try:
+            conn.execute(f'''
+                INSERT OR REPLACE INTO archive.{table} ({column_list})
+                SELECT {column_list} FROM main.{table}
+                WHERE id IN (SELECT value FROM json_each(?))
+            ''', (ids,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        
+        # 2. delete hot rows whose archived copy is committed and still identical
+        #    (a row updated in between stays hot and is picked up again next run)
+        #    (marked in archive_moves, so triggers can tell a move from a real delete)
+        same_copy = ' AND '.join(f'a.{column} IS main.{table}.{column}' for column in columns)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('INSERT INTO main.archive_moves (table_name) VALUES (?)', (table,))
+            deleted = conn.execute(f'''
+                DELETE FROM main.{table}
+                WHERE id IN (SELECT value FROM json_each(?))
+                  AND EXISTS (SELECT 1 FROM archive.{table} a WHERE a.id = main.{table}.id AND {same_copy})
+            ''', (ids,)).rowcount
+            conn.execute('DELETE FROM main.archive_moves WHERE table_name = ?', (table,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        
+        # 3. drop archive copies of rows that stayed hot, so nothing is listed twice
+        conn.execute('BEGIN')
+        try:
+            conn.execute(f'''
+                DELETE FROM archive.{table}
+                WHERE id IN (SELECT value FROM json_each(?))
+                  AND id IN (SELECT id FROM main.{table} WHERE id IN (SELECT value FROM json_each(?)))
+            ''', (ids, ids))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        moved += deleted
+        if len(rows) < batch_size:
+            return moved
+
+def archive_old_rows(batch_size=None):
+    """Move aged waitlist entries and long-canceled subscriptions into the archive database"""
+    batch_size = batch_size or ARCHIVE_BATCH_SIZE
+    init_archive_db()
+    conn = sqlite3.connect(DB_PATH, isolation_level=None)
+    try:
+        attach_archive(conn)
+        waitlist = _archive_batches(
+            conn, 'waitlist',
+            ('id', 'user_id', 'name', 'email', 'product', 'created_at'),
+            '''
+                SELECT created_at, id FROM main.waitlist
+                WHERE created_at < ? AND (created_at, id) > (?, ?)
+                ORDER BY created_at, id
+                LIMIT ?
+            ''',
+            (datetime.utcnow() - timedelta(days=WAITLIST_ARCHIVE_AFTER_DAYS)).strftime('%Y-%m-%d %H:%M:%S'),
+            batch_size
+        )
+        subscriptions = _archive_batches(
+            conn, 'subscriptions',
+            ('id', 'user_id', 'user_email', 'stripe_customer_id', 'stripe_subscription_id',
+             'stripe_price_id', 'plan_name', 'status', 'current_period_start', 'current_period_end',
+             'cancel_at_period_end', 'created_at', 'updated_at'),
+            '''
+                SELECT s.updated_at, s.id FROM main.subscriptions s
+                WHERE s.status = 'canceled' AND s.updated_at < ? AND (s.updated_at, s.id) > (?, ?)
+                  AND NOT EXISTS (SELECT 1 FROM main.users u WHERE u.current_subscription_id = s.id)
+                ORDER BY s.updated_at, s.id
+                LIMIT ?
+            ''',
+            (datetime.utcnow() - timedelta(days=SUBSCRIPTION_ARCHIVE_AFTER_DAYS)).strftime('%Y-%m-%d %H:%M:%S'),
+            batch_size
+        )
+        hot = {table: conn.execute(f'SELECT COUNT(*) FROM main.{table}').fetchone()[0]
+               for table in ('waitlist', 'subscriptions')}
+    finally:
+        conn.close()
+    return {'archived': {'waitlist': waitlist, 'subscriptions': subscriptions}, 'hot_rows': hot}
+
+def start_archiver(interval=None):
+    """Run archive_old_rows on a daemon thread every `interval` seconds"""
+    interval = ARCHIVE_INTERVAL if interval is None else interval
+    if interval <= 0:
+        return None
+    
+    def run():
+        while True:
+            try:
+                started = time.perf_counter()
+                result = archive_old_rows()
+                archived = result['archived']
+                if archived['waitlist'] or archived['subscriptions']:
+                    print(f"[ARCHIVE] moved {archived['waitlist']} waitlist, {archived['subscriptions']} subscriptions "
+                          f"in {time.perf_counter() - started:.2f}s; hot rows now {result['hot_rows']}")
+            except Exception as e:
+                print(f"Error archiving rows: {str(e)}")
+            time.sleep(interval)
+    
+    thread = threading.Thread(target=run, name='archiver', daemon=True)
+    thread.start()
+    return thread
+
+# Emails waiting for a Stripe customer; the pending set drops repeat logins while queued
+customer_provision_queue = queue.Queue(maxsize=10000)
+customer_provision_pending = set()
+customer_provision_lock = threading.Lock()
+customer_provisioner_running = False
+provision_stats = {
+    'enqueued': 0, 'created': 0, 'reused': 0, 'failed': 0, 'dropped': 0,
+    'checkout_preprovisioned': 0, 'checkout_fallback': 0
+}
+
+def lookup_stripe_customer_id(email):
+    """Stripe customer id stored for this email, or None"""
+    conn = get_db_connection(readonly=False)
+    row = conn.execute(queries.USER_STRIPE_CUSTOMER_BY_EMAIL, (email,)).fetchone()
+    conn.close()
+    return row['stripe_customer_id'] if row else None
+
+def store_stripe_customer_id(email, customer_id):
+    write_transactions.run(lambda conn: conn.execute(queries.USER_SET_STRIPE_CUSTOMER, (customer_id, email)))
+
+def forget_stripe_customer_id(email, customer_id):
+    write_transactions.run(lambda conn: conn.execute(queries.USER_CLEAR_STRIPE_CUSTOMER, (email, customer_id)))
+
+def is_missing_customer_error(error):
+    """True for Stripe's 'No such customer' (resource_missing on the customer param)"""
+    return getattr(error, 'code', None) == 'resource_missing' and getattr(error, 'param', None) == 'customer'
+
+def find_or_create_stripe_customer(email, counter=None):
+    """Reuse the Stripe customer for email or create one; stores and returns its id"""
+    customers = stripe_gateway.customer_list(email=email, limit=1)
+    if customers.data:
+        customer_id = customers.data[0].id
+        outcome = 'reused'
+    else:
+        customer_id = stripe_gateway.customer_create(email=email).id
+        outcome = 'created'
+    if counter is not None:
+        counter[outcome] += 1
+    store_stripe_customer_id(email, customer_id)
+    # A concurrent provisioner may have stored a different customer first; converge on that one
+    return lookup_stripe_customer_id(email) or customer_id
+
+def enqueue_customer_provisioning(email):
+    """Queue email for background customer creation (no-op unless the provisioner runs)"""
+    if not customer_provisioner_running:
+        return False
+    with customer_provision_lock:
+        if email in customer_provision_pending:
+            return False
+        customer_provision_pending.add(email)
+    try:
+        customer_provision_queue.put_nowait(email)
+    except queue.Full:
+        # Checkout still falls back to creating the customer inline
+        with customer_provision_lock:
+            customer_provision_pending.discard(email)
+        provision_stats['dropped'] += 1
+        return False
+    provision_stats['enqueued'] += 1
+    return True
+
+def start_customer_provisioner(backfill=None):
+    """Create queued Stripe customers on a daemon thread; returns None when disabled"""
+    global customer_provisioner_running
+    backfill = STRIPE_PREPROVISION_BACKFILL if backfill is None else backfill
+    if not STRIPE_PREPROVISION_CUSTOMERS or not (os.environ.get('STRIPE_SECRET_KEY') or os.environ.get('STRIPE_API_BASE')):
+        return None
+    customer_provisioner_running = True
+    
+    def run():
+        while True:
+            email = customer_provision_queue.get()
+            try:
+                if not lookup_stripe_customer_id(email):
+                    find_or_create_stripe_customer(email, provision_stats)
+            except Exception as e:
+                provision_stats['failed'] += 1
+                print(f"Error provisioning Stripe customer for {email}: {str(e)}")
+            finally:
+                with customer_provision_lock:
+                    customer_provision_pending.discard(email)
+    
+    thread = threading.Thread(target=run, name='customer-provisioner', daemon=True)
+    thread.start()
+    
+    if backfill > 0:
+        conn = get_db_connection(readonly=False)
+        rows = conn.execute(queries.USERS_WITHOUT_STRIPE_CUSTOMER, (backfill,)).fetchall()
+        conn.close()
+        for row in rows:
+            enqueue_customer_provisioning(row['email'])
+    return thread
+
+def start_waitlist_spool_drainer(interval=None):
+    """Replay spooled waitlist submissions on a daemon thread; returns None when disabled"""
+    global spool_drainer_running
+    interval = WAITLIST_SPOOL_DRAIN_INTERVAL if interval is None else interval
+    if not WAITLIST_SPOOL_ENABLED:
+        return None
+    if interval <= 0:
+        print("[SPOOL] No drainer (WAITLIST_SPOOL_DRAIN_INTERVAL <= 0): waitlist submissions won't be spooled")
+        return None
+    spool = get_waitlist_spool()
+    if spool.has_pending():
+        print(f"[SPOOL] {spool.pending_records()[0]} waitlist submissions pending from a previous run")
+    spool_drainer_running = True
+    
+    def run():
+        while True:
+            # Woken by new spooled submissions; otherwise retries on the interval
+            spool_drainer_wake.wait(interval)
+            spool_drainer_wake.clear()
+            try:
+                inserted = drain_waitlist_spool()
+                if inserted:
+                    print(f"[SPOOL] Drained {inserted} waitlist submissions")
+            except Exception as e:
+                print(f"Waitlist spool drain deferred: {str(e)}")
+                time.sleep(interval)
+    
+    thread = threading.Thread(target=run, name='waitlist-spool-drainer', daemon=True)
+    thread.start()
+    return thread
+
+# Write latencies (ms) observed while a snapshot is being taken; None when idle
+backup_write_samples = None
+backup_history = deque(maxlen=20)
+backup_lock = threading.Lock()
+
+def latency_summary(samples):
+    """count/p50/p95/max for a list of millisecond samples"""
+    if not samples:
+        return {'count': 0}
+    values = sorted(samples)
+    return {
+        'count': len(values),
+        'p50_ms': round(values[len(values) // 2], 3),
+        'p95_ms': round(values[min(len(values) - 1, int(0.95 * len(values)))], 3),
+        'max_ms': round(values[-1], 3)
+    }
+
+def run_backup():
+    """Take, verify and prune one snapshot; returns its report (also kept in backup_history)"""
+    global backup_write_samples
+    with backup_lock:
+        backup_write_samples = []
+        try:
+            report = backup_database(DB_PATH, BACKUP_DIR, pages=BACKUP_STEP_PAGES,
+                                     sleep_ms=BACKUP_STEP_SLEEP_MS, compress=BACKUP_COMPRESS)
+        finally:
+            samples, backup_write_samples = backup_write_samples, None
+        report['pruned'] = prune_snapshots(BACKUP_DIR, BACKUP_RETENTION)
+        report['finished_at'] = datetime.now().isoformat()
+        # Impact on live writers: latency of writes that overlapped the copy
+        report['write_latency_during_backup'] = latency_summary(samples)
+        backup_history.appendleft(report)
+        return report
+
+def start_backup_scheduler(interval=None):
+    """Snapshot the database on a daemon thread every `interval` seconds"""
+    interval = BACKUP_INTERVAL if interval is None else interval
+    if interval <= 0:
+        return None
+    
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                report = run_backup()
+                during = report['write_latency_during_backup']
+                print(f"[BACKUP] {report['path']} in {report['total_seconds']}s "
+                      f"({report['steps']} steps, {during['count']} writes during, "
+                      f"p95 {during.get('p95_ms', '-')}ms)")
+            except Exception as e:
+                print(f"Error backing up database: {str(e)}")
+    
+    thread = threading.Thread(target=run, name='backup-scheduler', daemon=True)
+    thread.start()
+    return thread
+
+def start_event_stream(port=None):
+    """Serve GET /api/admin/events on `port` from a single selector thread"""
+    global event_stream_server
+    port = EVENT_STREAM_PORT if port is None else port
+    if port <= 0:
+        return None
+    
+    event_stream_server = EventStreamServer(
+        event_bus,
+        host=EVENT_STREAM_HOST,
+        port=port,
+        authorize=event_stream_authorized,
+        heartbeat=EVENT_STREAM_HEARTBEAT,
+        max_clients=EVENT_STREAM_MAX_CLIENTS,
+        allow_origin=ADMIN_EVENTS_ORIGIN or None
+    )
+    try:
+        return event_stream_server.start()
+    except OSError as e:
+        print(f"Event stream server not started on port {port}: {str(e)}")
+        event_stream_server = None
+        return None
+
+if __name__ == '__main__':
+    init_started = time.perf_counter()
+    
+    # Initialize database (skipped when the schema is already current)
+    STARTUP_TIMINGS['init_db_ran'] = ensure_db()
+    change_feed.start()
+    
+    # You can customize this email
+    default_dev_email = 'dev@n8tive.io'
+    threading.Thread(target=deferred_startup, args=(default_dev_email,), name='deferred-startup', daemon=True).start()
+    
+    start_subscription_sweeper()
+    start_backup_scheduler()
+    start_archiver()
+    start_customer_provisioner()
+    start_event_stream()
+    start_waitlist_spool_drainer()
+    
+    STARTUP_TIMINGS['init_ms'] = round((time.perf_counter() - init_started) * 1000, 1)
+    print(f"[STARTUP] import {STARTUP_TIMINGS['import_ms']}ms, init {STARTUP_TIMINGS['init_ms']}ms")
     
     # Run Flask app
     app.run(host='0.0.0.0', port=5000, debug=False)
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Waitlist Spool
+Append-only file that keeps validated waitlist submissions safe while the
+database can't take writes (lock held too long, migration running, disk full).
+
+Each record is one line, "<crc32 hex> <json>\\n", appended with a single write
+to an O_APPEND descriptor. append() returns only once the record is fsynced, and
+concurrent appenders share one fsync: the first becomes the leader, waits a few
+ms for others to join, then syncs everyone's records at once.
+
+The drainer reads batches from a checkpointed offset (a sidecar .offset file,
+replaced atomically) and commits them; inserts must be idempotent because a
+crash between the database commit and the checkpoint replays that batch. Once
+everything is drained the file is truncated. On open, a torn final record (a
+crash mid-write) is cut off and records failing their checksum are skipped.
+
+Several processes can share one spool file. Appends hold a shared flock for the
+write, truncation and torn-tail recovery hold it exclusively and re-check the
+file size, and only one process drains at a time (an exclusive flock on a
+sidecar .lock file), reloading the checkpoint when it starts.
+"""
+
+from collections import deque
+from contextlib import contextmanager
+import fcntl
+import json
+import os
+import threading
+import time
+import zlib
+
+
+class SpoolFullError(Exception):
+    """The spool reached its size limit"""
+
+
+def encode_record(record):
+    data = json.dumps(record, separators=(',', ':'), sort_keys=True).encode('utf-8')
+    return b'%08x %s\n' % (zlib.crc32(data), data)
+
+
+def decode_record(line):
+    """Record for a complete line, or None when the checksum or JSON is bad"""
+    checksum, _, data = line.rstrip(b'\n').partition(b' ')
+    try:
+        if int(checksum, 16) != zlib.crc32(data):
+            return None
+        return json.loads(data)
+    except ValueError:
+        return None
+
+
+class Spool:
+    """Durable FIFO of JSON records with group-commit fsync and a drain checkpoint"""
+
+    def __init__(self, path, fsync_window_ms=2.0, max_bytes=64 * 1024 * 1024):
+        self.path = path
+        self.offset_path = path + '.offset'
+        self.drain_lock_path = path + '.lock'
+        self.fsync_window_ms = fsync_window_ms
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.synced_cond = threading.Condition(self.lock)
+        self.written = 0       # records written this process (sequence numbers)
+        self.synced = 0        # records known to be on disk
+        self.syncing = False
+        self.counters = {'appended': 0, 'drained': 0, 'fsyncs': 0, 'torn_bytes_discarded': 0, 'corrupt_records': 0}
+        self.drain_log = deque(maxlen=256)  # (monotonic time, records) per drained batch
+        self._recover()
+
+    def _recover(self):
+        """Cut off a torn tail and load the checkpoint"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.fd = os.open(self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o600)
+        # Live appenders hold LOCK_SH across each write, so a partial line seen here is torn
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            with open(self.path, 'rb') as f:
+                content = f.read()
+            valid_end = content.rfind(b'\n') + 1
+            if valid_end < len(content):
+                self.counters['torn_bytes_discarded'] += len(content) - valid_end
+                os.ftruncate(self.fd, valid_end)
+                os.fsync(self.fd)
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        self.offset = self._read_checkpoint(valid_end)
+
+    def _size(self):
+        return os.fstat(self.fd).st_size
+
+    def _read_checkpoint(self, size):
+        try:
+            with open(self.offset_path, 'r') as f:
+                offset = int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+        # Past the end: truncated by a run that predates checkpointing before truncation
+        return offset if offset <= size else 0
+
+    def append(self, record):
+        """Write and fsync one record (blocks until it is durable)"""
+        line = encode_record(record)
+        with self.lock:
+            fcntl.flock(self.fd, fcntl.LOCK_SH)
+            try:
+                if self._size() + len(line) > self.max_bytes:
+                    raise SpoolFullError(f'spool is at its {self.max_bytes} byte limit')
+                os.write(self.fd, line)
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+            self.written += 1
+            self.counters['appended'] += 1
+            sequence = self.written
+            while self.synced < sequence:
+                if self.syncing:
+                    self.synced_cond.wait()
+                    continue
+                self._sync_as_leader()
+
+    def _sync_as_leader(self):
+        """Called with the lock held; releases it around the batch window and fsync"""
+        self.syncing = True
+        self.lock.release()
+        try:
+            time.sleep(self.fsync_window_ms / 1000.0)
+            target = self.written  # everything written so far rides on this fsync
+            os.fsync(self.fd)
+        finally:
+            self.lock.acquire()
+            self.syncing = False
+            self.synced_cond.notify_all()
+        self.synced = max(self.synced, target)
+        self.counters['fsyncs'] += 1
+
+    @contextmanager
+    def draining(self):
+        """
+        Cross-process drain lock; yields False when another process is draining
+        Reloads the checkpoint on entry, since another process may have moved it
+        """
+        fd = os.open(self.drain_lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            with self.lock:
+                self.offset = self._read_checkpoint(self._size())
+            yield True
+        finally:
+            os.close(fd)  # releases the flock
+
+    def read_batch(self, limit=500):
+        """(records, offset just past them) for up to `limit` pending records"""
+        with self.lock:
+            start, end = self.offset, self._size()
+        records = []
+        position = start
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            while position < end and len(records) < limit:
+                line = f.readline()
+                if not line.endswith(b'\n'):
+                    break
+                position += len(line)
+                record = decode_record(line)
+                if record is None:
+                    self.counters['corrupt_records'] += 1
+                    continue
+                records.append(record)
+        return records, position
+
+    def commit(self, offset, records):
+        """Checkpoint after a batch of `records` is stored; truncates the file once it is fully drained"""
+        with self.lock:
+            self.counters['drained'] += records
+            self.drain_log.append((time.monotonic(), records))
+            # Exclusive against every process's appends, so the size can't move under us
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                if offset >= self._size():
+                    # Everything is drained: reset the checkpoint first, so a crash before
+                    # the truncate replays (idempotently) instead of skipping new records
+                    self._write_checkpoint(0)
+                    os.ftruncate(self.fd, 0)
+                    os.fsync(self.fd)
+                    offset = 0
+                else:
+                    self._write_checkpoint(offset)
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+            self.offset = offset
+
+    def _write_checkpoint(self, offset):
+        temp_path = self.offset_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.offset_path)
+
+    def has_pending(self):
+        """Whether any process has spooled records not yet drained (one fstat when empty)"""
+        size = self._size()
+        return size > 0 and size > self._read_checkpoint(size)
+
+    def pending_records(self):
+        size = self._size()
+        offset = self._read_checkpoint(size)
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            return f.read(size - offset).count(b'\n'), size - offset
+
+    def stats(self, window=60.0):
+        now = time.monotonic()
+        pending, pending_bytes = self.pending_records()
+        with self.lock:
+            recent = sum(count for at, count in self.drain_log if now - at <= window)
+            counters = dict(self.counters)
+            return dict(
+                counters,
+                path=self.path,
+                pending=pending,
+                pending_bytes=pending_bytes,
+                records_per_fsync=round(counters['appended'] / counters['fsyncs'], 2) if counters['fsyncs'] else None,
+                drain_rate_per_s=round(recent / window, 2)
+            )
@@ -193,6 +193,18 @@ server {
         proxy_buffering off;
     }
     
+    # Admin event stream (SSE) - single-threaded event server, long-lived unbuffered responses
+    location = /api/admin/events {
+        proxy_pass http://127.0.0.1:5001;
+        proxy_http_version 1.1;
+        proxy_set_header Connection "";
+        proxy_set_header Host \$host;
+        proxy_set_header X-Real-IP \$remote_addr;
+        proxy_buffering off;
+        proxy_cache off;
+        proxy_read_timeout 1h;
+    }
+
     # API proxy for waitlist
     location /api/ {
         proxy_pass http://127.0.0.1:5000/api/;